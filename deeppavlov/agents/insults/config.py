@@ -5,6 +5,9 @@ def add_cmdline_args(parser):
     agent.add_argument('--gpu', type=int, default=-1)
     agent.add_argument('--random_seed', type=int, default=1013)
     agent.add_argument('--model_seed', type=int, default=23)
+    agent.add_argument('--prefetch_depth', type=int, default=0,
+                       help='number of prepared batches to queue while the model trains on '
+                            'the previous one in a background thread, 0 to train synchronously')
 
     # Basics
     agent.add_argument('--embedding_file', type=str, default=None,
@@ -14,6 +17,8 @@ def add_cmdline_args(parser):
     agent.add_argument('--log_file', type=str, default=None)
     agent.add_argument('--model_file', type=str, default=None)
     agent.add_argument('--max_sequence_length', type=int, default=100)
+    agent.add_argument('--dynamic_sequence_length', type='bool', default=False,
+                       help='pad each batch only to its longest comment, cnn_word only: predictions are unchanged')
     agent.add_argument('--embedding_dim', type=int, default=100)
     agent.add_argument('--learning_rate', type=float, default=1e-1)
     agent.add_argument('--learning_decay', type=float, default=0.)
@@ -44,6 +49,26 @@ def add_cmdline_args(parser):
                        help='fasttext trained model file name')
     agent.add_argument('-fed', '--fasttext_embeddings_dict', type=str, default=None,
                        help='saved fasttext embeddings dict')
+    agent.add_argument('--fasttext_embeddings_format', type=str, default='binary',
+                       choices=['binary', 'text'],
+                       help='format to save fasttext embeddings dict in: memory-mapped binary or text')
+    agent.add_argument('--fasttext_mmap', type='bool', default=False,
+                       help='use only the memory-mapped fasttext input matrix and release the fasttext '
+                            'model once the matrix is checked against it, so forked workers share it')
+    agent.add_argument('--fasttext_cache_size', type=int, default=0,
+                       help='max number of computed fasttext embeddings to keep in memory, 0 for no limit')
+    agent.add_argument('--fasttext_cache_bytes', type=int, default=0,
+                       help='max size in bytes of computed fasttext embeddings kept in memory, 0 for no limit')
+    agent.add_argument('--fasttext_flush_every', type=int, default=10000,
+                       help='number of unsaved fasttext embeddings evicted from the cache to keep before '
+                            'appending them to the binary embeddings dict, or dropping them without one')
+    agent.add_argument('--fasttext_cache_policy', type=str, default='lru', choices=['lru', 'lfu'],
+                       help='eviction policy of the fasttext embeddings cache')
+    agent.add_argument('--fasttext_compact_ratio', type=float, default=0.5,
+                       help='merge the log of new tokens into the binary fasttext embeddings dict '
+                            'when the log exceeds this fraction of the dict size')
+    agent.add_argument('--fasttext_dtype', type=str, default='float32', choices=['float32', 'float16', 'int8'],
+                       help='dtype to keep fasttext embeddings in memory with, int8 uses a scale per vector')
 
 
 
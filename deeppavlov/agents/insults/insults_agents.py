@@ -1,9 +1,15 @@
 import copy
+from collections import OrderedDict
+import numpy as np
+import tensorflow as tf
+from concurrent.futures import ThreadPoolExecutor
 from parlai.core.agents import Agent
 from . import config
 from .model import InsultsModel
-from .utils import create_vectorizer_selector, get_vectorizer_selector
+from .utils import create_vectorizer_selector, get_vectorizer_selector, vectorizer_selector_key
 from .embeddings_dict import EmbeddingsDict
+from deeppavlov.utils.embeddings_registry import get_embeddings_dict
+from deeppavlov.utils.batch_pipeline import BatchPipeline
 
 class EnsembleInsultsAgent(Agent):
 
@@ -17,6 +23,9 @@ class EnsembleInsultsAgent(Agent):
                               help='list of all the model names for the ensemble')
         ensemble.add_argument('--model_coefs', type=str, default=None, nargs='+',
                               help='list of all the model coefs for the ensemble')
+        ensemble.add_argument('--ensemble_threads', type=int, default=0,
+                              help='number of threads to run the models of the ensemble in, '
+                                   '0 for one per model, 1 to run them one after another')
 
     def __init__(self, opt, shared=None):
         self.id = 'InsultsAgent'
@@ -36,7 +45,7 @@ class EnsembleInsultsAgent(Agent):
             print('Model file:', model_file)
             if model_name == 'cnn_word' or model_name == 'lstm_word':
                 self.word_dict = None
-                embedding_dict = EmbeddingsDict(opt, opt.get('embedding_dim'))
+                embedding_dict = get_embeddings_dict(EmbeddingsDict, opt, opt.get('embedding_dim'))
                 self.num_ngrams = None
             if model_name == 'log_reg' or model_name == 'svc':
                 self.word_dict = None
@@ -47,10 +56,19 @@ class EnsembleInsultsAgent(Agent):
                 print('Reading vectorizers and selectors')
                 self.models[i].vectorizers, self.models[i].selectors = get_vectorizer_selector(model_file,
                                                                                    self.num_ngrams)
+                self.models[i].vectorizers_key = vectorizer_selector_key(model_file, self.num_ngrams)
         self.model_coefs = [float(coef) for coef in opt.get('model_coefs', [])]
         print('model coefs:', self.model_coefs)
+        self.coefs = np.array(self.model_coefs[:len(self.models)]) / sum(self.model_coefs)
         self.n_examples = 0
 
+        for model in self.models:
+            model.make_predict_function()
+        threads = opt.get('ensemble_threads') or len(self.models)
+        self.executor = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+        # Keras models have to be used in the graph they were built in
+        self.graph = tf.get_default_graph()
+
     def observe(self, observation):
         observation = copy.deepcopy(observation)
         if not self.episode_done:
@@ -94,31 +112,62 @@ class EnsembleInsultsAgent(Agent):
         batch_size = len(observations)
         # initialize a table of replies with this agent's id
         batch_reply = [{'id': self.getID()} for _ in range(batch_size)]
-        predictions = [[] for _ in range(batch_size)]
-        for j, model in enumerate(self.models):
-            examples = [model._build_ex(obs) for obs in observations]
-            valid_inds = [i for i in range(batch_size) if examples[i] is not None]
-            examples = [ex for ex in examples if ex is not None]
+        valid_inds = [i for i in range(batch_size) if 'text' in observations[i]]
+        if len(valid_inds) == 0:
+            return batch_reply
+        questions = [observations[i]['text'] for i in valid_inds]
 
-            batch = model._batchify(examples, self.word_dict)
-            prediction = model.predict(batch)
-            for i in range(len(prediction)):
-                predictions[valid_inds[i]].append(prediction[i])
-
-        for i in range(batch_size):
-            if len(predictions[i]):
-                prediction = self.weighted_sum(predictions[i])
-                batch_reply[i]['text'] = self._predictions2text([prediction])[0]
-                batch_reply[i]['score'] = prediction
+        predictions = self.weighted_sum(self._predict_all(questions))
+        predictions_text = self._predictions2text(predictions)
+        for i in range(len(predictions)):
+            batch_reply[valid_inds[i]]['text'] = predictions_text[i]
+            batch_reply[valid_inds[i]]['score'] = predictions[i]
 
         return batch_reply
 
+    def _predict_all(self, questions):
+        """Predictions of all models, (number of models, number of questions).
+        Each distinct representation of the questions (embeddings, n-gram features)
+        is computed once and passed to all models that take it.
+        """
+        keys = [model.feature_key() for model in self.models]
+        # representations computed from the same embeddings dictionary are computed
+        # in one thread, the dictionary and its cache are not thread-safe
+        sources = OrderedDict()
+        for key, model in zip(keys, self.models):
+            sources.setdefault(key[:2], OrderedDict()).setdefault(key, model)
+
+        if self.executor is None:
+            features = {}
+            for source_models in sources.values():
+                features.update(self._featurize(source_models, questions))
+            return np.stack([model.predict_features(features[key]) for key, model in zip(keys, self.models)])
+
+        features = {source: self.executor.submit(self._in_graph, self._featurize, source_models, questions)
+                    for source, source_models in sources.items()}
+        # featurization is queued first, so a prediction never holds the only
+        # thread while the features it waits for are still in the queue
+        predictions = [self.executor.submit(self._in_graph, lambda model=model, key=key:
+                                            model.predict_features(features[key[:2]].result()[key]))
+                       for key, model in zip(keys, self.models)]
+        return np.stack([prediction.result() for prediction in predictions])
+
+    @staticmethod
+    def _featurize(models, questions):
+        return {key: model.featurize(questions) for key, model in models.items()}
+
+    def _in_graph(self, fn, *args):
+        with self.graph.as_default():
+            return fn(*args)
+
     def weighted_sum(self, predictions):
-        result = 0
-        for j in range(len(predictions)):
-            result += self.model_coefs[j] * predictions[j]
-        result = result / sum(self.model_coefs)
-        return result
+        """Weighted sum of the predictions of the models, one row per model."""
+        return np.dot(self.coefs[:len(predictions)], predictions)
+
+    def shutdown(self):
+        if not self.is_shared and self.executor is not None:
+            self.executor.shutdown()
+        super().shutdown()
 
 class BoostEnsembleInsultsAgent(Agent):
 
@@ -151,7 +200,7 @@ class BoostEnsembleInsultsAgent(Agent):
             print('Model file:', model_file)
             if model_name == 'cnn_word' or model_name == 'lstm_word':
                 self.word_dict = None
-                embedding_dict = EmbeddingsDict(opt, opt.get('embedding_dim'))
+                embedding_dict = get_embeddings_dict(EmbeddingsDict, opt, opt.get('embedding_dim'))
                 self.num_ngrams = None
             if model_name == 'log_reg' or model_name == 'svc':
                 self.word_dict = None
@@ -255,7 +304,7 @@ class InsultsAgent(Agent):
 
         if self.model_name == 'cnn_word' or self.model_name == 'lstm_word':
             self.word_dict = None
-            embedding_dict = EmbeddingsDict(opt, opt.get('embedding_dim'))
+            embedding_dict = get_embeddings_dict(EmbeddingsDict, opt, opt.get('embedding_dim'))
             self.num_ngrams = None
         if self.model_name == 'log_reg' or self.model_name == 'svc':
             self.word_dict = None
@@ -264,6 +313,9 @@ class InsultsAgent(Agent):
 
         print('create model', self.model_name)
         self.model = InsultsModel(self.model_name, self.word_dict, embedding_dict, opt)
+        # ngrams models are fitted on the whole dataset at once, only nn models are trained in the background
+        self.pipeline = BatchPipeline(self.model.update,
+                                      opt.get('prefetch_depth', 0) if self.model.model_type == 'nn' else 0)
         self.n_examples = 0
 
         if (self.model.from_saved == True and self.model.model_type == 'ngrams'):
@@ -299,12 +351,19 @@ class InsultsAgent(Agent):
         if 'labels' in observations[0]:
             self.n_examples += len(examples)
             batch = self.model._batchify(examples)
-            predictions = self.model.update(batch)
+            if self.pipeline.depth:
+                # the model is still training on the previous batches,
+                # so replies are predicted before the update on this batch
+                predictions = self.pipeline.call(self.model.predict, batch[0])
+                self.pipeline.put(batch)
+            else:
+                predictions = self.model.update(batch)
             predictions_text = self._predictions2text(predictions)
             for i in range(len(predictions)):
                 batch_reply[valid_inds[i]]['text'] = predictions_text[i]
                 batch_reply[valid_inds[i]]['score'] = predictions[i]
         else:
+            self.pipeline.join()
             batch = self.model._batchify(examples)
             predictions = self.model.predict(batch)
             predictions_text = self._predictions2text(predictions)
@@ -336,17 +395,28 @@ class InsultsAgent(Agent):
         return y
 
     def report(self):
+        self.pipeline.join()
         report = dict()
         report['updates'] = self.model.updates
         report['n_examples'] = self.n_examples
         report['loss'] = self.model.train_loss
         report['accuracy'] = self.model.train_acc
         report['auc'] = self.model.train_auc
+        if self.model.model_type == 'nn':
+            report.update(self.model.embedding_dict.cache_stats())
+        if self.pipeline.depth:
+            report.update(self.pipeline.stats())
         return report
 
     def save(self):
+        self.pipeline.join()
         self.model.save()
 
+    def shutdown(self):
+        if not self.is_shared:
+            self.pipeline.close()
+        super().shutdown()
+
 
 class OneEpochAgent(InsultsAgent):
 
@@ -31,6 +31,9 @@ import pickle
 from .utils import vectorize_select_from_data
 
 from .embeddings_dict import EmbeddingsDict
+from deeppavlov.utils.embeddings_registry import get_embeddings_dict
+from deeppavlov.utils.dtypes import FLOAT_DTYPE, check_model_feed
+from deeppavlov.utils.buffer_pool import BufferPool
 
 SEED = 23
 np.random.seed(SEED)
@@ -50,15 +53,21 @@ class InsultsModel(object):
         np.random.seed(opt['model_seed'])
         tf.set_random_seed(opt['model_seed'])
 
+        if self.opt.get('dynamic_sequence_length') and self.model_name == 'lstm_word':
+            # the LSTM reads the left pads, so its predictions depend on their number
+            raise RuntimeError('dynamic_sequence_length would change the predictions of lstm_word')
+
         if self.model_name == 'cnn_word' or self.model_name == 'lstm_word':
             self.model_type = 'nn'
-            self.embedding_dict = embedding_dict if embedding_dict is not None else EmbeddingsDict(opt, self.opt['embedding_dim'])
+            self.embedding_dict = embedding_dict if embedding_dict is not None else get_embeddings_dict(EmbeddingsDict, opt, self.opt['embedding_dim'])
 
         if self.model_name == 'log_reg' or self.model_name == 'svc':
             self.model_type = 'ngrams'
             self.num_ngrams = None
             self.vectorizers = None
             self.selectors = None
+            # identifies the vectorizers and selectors, models with equal keys share n-gram features
+            self.vectorizers_key = None
 
         if self.opt.get('model_file') and \
                 ( (os.path.isfile(opt['model_file'] + '.h5') and self.model_type == 'nn')
@@ -91,6 +100,8 @@ class InsultsModel(object):
         self.train_loss = 0.0
         self.train_acc = 0.0
         self.train_auc = 0.0
+        # batches queued for training in the background are still alive
+        self.buffers = BufferPool(self.opt.get('prefetch_depth', 0) + 2)
         self.val_loss = 0.0
         self.val_acc = 0.0
         self.val_auc = 0.0
@@ -182,7 +193,7 @@ class InsultsModel(object):
             embedding_batch = self.create_batch(question)
 
             if len(batch[0]) == 2:
-                y = [1 if ex['labels'][0] == 'Insult' else 0 for ex in batch]
+                y = np.array([1 if ex['labels'][0] == 'Insult' else 0 for ex in batch], dtype=FLOAT_DTYPE)
                 return embedding_batch, y
             else:
                 return embedding_batch
@@ -198,31 +209,59 @@ class InsultsModel(object):
             else:
                 return question
 
+    def sequence_length(self, lengths):
+        """Length to pad a batch of sentences with the given numbers of tokens to."""
+        max_len = self.opt['max_sequence_length']
+        if not self.opt.get('dynamic_sequence_length'):
+            return max_len
+        margin = 0
+        if self.model_name == 'cnn_word':
+            # one pad position beyond the reach of the widest kernel gives the
+            # max pooling the same candidates as padding to max_sequence_length
+            margin = max(self.kernel_sizes) // 2 + 1
+        return min(max_len, max(lengths + [1]) + margin)
+
     def create_batch(self, sentence_li):
-        embeddings_batch = []
-        for sen in sentence_li:
-            embeddings = []
-            tokens = sen.split(' ')
-            tokens = [el for el in tokens if el != '']
-            if len(tokens) > self.opt['max_sequence_length']:
-                tokens = tokens[:self.opt['max_sequence_length']]
-            for tok in tokens:
-                embeddings.append(self.embedding_dict.tok2emb.get(tok))
-            if len(tokens) < self.opt['max_sequence_length']:
-                pads = [np.zeros(self.opt['embedding_dim'])
-                        for _ in range(self.opt['max_sequence_length'] - len(tokens))]
-                embeddings = pads + embeddings
-            embeddings = np.asarray(embeddings)
-            embeddings_batch.append(embeddings)
-        embeddings_batch = np.asarray(embeddings_batch)
+        """Embeddings of sentences left-padded to the batch sequence length, written into a reused buffer."""
+        max_len = self.opt['max_sequence_length']
+        tokens_li = [[el for el in sen.split(' ') if el != ''][:max_len] for sen in sentence_li]
+        seq_len = self.sequence_length([len(tokens) for tokens in tokens_li])
+        embeddings_batch = self.buffers.get('question', (len(sentence_li), seq_len, self.opt['embedding_dim']))
+        for i, tokens in enumerate(tokens_li):
+            pad = seq_len - len(tokens)
+            embeddings_batch[i, :pad] = 0
+            for j, tok in enumerate(tokens):
+                embeddings_batch[i, pad + j] = self.embedding_dict.get(tok)
         return embeddings_batch
 
+    def feature_key(self):
+        """Key of the representation the model predicts on, equal for models that can share it."""
+        if self.model_type == 'nn':
+            return ('embeddings', id(self.embedding_dict), self.opt['embedding_dim'],
+                    self.opt['max_sequence_length'], self.sequence_length([0]))
+        if self.model_type == 'ngrams':
+            return ('ngrams', self.vectorizers_key or id(self.vectorizers))
+
+    def featurize(self, sentence_li):
+        """Representation of the sentences to pass to predict_features."""
+        if self.model_type == 'nn':
+            self.embedding_dict.add_items(sentence_li)
+            return self.create_batch(sentence_li)
+        if self.model_type == 'ngrams':
+            return vectorize_select_from_data(sentence_li, self.vectorizers, self.selectors)
+
+    def make_predict_function(self):
+        """Build the predict function in advance, so that threads do not race to build it lazily."""
+        if self.model_type == 'nn':
+            self.model._make_predict_function()
+
     def update(self, batch):
         x, y = batch
         y = np.array(y)
         y_pred = None
 
         if self.model_type == 'nn':
+            check_model_feed(self.model, x, y)
             self.train_loss, self.train_acc = self.model.train_on_batch(x, y)
             y_pred = self.model.predict_on_batch(x).reshape(-1)
             self.train_auc = roc_auc_score(y, y_pred)
@@ -239,11 +278,17 @@ class InsultsModel(object):
         return y_pred
 
     def predict(self, batch):
+        if self.model_type == 'ngrams':
+            batch = vectorize_select_from_data(batch, self.vectorizers, self.selectors)
+        return self.predict_features(batch)
+
+    def predict_features(self, x):
+        """Predictions on a batch returned by featurize."""
         if self.model_type == 'nn':
-            y_pred = np.array(self.model.predict_on_batch(batch)).reshape(-1)
+            check_model_feed(self.model, x)
+            y_pred = np.array(self.model.predict_on_batch(x)).reshape(-1)
             return y_pred
         if self.model_type == 'ngrams':
-            x = vectorize_select_from_data(batch, self.vectorizers, self.selectors)
             predictions = np.array(self.model.predict_proba(x)[:,1]).reshape(-1)
             return predictions
 
@@ -259,7 +304,7 @@ class InsultsModel(object):
         return model
 
     def cnn_word_model(self):
-        embed_input = Input(shape=(self.opt['max_sequence_length'], self.opt['embedding_dim'],))
+        embed_input = Input(shape=(None, self.opt['embedding_dim'],))
 
         outputs = []
         for i in range(len(self.kernel_sizes)):
@@ -285,7 +330,7 @@ class InsultsModel(object):
 
 
     def lstm_word_model(self):
-        embed_input = Input(shape=(self.opt['max_sequence_length'], self.opt['embedding_dim'],))
+        embed_input = Input(shape=(None, self.opt['embedding_dim'],))
 
         output = Bidirectional(LSTM(self.opt['units_lstm'], activation='tanh',
                                       kernel_regularizer=l2(self.opt['regul_coef_lstm']),
@@ -1,6 +1,7 @@
 import os, sys
 import numpy as np
 import pickle
+import hashlib
 from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.feature_selection import SelectKBest, chi2
 import scipy.sparse as sp
@@ -115,6 +116,15 @@ def get_vectorizer_selector(model_file, num_ngrams):
             selectors.append(None)
     return vectorizers, selectors
 
+def vectorizer_selector_key(model_file, num_ngrams):
+    """Digest of the vectorizer and selector files read by get_vectorizer_selector."""
+    digest = hashlib.sha1()
+    fnames = [model_file + '_ngrams_vect_general_' + str(i) + '.bin' for i in range(num_ngrams)]
+    for fname in fnames + [model_file + '_ngrams_vect_special.bin']:
+        with open(fname, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
 def vectorize_select_from_data(data, vectorizers, selectors):
     num_ngrams = len(vectorizers) - 1
     X = None
@@ -5,6 +5,9 @@ def add_cmdline_args(parser):
     agent.add_argument('--cuda', type='bool', default=False)
     agent.add_argument('--gpu', type=int, default=-1)
     agent.add_argument('--random_seed', type=int, default=42)
+    agent.add_argument('--prefetch_depth', type=int, default=0,
+                       help='number of prepared batches to queue while the model trains on '
+                            'the previous one in a background thread, 0 to train synchronously')
 
     # # Basics
     # agent.add_argument('--embedding_file', type=str, default=None,
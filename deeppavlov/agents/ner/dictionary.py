@@ -2,6 +2,7 @@ import copy
 import os
 import pickle
 from collections import defaultdict
+import numpy as np
 from parlai.core.dict import DictionaryAgent
 from parlai.core.params import class2str
 
@@ -20,6 +21,18 @@ def get_char_dict():
     return char_dict
 
 
+def get_char_table(char_dict):
+    """Array of ids of char_dict characters indexed by their codepoints.
+    Its last item is the id of characters out of the table, <UNK>.
+    """
+    codepoints = [ord(ch) for ch in char_dict if len(ch) == 1]
+    table = np.full(max(codepoints) + 2, char_dict['<UNK>'], dtype=np.int32)
+    for ch, i in char_dict.items():
+        if len(ch) == 1:
+            table[ord(ch)] = i
+    return table
+
+
 class NERDictionaryAgent(DictionaryAgent):
 
     @staticmethod
@@ -36,6 +49,7 @@ class NERDictionaryAgent(DictionaryAgent):
         child_opt['dict_file'] = child_opt['dict_file'] + '.labels.dict'
         self.labels_dict = DictionaryAgent(child_opt, shared)
         self.char_dict = get_char_dict()
+        self.char_table = get_char_table(self.char_dict)
         super().__init__(opt, shared)
 
     def observe(self, observation):
@@ -7,11 +7,24 @@ from . import config
 from .dictionary import NERDictionaryAgent
 from .ner_tagger import NERTagger
 from .dictionary import get_char_dict
+from deeppavlov.utils.batch_pipeline import BatchPipeline
+from deeppavlov.utils.dtypes import INT_DTYPE
 
 
 char_dict = get_char_dict()
 
 
+def pad_sequences(sequences, value, max_len=None):
+    """Stack sequences of ids into an INT_DTYPE [len(sequences), max_len] array padded with value."""
+    lengths = np.fromiter(map(len, sequences), dtype=np.int64, count=len(sequences))
+    if max_len is None:
+        max_len = lengths.max() if len(lengths) else 0
+    padded = np.full((len(sequences), max_len), value, dtype=INT_DTYPE)
+    padded[np.arange(max_len) < lengths[:, None]] = np.fromiter(
+        (i for sequence in sequences for i in sequence), dtype=INT_DTYPE, count=lengths.sum())
+    return padded
+
+
 class NERAgent(Agent):
 
     @staticmethod
@@ -35,6 +48,7 @@ class NERAgent(Agent):
         self.is_shared = False
         self.word_dict = NERAgent.dictionary_class()(opt)
         self.network = NERTagger(opt, self.word_dict)
+        self.pipeline = BatchPipeline(self._update, opt.get('prefetch_depth', 0))
 
         super().__init__(opt, shared)
 
@@ -58,10 +72,16 @@ class NERAgent(Agent):
         batch = self.batchify(observations)
         (x, xc), y = batch
         if 'labels' in observations[0]:
-
-            self.loss = self.network.train_on_batch(x, xc, y)
-            responses = self.network.predict(x, xc)
+            if self.pipeline.depth:
+                # the network is still training on the previous batches,
+                # so responses are predicted before the update on this batch
+                responses = self.pipeline.call(self.network.predict, x, xc)
+                self.pipeline.put(batch)
+            else:
+                self.loss = self.network.train_on_batch(x, xc, y)
+                responses = self.network.predict(x, xc)
         else:
+            self.pipeline.join()
             responses = self.network.predict(x, xc)
 
         batch_response = [{'id': self.id} for _ in observations]
@@ -72,42 +92,31 @@ class NERAgent(Agent):
 
         return batch_response
 
+    def _update(self, batch):
+        (x, xc), y = batch
+        self.loss = self.network.train_on_batch(x, xc, y)
+
     def batchify(self, observations):
-        batch_size = len(observations)
-        x_list = []
-        x_char_list = []
-        y_list = []
-        max_len = 0
-        max_len_char = 0
-        for observation in observations:
-            if 'text' in observation:
-                text = observation['text']
-
-                current_char_list = []
-                tokens = text.split()
-                for token in tokens:
-                    characters = [self.word_dict.char_dict[ch] for ch in token]
-                    current_char_list.append(characters)
-                    max_len_char = max(max_len_char, len(token))
-                x_char_list.append(current_char_list)
-
-                tokens = self.word_dict.txt2vec(text)
-                tags = self.word_dict.labels_dict.txt2vec(observation['labels'][0]) if 'labels' in observation else None
-                max_len = max(len(tokens), max_len)
-                x_list.append(tokens)
-                y_list.append(tags)
+        observations = [observation for observation in observations if 'text' in observation]
+        texts = [observation['text'] for observation in observations]
+        tokens = [self.word_dict.txt2vec(text) for text in texts]
+        tags = [self.word_dict.labels_dict.txt2vec(observation['labels'][0]) if 'labels' in observation else []
+                for observation in observations]
+        char_tokens = [text.split() for text in texts]
+
         # Handle the case of incomplete batch in the end of the dataset
-        current_batch_size = len(x_list)
-        x = np.ones([current_batch_size, max_len]) * self.word_dict[self.word_dict.null_token]
-        xc = np.ones([current_batch_size, max_len, max_len_char]) * char_dict['<PAD>']
-        y = np.ones([current_batch_size, max_len]) * self.word_dict.labels_dict[self.word_dict.labels_dict.null_token]
-
-        for n, (x_item, x_char, y_item) in enumerate(zip(x_list, x_char_list, y_list)):
-            n_tokens = len(x_item)
-            x[n, :n_tokens] = x_item
-            y[n, :n_tokens] = y_item
-            for k, characters in enumerate(x_char):
-                xc[n, k, :len(characters)] = characters
+        x = pad_sequences(tokens, self.word_dict[self.word_dict.null_token])
+        y = pad_sequences(tags, self.word_dict.labels_dict[self.word_dict.labels_dict.null_token], x.shape[1])
+
+        # Characters of all tokens are mapped to ids at once and scattered
+        # into the [batch, tokens, chars] tensor in row-major order
+        token_lengths = pad_sequences([[len(token) for token in sentence] for sentence in char_tokens], 0, x.shape[1])
+        characters = ''.join(''.join(sentence) for sentence in char_tokens)
+        codepoints = np.frombuffer(characters.encode('utf-32-le', 'surrogatepass'), dtype='<u4')
+        char_table = self.word_dict.char_table
+        max_token_len = token_lengths.max() if token_lengths.size else 0
+        xc = np.full(token_lengths.shape + (max_token_len,), char_dict['<PAD>'], dtype=INT_DTYPE)
+        xc[np.arange(xc.shape[2]) < token_lengths[:, :, None]] = char_table[np.minimum(codepoints, len(char_table) - 1)]
         return (x, xc), y
 
     def save(self, fname=None):
@@ -115,6 +124,7 @@ class NERAgent(Agent):
         fname = self.opt.get('model_file', None) if fname is None else fname
         if fname:
             print("[ saving model: " + fname + " ]")
+            self.pipeline.join()
             try:
                 self.network.save(fname)
             except BaseException:
@@ -129,8 +139,17 @@ class NERAgent(Agent):
             except BaseException:
                 print('[ WARN: Saving failed... continuing anyway. ]')
 
+    def report(self):
+        self.pipeline.join()
+        report = dict()
+        report['loss'] = self.loss
+        if self.pipeline.depth:
+            report.update(self.pipeline.stats())
+        return report
+
     def shutdown(self):
         if not self.is_shared:
+            self.pipeline.close()
             self.network.shutdown()
 
 
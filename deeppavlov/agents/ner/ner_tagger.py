@@ -5,6 +5,7 @@ from collections import namedtuple
 from tensorflow.contrib.layers import xavier_initializer
 import os
 import pickle
+from deeppavlov.utils.dtypes import check_feed
 
 
 class NERTagger:
@@ -107,7 +108,9 @@ class NERTagger:
         pass
 
     def train_on_batch(self, x, xc, y):
-        loss, _ = self.sess.run([self.loss, self.train_op], feed_dict={self.x: x, self.xc: xc, self.y_ground_truth: y})
+        feed_dict = {self.x: x, self.xc: xc, self.y_ground_truth: y}
+        check_feed(feed_dict.keys(), feed_dict.values())
+        loss, _ = self.sess.run([self.loss, self.train_op], feed_dict=feed_dict)
         return loss
 
     def eval(self, x, y):
@@ -115,7 +118,9 @@ class NERTagger:
         return loss
 
     def predict(self, x, xc):
-        y = self.sess.run(self.y_predicted, feed_dict={self.x: x, self.xc: xc})
+        feed_dict = {self.x: x, self.xc: xc}
+        check_feed(feed_dict.keys(), feed_dict.values())
+        y = self.sess.run(self.y_predicted, feed_dict=feed_dict)
         return y
 
     def save(self, file_path):
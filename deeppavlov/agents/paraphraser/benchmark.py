@@ -0,0 +1,92 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Latency of the fused ensemble against running the fold models one by one.
+
+    python -m deeppavlov.agents.paraphraser.benchmark \
+        --model_files ./build/paraphraser/paraphraser_0 ... ./build/paraphraser/paraphraser_4 \
+        --fasttext_embeddings_dict ./build/paraphraser/paraphraser.emb \
+        --fasttext_model ./build/paraphraser/ft_0.8.3_nltk_yalen_sg_300.bin
+
+Batches of random embeddings are fed to the models, so only the models are
+timed, not tokenization and embedding lookups.
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from deeppavlov.utils.dtypes import FLOAT_DTYPE
+
+
+def latency(fn, repeats, warmup=2):
+    """Median time of a call of fn in seconds."""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeats):
+        start = time.time()
+        fn()
+        times.append(time.time() - start)
+    return float(np.median(times))
+
+
+def benchmark(models, batch_sizes=(1, 32, 256), repeats=20, seed=0):
+    """Print and return [(batch size, sequential secs, fused secs, max abs difference)]."""
+    from .model import fuse_models
+
+    fused = fuse_models(models)
+    rng = np.random.RandomState(seed)
+    results = []
+    for batch_size in batch_sizes:
+        shape = (batch_size, models[0].max_sequence_length, models[0].embedding_dim)
+        batch = [rng.uniform(-1, 1, shape).astype(FLOAT_DTYPE) for _ in range(2)]
+
+        def sequential():
+            return np.mean([model.predict(batch) for model in models], axis=0)
+
+        def fused_predict():
+            return fused.predict_on_batch(batch)
+
+        difference = float(np.max(np.abs(sequential() - fused_predict())))
+        result = (batch_size, latency(sequential, repeats), latency(fused_predict, repeats), difference)
+        print('batch size %d | sequential = %.1f ms | fused = %.1f ms | speedup = %.2f | max diff = %.2e' %
+              (batch_size, 1000 * result[1], 1000 * result[2], result[1] / result[2], difference))
+        results.append(result)
+    return results
+
+
+def main(args=None):
+    from parlai.core.params import ParlaiParser
+    from .paraphraser import EnsembleParaphraserAgent
+
+    parser = ParlaiParser()
+    EnsembleParaphraserAgent.add_cmdline_args(parser)
+    bench = parser.add_argument_group('Benchmark Arguments')
+    bench.add_argument('--batch_sizes', type=int, default=[1, 32, 256], nargs='+')
+    bench.add_argument('--repeats', type=int, default=20)
+    opt = parser.parse_args(args=args)
+    opt['fuse_models'] = False
+
+    agent = EnsembleParaphraserAgent(opt)
+    print('[ %d models ]' % len(agent.models))
+    benchmark(agent.models, opt['batch_sizes'], opt['repeats'])
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
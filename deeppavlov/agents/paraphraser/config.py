@@ -21,6 +21,9 @@ def add_cmdline_args(parser):
     agent.add_argument('--no_cuda', type='bool', default=False)
     agent.add_argument('--gpu', type=int, default=-1)
     agent.add_argument('--random_seed', type=int, default=1013)
+    agent.add_argument('--prefetch_depth', type=int, default=0,
+                       help='number of prepared batches to queue while the model trains on '
+                            'the previous one in a background thread, 0 to train synchronously')
 
     # Basics
     agent.add_argument('--pretrained_model', type=str, default=None,
@@ -32,6 +35,33 @@ def add_cmdline_args(parser):
                        help='fasttext trained model file name')
     agent.add_argument('-fed', '--fasttext_embeddings_dict', type=str, default=None,
                        help='saved fasttext embeddings dict')
+    agent.add_argument('--fasttext_embeddings_format', type=str, default='binary',
+                       choices=['binary', 'text'],
+                       help='format to save fasttext embeddings dict in: memory-mapped binary or text')
+    agent.add_argument('--fasttext_mmap', type='bool', default=False,
+                       help='use only the memory-mapped fasttext input matrix and release the fasttext '
+                            'model once the matrix is checked against it, so forked workers share it')
+    agent.add_argument('--fasttext_cache_size', type=int, default=0,
+                       help='max number of computed fasttext embeddings to keep in memory, 0 for no limit')
+    agent.add_argument('--fasttext_cache_bytes', type=int, default=0,
+                       help='max size in bytes of computed fasttext embeddings kept in memory, 0 for no limit')
+    agent.add_argument('--fasttext_flush_every', type=int, default=10000,
+                       help='number of unsaved fasttext embeddings evicted from the cache to keep before '
+                            'appending them to the binary embeddings dict, or dropping them without one')
+    agent.add_argument('--fasttext_cache_policy', type=str, default='lru', choices=['lru', 'lfu'],
+                       help='eviction policy of the fasttext embeddings cache')
+    agent.add_argument('--fasttext_compact_ratio', type=float, default=0.5,
+                       help='merge the log of new tokens into the binary fasttext embeddings dict '
+                            'when the log exceeds this fraction of the dict size')
+    agent.add_argument('--fasttext_dtype', type=str, default='float32', choices=['float32', 'float16', 'int8'],
+                       help='dtype to keep fasttext embeddings in memory with, int8 uses a scale per vector')
+    agent.add_argument('--tokenizer', type=str, default='nltk', choices=['nltk', 'regex'],
+                       help='NLTK punkt and treebank tokenization or the faster regex tokenizer giving the same tokens')
+    agent.add_argument('--tokenizer_cache_size', type=int, default=100000,
+                       help='max number of tokenized sentences to memoize, 0 to tokenize every time')
+    agent.add_argument('--tokenizer_check', type=int, default=1000,
+                       help='number of first sentences the regex tokenizer is compared with NLTK on, '
+                            'NLTK is used after a difference')
 
 
 
@@ -27,13 +27,15 @@ set_session(tf.Session(config=config))
 
 from .metrics import fbeta_score
 from .embeddings_dict import EmbeddingsDict
-from keras.layers import Dense, Activation, Input, LSTM, Dropout, multiply, Lambda
+from deeppavlov.utils.embeddings_registry import get_embeddings_dict
+from deeppavlov.utils.dtypes import FLOAT_DTYPE, check_model_feed
+from deeppavlov.utils.buffer_pool import BufferPool
+from keras.layers import Dense, Activation, Input, LSTM, Dropout, multiply, Lambda, average
 from keras.models import Model
 from keras.layers.wrappers import Bidirectional
 from keras.initializers import glorot_uniform, Orthogonal
 from keras import backend as K
 from keras.optimizers import Adam
-from nltk.tokenize import sent_tokenize, word_tokenize
 
 
 class ParaphraserModel(object):
@@ -48,7 +50,9 @@ class ParaphraserModel(object):
             self._init_params()
             self._init_from_scratch()
 
-        self.embdict = embdict if embdict is not None else EmbeddingsDict(opt, self.embedding_dim)
+        self.embdict = embdict if embdict is not None else get_embeddings_dict(EmbeddingsDict, opt, self.embedding_dim)
+        # batches queued for training in the background are still alive
+        self.buffers = BufferPool(self.opt.get('prefetch_depth', 0) + 2)
 
         self.n_examples = 0
         self.updates = 0
@@ -142,10 +146,12 @@ class ParaphraserModel(object):
 
     def update(self, batch):
         x, y = batch
+        check_model_feed(self.model, x, y)
         self.train_loss, self.train_acc, self.train_f1 = self.model.train_on_batch(x, y)
         self.updates += 1
 
     def predict(self, batch):
+        check_model_feed(self.model, batch)
         return self.model.predict_on_batch(batch)
 
     def build_ex(self, ex):
@@ -171,33 +177,31 @@ class ParaphraserModel(object):
             question2.append(ex['question2'])
         self.embdict.add_items(question1)
         self.embdict.add_items(question2)
-        b1 = self.create_batch(question1)
-        b2 = self.create_batch(question2)
+        tokens1 = [self.tokenize(sen) for sen in question1]
+        tokens2 = [self.tokenize(sen) for sen in question2]
+        b1 = self.create_batch(tokens1, self.max_sequence_length, 'question1')
+        b2 = self.create_batch(tokens2, self.max_sequence_length, 'question2')
 
         if len(batch[0]) == 3:
-            y = [1 if ex['labels'][0] == 'Да' else 0 for ex in batch]
+            y = np.array([1 if ex['labels'][0] == 'Да' else 0 for ex in batch], dtype=FLOAT_DTYPE)
             return [b1, b2], y
         else:
             return [b1, b2], None
 
-    def create_batch(self, sentence_li):
-        embeddings_batch = []
-        for sen in sentence_li:
-            embeddings = []
-            sent_toks = sent_tokenize(sen)
-            word_toks = [word_tokenize(el) for el in sent_toks]
-            tokens = [val for sublist in word_toks for val in sublist]
-            tokens = [el for el in tokens if el != '']
-            for tok in tokens:
-                embeddings.append(self.embdict.tok2emb.get(tok))
-            if len(tokens) < self.max_sequence_length:
-                pads = [np.zeros(self.embedding_dim) for _ in range(self.max_sequence_length - len(tokens))]
-                embeddings = pads + embeddings
-            else:
-                embeddings = embeddings[-self.max_sequence_length:]
-            embeddings = np.asarray(embeddings)
-            embeddings_batch.append(embeddings)
-        embeddings_batch = np.asarray(embeddings_batch)
+    def tokenize(self, sen):
+        """Tokens of a sentence cut from the left to max_sequence_length."""
+        return self.embdict.tokenize(sen)[-self.max_sequence_length:]
+
+    def create_batch(self, tokens_li, seq_len, key='question'):
+        """Embeddings of tokenized sentences left-padded to seq_len,
+        written into a buffer reused for batches of the same key.
+        """
+        embeddings_batch = self.buffers.get(key, (len(tokens_li), seq_len, self.embedding_dim))
+        for i, tokens in enumerate(tokens_li):
+            pad = seq_len - len(tokens)
+            embeddings_batch[i, :pad] = 0
+            for j, tok in enumerate(tokens):
+                embeddings_batch[i, pad + j] = self.embdict.get(tok)
         return embeddings_batch
 
     def create_lstm_layer(self, input_dim):
@@ -284,10 +288,7 @@ class ParaphraserModel(object):
     def create_attention_layer(self, input_dim_a, input_dim_b):
         inp_a = Input(shape=(input_dim_a, self.hidden_dim,))
         inp_b = Input(shape=(input_dim_b, self.hidden_dim,))
-        val = np.concatenate((np.zeros((self.max_sequence_length-1,1)), np.ones((1,1))), axis=0)
-        kcon = K.constant(value=val, dtype='float32')
-        inp_b_perm = Lambda(lambda x: K.permute_dimensions(x, (0,2,1)))(inp_b)
-        last_state = Lambda(lambda x: K.permute_dimensions(K.dot(x, kcon), (0,2,1)))(inp_b_perm)
+        last_state = Lambda(self.last_step)(inp_b)
         ker_in = glorot_uniform(seed=self.seed)
         outp_a = Dense(self.attention_dim, input_shape=(input_dim_a, self.hidden_dim),
                        kernel_initializer=ker_in, activation='relu')(inp_a)
@@ -303,10 +304,7 @@ class ParaphraserModel(object):
     def create_attention_layer_f(self, input_dim_a, input_dim_b):
         inp_a = Input(shape=(input_dim_a, self.hidden_dim,))
         inp_b = Input(shape=(input_dim_b, self.hidden_dim,))
-        val = np.concatenate((np.zeros((self.max_sequence_length-1,1)), np.ones((1,1))), axis=0)
-        kcon = K.constant(value=val, dtype='float32')
-        inp_b_perm = Lambda(lambda x: K.permute_dimensions(x, (0,2,1)))(inp_b)
-        last_state = Lambda(lambda x: K.permute_dimensions(K.dot(x, kcon), (0,2,1)))(inp_b_perm)
+        last_state = Lambda(self.last_step)(inp_b)
         ker_in = glorot_uniform(seed=self.seed)
         outp_a = Dense(self.attention_dim, input_shape=(input_dim_a, self.hidden_dim),
                        kernel_initializer=ker_in, activation='relu')(inp_a)
@@ -322,10 +320,7 @@ class ParaphraserModel(object):
     def create_attention_layer_b(self, input_dim_a, input_dim_b):
         inp_a = Input(shape=(input_dim_a, self.hidden_dim,))
         inp_b = Input(shape=(input_dim_b, self.hidden_dim,))
-        val = np.concatenate((np.ones((1,1)), np.zeros((self.max_sequence_length-1,1))), axis=0)
-        kcon = K.constant(value=val, dtype='float32')
-        inp_b_perm = Lambda(lambda x: K.permute_dimensions(x, (0,2,1)))(inp_b)
-        last_state = Lambda(lambda x: K.permute_dimensions(K.dot(x, kcon), (0,2,1)))(inp_b_perm)
+        last_state = Lambda(self.first_step)(inp_b)
         ker_in = glorot_uniform(seed=self.seed)
         outp_a = Dense(self.attention_dim, input_shape=(input_dim_a, self.hidden_dim),
                        kernel_initializer=ker_in, activation='relu')(inp_a)
@@ -338,12 +333,21 @@ class ParaphraserModel(object):
         model = Model(inputs=[inp_a, inp_b], outputs=outp_norm_perm, name="att_generator_back")
         return model
 
+    def last_step(self, inp):
+        """States of the last step of [batch, steps, dim] sequences, as [batch, 1, dim]."""
+        return inp[:, -1:, :]
+
+    def first_step(self, inp):
+        """States of the first step of [batch, steps, dim] sequences, as [batch, 1, dim]."""
+        return inp[:, :1, :]
+
+    def diagonal(self, inp):
+        """Diagonals of [batch, steps, steps] matrices, as [batch, steps, 1]."""
+        return K.expand_dims(tf.matrix_diag_part(inp), -1)
+
     def weighted_with_attention(self, inputs):
         inp, inp_cont = inputs
-        val = np.eye(self.max_sequence_length)
-        kcon = K.constant(value=val, dtype='float32')
-        diag = K.repeat_elements(inp_cont, self.max_sequence_length, 2) * kcon
-        return K.batch_dot(diag, K.permute_dimensions(inp, (0,2,1)), axes=[1,2])
+        return inp * inp_cont
 
     def weighted_with_attention_output_shape(self, shapes):
         shape1, shape2 = shapes
@@ -384,10 +388,7 @@ class ParaphraserModel(object):
                                            seed=self.seed if self.seed is not None else 243)
             W.append(wi)
 
-        val = np.concatenate((np.zeros((self.max_sequence_length-1,1)), np.ones((1,1))), axis=0)
-        kcon = K.constant(value=val, dtype='float32')
-        inp_b_perm = Lambda(lambda x: K.permute_dimensions(x, (0,2,1)))(inp_b)
-        last_state = Lambda(lambda x: K.permute_dimensions(K.dot(x, kcon), (0,2,1)))(inp_b_perm)
+        last_state = Lambda(self.last_step)(inp_b)
         m = []
         for i in range(self.perspective_num):
             outp_a = Lambda(lambda x: x * W[i])(inp_a)
@@ -414,10 +415,7 @@ class ParaphraserModel(object):
                                            seed=self.seed if self.seed is not None else 243)
             W.append(wi)
 
-        val = np.concatenate((np.ones((1, 1)), np.zeros((self.max_sequence_length - 1, 1))), axis=0)
-        kcon = K.constant(value=val, dtype='float32')
-        inp_b_perm = Lambda(lambda x: K.permute_dimensions(x, (0, 2, 1)))(inp_b)
-        last_state = Lambda(lambda x: K.permute_dimensions(K.dot(x, kcon), (0, 2, 1)))(inp_b_perm)
+        last_state = Lambda(self.first_step)(inp_b)
         m = []
         for i in range(self.perspective_num):
             outp_a = Lambda(lambda x: x * W[i])(inp_a)
@@ -487,9 +485,7 @@ class ParaphraserModel(object):
             outp_hmean = Lambda(lambda x: K.l2_normalize(x, -1))(outp_hmean)
             outp_hmean = Lambda(lambda x: K.permute_dimensions(x, (0, 2, 1)))(outp_hmean)
             outp = Lambda(lambda x: K.batch_dot(x[0], x[1], axes=[1, 2]))([outp_hmean, outp_a])
-            val = np.eye(self.max_sequence_length)
-            kcon = K.constant(value=val, dtype='float32')
-            outp = Lambda(lambda x: K.sum(x * kcon, -1, keepdims=True))(outp)
+            outp = Lambda(self.diagonal)(outp)
             m.append(outp)
         if self.perspective_num > 1:
             persp = Lambda(lambda x: K.concatenate(x, 2))(m)
@@ -512,7 +508,7 @@ class ParaphraserModel(object):
         outp_b = Lambda(lambda x: K.l2_normalize(x, -1))(inp_b)
         outp_b = Lambda(lambda x: K.permute_dimensions(x, (0, 2, 1)))(outp_b)
         alpha = Lambda(lambda x: K.batch_dot(x[0], x[1], axes=[1, 2]))([outp_b, outp_a])
-        alpha = Lambda(lambda x: K.one_hot(K.argmax(x, 1), self.max_sequence_length))(alpha)
+        alpha = Lambda(lambda x: K.one_hot(K.argmax(x, 1), K.shape(x)[1]))(alpha)
         hmax = Lambda(lambda x: K.batch_dot(x[0], x[1], axes=[1, 2]))([alpha, outp_b])
 
         m = []
@@ -523,9 +519,7 @@ class ParaphraserModel(object):
             outp_hmax = Lambda(lambda x: K.l2_normalize(x, -1))(outp_hmax)
             outp_hmax = Lambda(lambda x: K.permute_dimensions(x, (0, 2, 1)))(outp_hmax)
             outp = Lambda(lambda x: K.batch_dot(x[0], x[1], axes=[1, 2]))([outp_hmax, outp_a])
-            val = np.eye(self.max_sequence_length)
-            kcon = K.constant(value=val, dtype='float32')
-            outp = Lambda(lambda x: K.sum(x * kcon, -1, keepdims=True))(outp)
+            outp = Lambda(self.diagonal)(outp)
             m.append(outp)
         if self.perspective_num > 1:
             persp = Lambda(lambda x: K.concatenate(x, 2))(m)
@@ -545,33 +539,25 @@ class ParaphraserModel(object):
         return shape1[0], 2*shape1[1]
 
     def terminal_f(self, inp):
-        val = np.concatenate((np.zeros((self.max_sequence_length-1,1)), np.ones((1,1))), axis=0)
-        kcon = K.constant(value=val, dtype='float32')
-        inp = Lambda(lambda x: K.permute_dimensions(x, (0,2,1)))(inp)
-        last_state = Lambda(lambda x: K.permute_dimensions(K.dot(x, kcon), (0,2,1)))(inp)
-        return K.squeeze(last_state, 1)
+        return inp[:, -1, :]
 
     def terminal_f_output_shape(self, shape):
         return shape[0], shape[2]
 
     def terminal_b(self, inp):
-        val = np.concatenate((np.ones((1,1)), np.zeros((self.max_sequence_length-1,1))), axis=0)
-        kcon = K.constant(value=val, dtype='float32')
-        inp = Lambda(lambda x: K.permute_dimensions(x, (0,2,1)))(inp)
-        last_state = Lambda(lambda x: K.permute_dimensions(K.dot(x, kcon), (0,2,1)))(inp)
-        return K.squeeze(last_state, 1)
+        return inp[:, 0, :]
 
     def terminal_b_output_shape(self, shape):
         return shape[0], shape[2]
 
     def bmwacor_model(self):
-        input_a = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        input_b = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        lstm_layer = self.create_lstm_layer(self.max_sequence_length)
+        input_a = Input(shape=(None, self.embedding_dim,))
+        input_b = Input(shape=(None, self.embedding_dim,))
+        lstm_layer = self.create_lstm_layer(None)
         lstm_a = lstm_layer(input_a)
         lstm_b = lstm_layer(input_b)
 
-        attention_layer = self.create_attention_layer(self.max_sequence_length, self.max_sequence_length)
+        attention_layer = self.create_attention_layer(None, None)
         attention_a = attention_layer([lstm_a, lstm_b])
         attention_b = attention_layer([lstm_b, lstm_a])
 
@@ -593,14 +579,14 @@ class ParaphraserModel(object):
         return model
 
     def bilstm_split_model(self):
-        input_a = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        input_b = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        lstm_layer = self.create_lstm_layer_1(self.max_sequence_length)
+        input_a = Input(shape=(None, self.embedding_dim,))
+        input_b = Input(shape=(None, self.embedding_dim,))
+        lstm_layer = self.create_lstm_layer_1(None)
         lstm_a = lstm_layer(input_a)
         lstm_b = lstm_layer(input_b)
 
-        attention_layer_f = self.create_attention_layer_f(self.max_sequence_length, self.max_sequence_length)
-        attention_layer_b = self.create_attention_layer_b(self.max_sequence_length, self.max_sequence_length)
+        attention_layer_f = self.create_attention_layer_f(None, None)
+        attention_layer_b = self.create_attention_layer_b(None, None)
         attention_a_forw = attention_layer_f([lstm_a[0], lstm_b[0]])
         attention_a_back = attention_layer_b([lstm_a[1], lstm_b[1]])
         attention_b_forw = attention_layer_f([lstm_b[0], lstm_a[0]])
@@ -637,15 +623,15 @@ class ParaphraserModel(object):
         return model
 
     def maxpool_match_model(self):
-        input_a = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        input_b = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        lstm_layer = self.create_lstm_layer_1(self.max_sequence_length)
+        input_a = Input(shape=(None, self.embedding_dim,))
+        input_b = Input(shape=(None, self.embedding_dim,))
+        lstm_layer = self.create_lstm_layer_1(None)
         lstm_a = lstm_layer(input_a)
         lstm_b = lstm_layer(input_b)
 
-        matching_layer_f = self.create_maxpool_matching_layer(self.max_sequence_length, self.max_sequence_length)
-        matching_layer_b = self.create_maxpool_matching_layer(self.max_sequence_length, self.max_sequence_length)
-        lstm_layer_agg = self.create_lstm_layer_2(self.max_sequence_length)
+        matching_layer_f = self.create_maxpool_matching_layer(None, None)
+        matching_layer_b = self.create_maxpool_matching_layer(None, None)
+        lstm_layer_agg = self.create_lstm_layer_2(None)
         matching_a_forw = matching_layer_f([lstm_a[0], lstm_b[0]])
         matching_a_back = matching_layer_b([lstm_a[1], lstm_b[1]])
         matching_b_forw = matching_layer_f([lstm_b[0], lstm_a[0]])
@@ -684,15 +670,15 @@ class ParaphraserModel(object):
         return model
 
     def maxatt_match_model(self):
-        input_a = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        input_b = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        lstm_layer = self.create_lstm_layer_1(self.max_sequence_length)
+        input_a = Input(shape=(None, self.embedding_dim,))
+        input_b = Input(shape=(None, self.embedding_dim,))
+        lstm_layer = self.create_lstm_layer_1(None)
         lstm_a = lstm_layer(input_a)
         lstm_b = lstm_layer(input_b)
 
-        matching_layer_f = self.create_maxatt_matching_layer(self.max_sequence_length, self.max_sequence_length)
-        matching_layer_b = self.create_maxatt_matching_layer(self.max_sequence_length, self.max_sequence_length)
-        lstm_layer_agg = self.create_lstm_layer_2(self.max_sequence_length)
+        matching_layer_f = self.create_maxatt_matching_layer(None, None)
+        matching_layer_b = self.create_maxatt_matching_layer(None, None)
+        lstm_layer_agg = self.create_lstm_layer_2(None)
         matching_a_forw = matching_layer_f([lstm_a[0], lstm_b[0]])
         matching_a_back = matching_layer_b([lstm_a[1], lstm_b[1]])
         matching_b_forw = matching_layer_f([lstm_b[0], lstm_a[0]])
@@ -731,15 +717,15 @@ class ParaphraserModel(object):
         return model
 
     def att_match_model(self):
-        input_a = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        input_b = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        lstm_layer = self.create_lstm_layer_1(self.max_sequence_length)
+        input_a = Input(shape=(None, self.embedding_dim,))
+        input_b = Input(shape=(None, self.embedding_dim,))
+        lstm_layer = self.create_lstm_layer_1(None)
         lstm_a = lstm_layer(input_a)
         lstm_b = lstm_layer(input_b)
 
-        matching_layer_f = self.create_att_matching_layer(self.max_sequence_length, self.max_sequence_length)
-        matching_layer_b = self.create_att_matching_layer(self.max_sequence_length, self.max_sequence_length)
-        lstm_layer_agg = self.create_lstm_layer_2(self.max_sequence_length)
+        matching_layer_f = self.create_att_matching_layer(None, None)
+        matching_layer_b = self.create_att_matching_layer(None, None)
+        lstm_layer_agg = self.create_lstm_layer_2(None)
         matching_a_forw = matching_layer_f([lstm_a[0], lstm_b[0]])
         matching_a_back = matching_layer_b([lstm_a[1], lstm_b[1]])
         matching_b_forw = matching_layer_f([lstm_b[0], lstm_a[0]])
@@ -778,15 +764,15 @@ class ParaphraserModel(object):
         return model
 
     def full_match_model(self):
-        input_a = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        input_b = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        lstm_layer = self.create_lstm_layer_1(self.max_sequence_length)
+        input_a = Input(shape=(None, self.embedding_dim,))
+        input_b = Input(shape=(None, self.embedding_dim,))
+        lstm_layer = self.create_lstm_layer_1(None)
         lstm_a = lstm_layer(input_a)
         lstm_b = lstm_layer(input_b)
 
-        matching_layer_f = self.create_full_matching_layer_f(self.max_sequence_length, self.max_sequence_length)
-        matching_layer_b = self.create_full_matching_layer_b(self.max_sequence_length, self.max_sequence_length)
-        lstm_layer_agg = self.create_lstm_layer_2(self.max_sequence_length)
+        matching_layer_f = self.create_full_matching_layer_f(None, None)
+        matching_layer_b = self.create_full_matching_layer_b(None, None)
+        lstm_layer_agg = self.create_lstm_layer_2(None)
         matching_a_forw = matching_layer_f([lstm_a[0], lstm_b[0]])
         matching_a_back = matching_layer_b([lstm_a[1], lstm_b[1]])
         matching_b_forw = matching_layer_f([lstm_b[0], lstm_a[0]])
@@ -825,9 +811,9 @@ class ParaphraserModel(object):
         return model
 
     def bilstm_woatt_model(self):
-        input_a = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        input_b = Input(shape=(self.max_sequence_length, self.embedding_dim,))
-        lstm_layer = self.create_lstm_layer_last(self.max_sequence_length)
+        input_a = Input(shape=(None, self.embedding_dim,))
+        input_b = Input(shape=(None, self.embedding_dim,))
+        lstm_layer = self.create_lstm_layer_last(None)
         lstm_last_a = lstm_layer(input_a)
         lstm_last_b = lstm_layer(input_b)
 
@@ -842,3 +828,20 @@ class ParaphraserModel(object):
         model = Model([input_a, input_b], dense)
 
         return model
+
+
+def can_fuse(models):
+    """Whether the models take the same batches, i.e. tokenize and embed sentences alike."""
+    return len(set((model.embedding_dim, model.max_sequence_length) for model in models)) == 1
+
+
+def fuse_models(models):
+    """One Keras model computing the mean prediction of the models on shared inputs.
+    The models are called as layers, so their weights are not copied, and the
+    whole ensemble is computed by one session.run.
+    """
+    input_a = Input(shape=(None, models[0].embedding_dim,))
+    input_b = Input(shape=(None, models[0].embedding_dim,))
+    outputs = [model.model([input_a, input_b]) for model in models]
+    output = average(outputs) if len(outputs) > 1 else outputs[0]
+    return Model([input_a, input_b], output, name='fused_ensemble')
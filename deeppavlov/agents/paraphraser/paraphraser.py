@@ -20,7 +20,10 @@ from parlai.core.agents import Agent
 
 from . import config
 from .embeddings_dict import EmbeddingsDict
-from .model import ParaphraserModel
+from deeppavlov.utils.embeddings_registry import get_embeddings_dict
+from .model import ParaphraserModel, can_fuse, fuse_models
+from deeppavlov.utils.batch_pipeline import BatchPipeline
+from deeppavlov.utils.dtypes import check_model_feed
 
 
 def prediction2text(prediction):
@@ -39,6 +42,9 @@ class EnsembleParaphraserAgent(Agent):
         ensemble = argparser.add_argument_group('Ensemble parameters')
         ensemble.add_argument('--model_files', type=str, default=None, nargs='+',
                               help='list of all the model files for the ensemble')
+        ensemble.add_argument('--fuse_models', type='bool', default=True,
+                              help='average the models in one graph run once per batch '
+                                   'instead of running them one by one')
 
     def __init__(self, opt, shared=None):
         self.id = 'ParaphraserAgent'
@@ -50,11 +56,17 @@ class EnsembleParaphraserAgent(Agent):
 
         # Set up params/logging/dicts
         self.is_shared = False
-        embdict = EmbeddingsDict(opt, opt.get('embedding_dim'))
+        embdict = get_embeddings_dict(EmbeddingsDict, opt, opt.get('embedding_dim'))
         self.models = []
         for model_file in opt.get('model_files', []):
             opt['pretrained_model'] = model_file
             self.models.append(ParaphraserModel(opt, embdict))
+        self.fused = None
+        if opt.get('fuse_models', True) and len(self.models) > 1:
+            if can_fuse(self.models):
+                self.fused = fuse_models(self.models)
+            else:
+                print('[ Models differ in max_sequence_length or embedding_dim, running them one by one ]')
 
     def observe(self, observation):
         observation = copy.deepcopy(observation)
@@ -79,6 +91,9 @@ class EnsembleParaphraserAgent(Agent):
         batch_size = len(observations)
         # initialize a table of replies with this agent's id
         batch_reply = [{'id': self.getID()} for _ in range(batch_size)]
+        if self.fused is not None:
+            return self._fused_batch_act(observations, batch_reply)
+
         predictions = [[] for _ in range(batch_size)]
         for model in self.models:
             examples = [model.build_ex(obs) for obs in observations]
@@ -96,6 +111,23 @@ class EnsembleParaphraserAgent(Agent):
 
         return batch_reply
 
+    def _fused_batch_act(self, observations, batch_reply):
+        # the models take the same batches, so the batch is built once
+        model = self.models[0]
+        examples = [model.build_ex(obs) for obs in observations]
+        valid_inds = [i for i in range(len(observations)) if examples[i] is not None]
+        examples = [ex for ex in examples if ex is not None]
+        if len(examples) == 0:
+            return batch_reply
+        batch, _ = model.batchify(examples)
+        check_model_feed(self.fused, batch)
+        predictions = self.fused.predict_on_batch(batch).reshape(-1)
+        texts = predictions2text(predictions)
+        for i in range(len(predictions)):
+            batch_reply[valid_inds[i]]['text'] = texts[i]
+            batch_reply[valid_inds[i]]['score'] = predictions[i]
+        return batch_reply
+
 
 class ParaphraserAgent(Agent):
 
@@ -114,6 +146,7 @@ class ParaphraserAgent(Agent):
         # Set up params/logging/dicts
         self.is_shared = False
         self.model = ParaphraserModel(opt)
+        self.pipeline = BatchPipeline(self.model.update, opt.get('prefetch_depth', 0))
         self.n_examples = 0
 
     def observe(self, observation):
@@ -146,8 +179,9 @@ class ParaphraserAgent(Agent):
 
         if 'labels' in observations[0] and not self.opt.get('pretrained_model'):
             self.n_examples += len(examples)
-            self.model.update(batch)
+            self.pipeline.put(batch)
         else:
+            self.pipeline.join()
             batch, _ = batch
             predictions = self.model.predict(batch)
             texts = predictions2text(predictions)
@@ -162,20 +196,35 @@ class ParaphraserAgent(Agent):
         fname = self.opt.get('model_file', None) if fname is None else fname
         if fname:
             print("[ saving model: " + fname + " ]")
+            self.pipeline.join()
             self.model.save(fname)
 
     def report(self):
-        return (
-            '[train] updates = %d | exs = %d | loss = %.4f | acc = %.4f | f1 = %.4f'%
+        self.pipeline.join()
+        cache = self.model.embdict.cache_stats()
+        output = (
+            '[train] updates = %d | exs = %d | loss = %.4f | acc = %.4f | f1 = %.4f'
+            ' | emb cache size = %d | hits = %d | misses = %d | evictions = %d' %
             (self.model.updates, self.n_examples,
-             self.model.train_loss, self.model.train_acc, self.model.train_f1))
+             self.model.train_loss, self.model.train_acc, self.model.train_f1,
+             cache['cache_size'], cache['cache_hits'], cache['cache_misses'], cache['cache_evictions']))
+        stats = self.model.embdict.tokenizer.stats()
+        output += ' | tokenizer cache hits = %d | misses = %d' % (
+            stats['tokenizer_cache_hits'], stats['tokenizer_cache_misses'])
+        if self.pipeline.depth:
+            stats = self.pipeline.stats()
+            output += ' | prefetch stall: producer = %.1fs | consumer = %.1fs' % (
+                stats['producer_stall_secs'], stats['consumer_stall_secs'])
+        return output
 
     def reset_metrics(self):
+        self.pipeline.join()
         self.model.reset_metrics()
         self.n_examples = 0
 
     def shutdown(self):
         if not self.is_shared:
             if self.model is not None:
+                self.pipeline.close()
                 self.model.shutdown()
             self.model = None
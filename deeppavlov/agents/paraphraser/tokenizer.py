@@ -0,0 +1,202 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import re
+from functools import lru_cache
+
+import nltk
+from nltk.tokenize import sent_tokenize, word_tokenize
+
+
+def nltk_tokenize(sen):
+    """Tokens of NLTK punkt sentence splitting followed by treebank word tokenization."""
+    sent_toks = sent_tokenize(sen)
+    word_toks = [word_tokenize(el) for el in sent_toks]
+    tokens = [val for sublist in word_toks for val in sublist]
+    return [el for el in tokens if el != '']
+
+
+# treebank splits these characters off, ',' and ':' only when no digit follows
+_TOKEN_RE = re.compile(r'\.\.\.|--|[;@#$%&?!\[\](){}<>"]|[,:](?!\d)'
+                       r'|(?:[^\s;@#$%&?!\[\](){}<>",:.\-]|[,:](?=\d)|\.(?!\.\.)|-(?!-))+')
+# sentences with these are left to NLTK: apostrophes, backquotes, English contractions, spaced ellipses
+_DELEGATE_RE = re.compile(r"['`]|\.\s\.|\b(?:cannot|d'ye|gimme|gonna|gotta|lemme|mor'n|wanna)\b", re.IGNORECASE)
+# characters that may follow the last period of a sentence
+_CLOSING_CHARS = ']})>"\''
+# punkt moves closing punctuation at the start of a sentence to the previous one
+_REALIGN_RE = re.compile(r'["\')\]}]+?(?:\s+|(?=--)|$)')
+
+# punkt word tokenization, used to find the word after a candidate sentence end
+_PUNKT_NON_WORD = r"(?:[?!)\";}\]\*:@\'\({\[])"
+_PUNKT_MULTI_CHAR = r"(?:\-{2,}|\.{2,}|(?:\.\s){2,}\.)"
+_PUNKT_WORD_RE = re.compile(r"%(multi)s|(?=[^\(\"\`{\[:;&\#\*@\)}\]\-,])\S+?"
+                            r"(?=\s|$|%(non_word)s|%(multi)s|,(?=$|\s|%(non_word)s|%(multi)s))|\S"
+                            % {'multi': _PUNKT_MULTI_CHAR, 'non_word': _PUNKT_NON_WORD})
+_PUNKT_NUMBER_RE = re.compile(r'^-?[\.,]?\d[\d,\.-]*\.?$')
+_PUNKT_INITIAL_RE = re.compile(r'[^\W\d]\.$')
+_ORTHO_UC = 2 | 4 | 8
+_ORTHO_MID_UC = 4
+_ORTHO_BEG_LC = 16
+_ORTHO_LC = 16 | 32 | 64
+
+
+class RegexTokenizer(object):
+    """Regex tokenization giving the tokens of nltk_tokenize in one pass over the text.
+
+    Treebank word tokenization only depends on the sentence boundaries for
+    periods: a period ending a sentence is split off its word. Those
+    boundaries are decided with the parameters of the punkt model
+    (abbreviations, collocations, orthographic contexts) without punkt's
+    token annotation. Sentences with apostrophes, backquotes and English
+    contractions are tokenized with NLTK.
+    """
+
+    def __init__(self, language='english'):
+        self.params = nltk.data.load('tokenizers/punkt/%s.pickle' % language)._params
+
+    def __call__(self, sen):
+        if _DELEGATE_RE.search(sen):
+            return nltk_tokenize(sen)
+        tokens = []
+        for match in _TOKEN_RE.finditer(sen):
+            tok = match.group()
+            if tok == '"':
+                start = match.start()
+                tok = '``' if start == 0 or sen[start - 1] in ' ([{<' or self._sentence_start(sen, start) else "''"
+            elif tok.endswith('.') and not tok.endswith('..') and len(tok) > 1 \
+                    and self._sentence_end(tok, sen, match.end()):
+                tokens.append(tok[:-1])
+                tok = '.'
+            tokens.append(tok)
+        return tokens
+
+    def _sentence_start(self, sen, start):
+        # only a quote right after a period can start a sentence here
+        if _REALIGN_RE.match(sen, start):
+            return False
+        prev = _TOKEN_RE.findall(sen[:start])
+        return bool(prev) and prev[-1].endswith('.') and self._sentence_end(prev[-1], sen, start)
+
+    def _type(self, tok):
+        return _PUNKT_NUMBER_RE.sub('##number##', tok.lower())
+
+    def _ortho_heuristic(self, tok, typ):
+        if tok in ';:,.!?':
+            return False
+        ortho_context = self.params.ortho_context[typ]
+        if tok[0].isupper() and ortho_context & _ORTHO_LC and not ortho_context & _ORTHO_MID_UC:
+            return True
+        if tok[0].islower() and (ortho_context & _ORTHO_UC or not ortho_context & _ORTHO_BEG_LC):
+            return False
+        return 'unknown'
+
+    def _sentence_end(self, tok, sen, end):
+        """Whether the period ending tok at sen[end - 1] ends a sentence for punkt."""
+        rest = sen[end:]
+        if not rest.lstrip(_CLOSING_CHARS).strip():
+            return True
+        if rest[0].isspace():
+            if _REALIGN_RE.match(rest.lstrip()):
+                # the closing punctuation joins the sentence after a space, so the period is not last
+                return False
+            next_tok = _PUNKT_WORD_RE.match(rest.lstrip()).group()
+        elif re.match(_PUNKT_NON_WORD, rest):
+            next_tok = rest[0]
+        else:
+            return False
+
+        abbrev_types = self.params.abbrev_types
+        typ = self._type(tok)
+        typ_no_period = typ[:-1] if typ.endswith('.') else typ
+        abbr = tok[:-1].lower() in abbrev_types or tok[:-1].lower().split('-')[-1] in abbrev_types
+        next_typ = self._type(next_tok)
+        if len(next_typ) > 1 and next_typ.endswith('.') and not next_tok.endswith('..') and \
+                next_tok[:-1].lower() not in abbrev_types and \
+                next_tok[:-1].lower().split('-')[-1] not in abbrev_types:
+            next_typ = next_typ[:-1]
+
+        if (typ_no_period, next_typ) in self.params.collocations:
+            return False
+        is_initial = _PUNKT_INITIAL_RE.match(tok) is not None
+        if abbr and not is_initial:
+            if self._ortho_heuristic(next_tok, next_typ) is True:
+                return True
+            return next_tok[0].isupper() and next_typ in self.params.sent_starters
+        if is_initial or typ_no_period == '##number##':
+            is_sent_starter = self._ortho_heuristic(next_tok, next_typ)
+            if is_sent_starter is False:
+                return False
+            if is_sent_starter == 'unknown' and is_initial and next_tok[0].isupper() and \
+                    not self.params.ortho_context[next_typ] & _ORTHO_LC:
+                return False
+        return not abbr
+
+
+class Tokenizer(object):
+    """Tokenizer of the paraphraser with a memo of the last cache_size tokenized sentences.
+
+    name is 'nltk' or 'regex'. The regex tokenizer is compared with NLTK on
+    the first `check` sentences; on the first difference it is reported and
+    NLTK is used from then on. cache_size 0 disables the memo.
+    """
+
+    def __init__(self, name='nltk', cache_size=100000, check=1000):
+        self.name = name
+        self.check = check if name == 'regex' else 0
+        self.regex_tokenize = RegexTokenizer() if name == 'regex' else None
+        self.cache_size = max(cache_size, 0)
+        self.calls = 0
+        if self.cache_size:
+            self.tokenize = lru_cache(maxsize=self.cache_size)(self._tokenize)
+        else:
+            self.tokenize = self._tokenize
+
+    def _tokenize(self, sen):
+        self.calls += 1
+        if self.name == 'nltk':
+            return tuple(nltk_tokenize(sen))
+        tokens = tuple(self.regex_tokenize(sen))
+        if self.check > 0:
+            self.check -= 1
+            expected = tuple(nltk_tokenize(sen))
+            if tokens != expected:
+                print('[ regex tokenizer differs from NLTK on %r: %s != %s, using NLTK ]'
+                      % (sen, tokens, expected))
+                self.name = 'nltk'
+                self.check = 0
+                return expected
+        return tokens
+
+    def stats(self):
+        if self.cache_size:
+            info = self.tokenize.cache_info()
+            return {'tokenizer_cache_size': info.currsize,
+                    'tokenizer_cache_hits': info.hits,
+                    'tokenizer_cache_misses': info.misses}
+        return {'tokenizer_cache_size': 0,
+                'tokenizer_cache_hits': 0,
+                'tokenizer_cache_misses': self.calls}
+
+
+def compare_tokenizers(sentences, language='english'):
+    """Return (sentence, NLTK tokens, regex tokens) for the sentences the tokenizers disagree on."""
+    regex_tokenize = RegexTokenizer(language)
+    diffs = []
+    for sen in sentences:
+        expected, tokens = nltk_tokenize(sen), regex_tokenize(sen)
+        if tokens != expected:
+            diffs.append((sen, expected, tokens))
+    return diffs
@@ -6,6 +6,9 @@ def add_cmdline_args(parser):
     # Runtime environment
     agent = parser.add_argument_group('Paraphraser Arguments')
     agent.add_argument('--random_seed', type=int, default=1013)
+    agent.add_argument('--prefetch_depth', type=int, default=0,
+                       help='number of prepared batches to queue while the model trains on '
+                            'the previous one in a background thread, 0 to train synchronously')
 
     # Basics
     agent.add_argument('--pretrained_model', type=str, default=None,
@@ -20,6 +23,8 @@ def add_cmdline_args(parser):
     # Predictions
     agent.add_argument('--answ_maxlen', type=int, default=15,
                        help='Maximum answer length')
+    agent.add_argument('--answer_top_k', type=int, default=1,
+                       help='Number of best answers to reply with as text_candidates')
 
     # Optimizer
     agent.add_argument('--optimizer', type=str, default='Adam',
@@ -84,6 +89,9 @@ def add_cmdline_args(parser):
     # Basics
     agent.add_argument('--embedding_file', type=str, default=None,
                         help='File of space separated embeddings: w e1 ... ed')
+    agent.add_argument('--embedding_dtype', type=str, default='float32',
+                        choices=['float32', 'float16', 'int8'],
+                        help='dtype to keep word embeddings in memory with, int8 uses a scale per vector')
 
     # Additional features
     agent.add_argument('--use_in_question', type='bool', default=True,
@@ -93,6 +101,17 @@ def add_cmdline_args(parser):
     agent.add_argument('--use_time', type=int, default=0,
                         help='Time features marking how recent word was said')
 
+    # Preprocessing
+    agent.add_argument('--doc_cache_size', type=int, default=0,
+                        help='Number of tokenized and vectorized documents to keep for '
+                             'next questions about them, 0 to disable the cache. A document '
+                             'holds its embedded words, about 1.2 KB per token with 300-d embeddings')
+    agent.add_argument('--tokenizer_jobs', type=int, default=1,
+                        help='Number of processes to tokenize texts of a batch in')
+    agent.add_argument('--example_cache_dir', type=str, default=None,
+                        help='Directory to store tokenized and vectorized examples in, later epochs '
+                             'and runs with the same data and features read them instead')
+
 
 def set_defaults(opt):
     # Embeddings options
@@ -1,6 +1,7 @@
 import os
 import copy
 import numpy as np
+from multiprocessing import Pool
 
 
 try:
@@ -14,12 +15,32 @@ except ImportError:
 from parlai.core.agents import Agent
 from parlai.core.dict import DictionaryAgent
 from . import config
-from .utils import build_feature_dict, vectorize, batchify, normalize_text
+from .utils import build_feature_dict, vectorize, batchify, normalize_text, load_embedding_store
 import urllib
 
 
 NLP = spacy.load('en')
 
+# Worker processes are forked with the loaded NLP and kept for the next batches.
+_pool = None
+_pool_size = 0
+
+
+def _tokenize_texts(texts, batch_size=1000):
+    """Return (tokens, spans) of every text, tokenized in one stream."""
+    return [([t.text for t in doc], [(t.idx, t.idx + len(t.text)) for t in doc])
+            for doc in NLP.tokenizer.pipe(texts, batch_size=batch_size)]
+
+
+def _get_pool(n_jobs):
+    global _pool, _pool_size
+    if _pool_size != n_jobs:
+        if _pool is not None:
+            _pool.terminate()
+        _pool = Pool(n_jobs)
+        _pool_size = n_jobs
+    return _pool
+
 
 class SimpleDictionaryAgent(DictionaryAgent):
     """Override DictionaryAgent to use spaCy tokenizer."""
@@ -50,11 +71,7 @@ class SimpleDictionaryAgent(DictionaryAgent):
                     raise RuntimeError('Looks like the `EMBEDDINGS_URL` variable is set incorrectly', e)
 
             print('[ Indexing words with embeddings... ]')
-            self.embedding_words = set()
-            with open(self.opt['embedding_file']) as f:
-                for line in f:
-                    w = normalize_text(line.rstrip().split(' ')[0])
-                    self.embedding_words.add(w)
+            self.embedding_words, _ = load_embedding_store(self.opt)
             print('[ Num words in set = %d ]' %
                   len(self.embedding_words))
         else:
@@ -68,6 +85,17 @@ class SimpleDictionaryAgent(DictionaryAgent):
         tokens = NLP.tokenizer(text)
         return [(t.idx, t.idx + len(t.text)) for t in tokens]
 
+    def tokenize_batch(self, texts, n_jobs=1):
+        """Return (tokens, spans) of every text, streaming all texts through the tokenizer.
+        With n_jobs > 1 the texts are split between worker processes.
+        """
+        texts = list(texts)
+        if n_jobs <= 1 or len(texts) < 2 * n_jobs:
+            return _tokenize_texts(texts)
+        chunk = (len(texts) + n_jobs - 1) // n_jobs
+        chunks = [texts[i:i + chunk] for i in range(0, len(texts), chunk)]
+        return [res for part in _get_pool(n_jobs).map(_tokenize_texts, chunks) for res in part]
+
     def add_to_dict(self, tokens):
         """Builds dictionary from the list of provided tokens.
         Only adds words contained in self.embedding_words, if not None.
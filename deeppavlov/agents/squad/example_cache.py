@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import numpy as np
+
+CACHE_VERSION = 2
+
+KEY_SIZE = 20
+
+COLUMNS = ('keys', 'docs', 'target_bounds', 'targets', 'question_bounds', 'question_ids',
+           'feature_bounds', 'features', 'doc_bounds', 'doc_ids', 'doc_spans')
+
+
+def fingerprint(opt, word_dict, feature_dict):
+    """Hex digest of the dataset and the options that define the preprocessed examples."""
+    params = {
+        'version': CACHE_VERSION,
+        'task': opt.get('task'),
+        'use_in_question': opt['use_in_question'],
+        'use_tf': opt['use_tf'],
+        'use_time': opt['use_time'],
+        'inner_embeddings': opt['inner_embeddings'],
+        'features': sorted(feature_dict.items()),
+    }
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8'))
+    for token, _ in sorted(word_dict.tok2ind.items(), key=lambda item: item[1]):
+        digest.update(token.encode('utf-8') + b'\n')
+    return digest.hexdigest()
+
+
+def example_key(ex):
+    """Key of an observation: its text and labels."""
+    text = '\x00'.join([ex['text']] + list(ex.get('labels', ())))
+    return hashlib.sha1(text.encode('utf-8')).digest()
+
+
+def _target_list(targets):
+    return [(int(start), int(end)) for start, end in targets] if len(targets) else None
+
+
+class ExampleCache(object):
+    """Tokenized and vectorized examples stored on disk.
+
+    An example is kept as word indices of its document and question,
+    features of the document for the question, token spans of the document
+    and all candidate spans of the answer, so that the target can be chosen
+    among them whenever the example is used. Examples are written in segments, directories of
+    .npy columns that are memory-mapped on load; documents shared by several
+    questions are stored once per segment. Segments are written under a
+    temporary name and renamed, so a cache can be read while another
+    process adds to it.
+    """
+
+    def __init__(self, path, flush_every=10000):
+        self.path = path
+        self.flush_every = flush_every
+        self.segments = []
+        self.index = {}
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(path, exist_ok=True)
+        for name in sorted(os.listdir(path)):
+            if not name.startswith('.'):
+                self._load_segment(os.path.join(path, name))
+        self._reset_pending()
+
+    def _reset_pending(self):
+        self.pending = {}
+        self.pending_docs = {}
+
+    def _load_segment(self, dirname):
+        segment = {column: np.load(os.path.join(dirname, column + '.npy'), mmap_mode='r')
+                   for column in COLUMNS}
+        keys = np.ascontiguousarray(segment['keys']).tobytes()
+        n = len(self.segments)
+        self.segments.append(segment)
+        for i in range(len(segment['keys'])):
+            self.index[keys[i * KEY_SIZE:(i + 1) * KEY_SIZE]] = (n, i)
+
+    def __len__(self):
+        return len(self.index) + len(self.pending)
+
+    def __contains__(self, key):
+        return key in self.pending or key in self.index
+
+    def get(self, key):
+        """Return (doc_ids, doc_spans, question_ids, features, targets) of the example or None.
+        targets is the list of candidate answer spans, None for examples without labels.
+        """
+        if key in self.pending:
+            self.hits += 1
+            _, doc_ids, doc_spans, question_ids, features, targets = self.pending[key]
+            return doc_ids, doc_spans, question_ids, features, _target_list(targets)
+        if key not in self.index:
+            self.misses += 1
+            return
+        self.hits += 1
+        n, i = self.index[key]
+        segment = self.segments[n]
+        doc = segment['docs'][i]
+        doc_start, doc_end = segment['doc_bounds'][doc:doc + 2]
+        question_start, question_end = segment['question_bounds'][i:i + 2]
+        feature_start, feature_end = segment['feature_bounds'][i:i + 2]
+        target_start, target_end = segment['target_bounds'][i:i + 2]
+        targets = _target_list(segment['targets'][target_start:target_end])
+        return (segment['doc_ids'][doc_start:doc_end], segment['doc_spans'][doc_start:doc_end],
+                segment['question_ids'][question_start:question_end],
+                segment['features'][feature_start:feature_end], targets)
+
+    def add(self, key, doc_key, doc_ids, doc_spans, question_ids, features, targets=None):
+        """Add an example, doc_key identifies its document among the examples
+        and targets lists the candidate answer spans.
+        """
+        if key in self:
+            return
+        if doc_key not in self.pending_docs:
+            self.pending_docs[doc_key] = (len(self.pending_docs),
+                                          np.asarray(doc_ids, dtype='int32'),
+                                          np.asarray(doc_spans, dtype='int32').reshape(-1, 2))
+        doc, doc_ids, doc_spans = self.pending_docs[doc_key]
+        self.pending[key] = (doc, doc_ids, doc_spans, np.asarray(question_ids, dtype='int32'),
+                             np.asarray(features, dtype='float32'),
+                             np.asarray(targets or [], dtype='int64').reshape(-1, 2))
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        """Write the added examples as a new segment."""
+        if not self.pending:
+            return
+        examples = list(self.pending.items())
+        docs = sorted(self.pending_docs.values(), key=lambda doc: doc[0])
+
+        def bounds(arrays):
+            return np.cumsum([0] + [len(a) for a in arrays], dtype='int64')
+
+        questions = [ex[3] for _, ex in examples]
+        features = [ex[4] for _, ex in examples]
+        targets = [ex[5] for _, ex in examples]
+        columns = {
+            'keys': np.frombuffer(b''.join(key for key, _ in examples), dtype='uint8').reshape(-1, KEY_SIZE),
+            'docs': np.array([ex[0] for _, ex in examples], dtype='int32'),
+            'target_bounds': bounds(targets),
+            'targets': np.concatenate(targets).astype('int64').reshape(-1, 2),
+            'question_bounds': bounds(questions),
+            'question_ids': np.concatenate(questions).astype('int32'),
+            'feature_bounds': bounds(features),
+            'features': np.concatenate(features).astype('float32'),
+            'doc_bounds': bounds([doc[1] for doc in docs]),
+            'doc_ids': np.concatenate([doc[1] for doc in docs]).astype('int32'),
+            'doc_spans': np.concatenate([doc[2] for doc in docs]).astype('int32'),
+        }
+
+        name = '%d-%s' % (time.time() * 1e6, uuid.uuid4().hex)
+        tmp_dirname = os.path.join(self.path, '.' + name)
+        os.makedirs(tmp_dirname)
+        for column, array in columns.items():
+            np.save(os.path.join(tmp_dirname, column + '.npy'), array)
+        dirname = os.path.join(self.path, name)
+        os.rename(tmp_dirname, dirname)
+        self._reset_pending()
+        self._load_segment(dirname)
+
+    def stats(self):
+        return {'example_cache_size': len(self),
+                'example_cache_hits': self.hits,
+                'example_cache_misses': self.misses}
@@ -14,7 +14,8 @@ from keras.layers.recurrent import LSTM
 from keras.activations import softmax as Softmax
 from keras.optimizers import Adamax, Adam, Adadelta
 from keras.callbacks import ModelCheckpoint
-from .utils import AverageMeter, getOptimizer, score
+from .utils import AverageMeter, getOptimizer, score, decode_spans
+from deeppavlov.utils.dtypes import FLOAT_DTYPE, check_model_feed
 
 import tensorflow as tf
 from keras.backend.tensorflow_backend import set_session
@@ -88,7 +89,7 @@ class SquadModel(object):
     def update(self, batch):
 
         def cat(target):
-            dtype = K.floatx()
+            dtype = FLOAT_DTYPE
             indices = np.arange(len(target))
             classes = batch[0].shape[1]
             batch_target = [min(target[i], classes - 1) for i in indices]
@@ -99,6 +100,7 @@ class SquadModel(object):
 
         x, y = [batch[0], batch[1], batch[3], batch[2], batch[4]], [cat(batch[5]), cat(batch[6])]
 
+        check_model_feed(self.model, x, y)
         output = self.model.train_on_batch(x, y)
         self.train_loss.update(output[0])
         self.train_acc.update((output[3] + output[4])/2)
@@ -118,22 +120,30 @@ class SquadModel(object):
             self.train_em.update(scorer[0])
 
     def predict(self, batch):
+        """Answers to the questions of a batch."""
+        return [answers[0][0] if answers else '' for answers in self.predict_top_k(batch, 1)]
 
-        score_s, score_e = self.model.predict_on_batch([batch[0], batch[1], batch[3], batch[2], batch[4]])
+    def predict_top_k(self, batch, top_k):
+        """Lists of the top_k answers to each question of a batch as (text, score), best first."""
+        x = [batch[0], batch[1], batch[3], batch[2], batch[4]]
+        check_model_feed(self.model, x)
+        score_s, score_e = self.model.predict_on_batch(x)
 
         text = batch[-2]
         spans = batch[-1]
-        predictions = []
-
-        # Return predictions in the form of text
         max_len = self.answ_maxlen or score_s.shape[1]
+        starts, ends, scores = decode_spans(score_s, score_e, max_len, top_k, mask=batch[2])
 
-        for i in range(score_s.shape[0]):
-            scores = np.outer(score_s[i], score_e[i])
-            scores = np.tril(np.triu(scores), max_len-1)
-            s_ind, e_ind = np.unravel_index(np.argmax(scores), scores.shape)
-            s_offset, e_offset = spans[i][s_ind][0], spans[i][e_ind][1]
-            predictions.append(text[i][s_offset:e_offset])
+        # Return predictions in the form of text
+        predictions = []
+        for i in range(len(text)):
+            answers = []
+            for s_ind, e_ind, span_score in zip(starts[i], ends[i], scores[i]):
+                if span_score == -np.inf:
+                    break
+                s_offset, e_offset = spans[i][s_ind][0], spans[i][e_ind][1]
+                answers.append((text[i][s_offset:e_offset], float(span_score)))
+            predictions.append(answers)
 
         return predictions
 
@@ -1,6 +1,8 @@
 import copy
 import os
 import pickle
+import hashlib
+from collections import OrderedDict
 import numpy as np
 from numpy.random import seed
 from . import config
@@ -8,7 +10,12 @@ from .model import SquadModel
 from parlai.core.agents import Agent
 from parlai.core.params import class2str
 from .embeddings_dict import SimpleDictionaryAgent
-from .utils import build_feature_dict, vectorize, batchify, load_embeddings
+from .utils import build_feature_dict, vectorize, batchify, load_embeddings, VectorizedDocument, \
+    input_ids, embed_inputs
+from .example_cache import ExampleCache, fingerprint, example_key
+from deeppavlov.utils.quantization import quantize
+from deeppavlov.utils.token_cache import TokenCache
+from deeppavlov.utils.batch_pipeline import BatchPipeline
 
 class SquadAgent(Agent):
 
@@ -53,8 +60,17 @@ class SquadAgent(Agent):
             else:
                 self._init_from_scratch()
 
-        self.embeddings = load_embeddings(opt, word_dict)
+        self.embeddings = quantize(load_embeddings(opt, word_dict),
+                                   self.opt.get('embedding_dtype', 'float32'))
         self.n_examples = 0
+        self.doc_cache = TokenCache(self.opt.get('doc_cache_size', 0))
+        self.example_cache = None
+        if self.opt.get('example_cache_dir'):
+            path = os.path.join(self.opt['example_cache_dir'],
+                                fingerprint(self.opt, self.word_dict, self.feature_dict))
+            print('[ Caching preprocessed examples in %s ]' % path)
+            self.example_cache = ExampleCache(path)
+        self.pipeline = BatchPipeline(self.model.update, self.opt.get('prefetch_depth', 0))
 
 
     def _init_from_scratch(self):
@@ -104,7 +120,7 @@ class SquadAgent(Agent):
 
         reply = {'id': self.getID()}
 
-        ex = self._build_ex(self.observation)
+        ex = self._cached_ex(self.observation) or self._build_ex(self.observation)
         if ex is None:
             return reply
         batch = batchify(
@@ -114,9 +130,10 @@ class SquadAgent(Agent):
         # Either train or predict
         if 'labels' in self.observation:
             self.n_examples += 1
-            self.model.update(batch)
+            self.pipeline.put(batch)
         else:
-            reply['text'] = self.model.predict(batch)[0]
+            self.pipeline.join()
+            reply.update(self._predict(batch)[0])
 
         return reply
 
@@ -131,7 +148,7 @@ class SquadAgent(Agent):
         batch_reply = [{'id': self.getID()} for _ in range(batchsize)]
 
         # Some examples will be None (no answer found). Filter them.
-        examples = [self._build_ex(obs) for obs in observations]
+        examples = self._build_examples(observations)
         valid_inds = [i for i in range(batchsize) if examples[i] is not None]
         examples = [ex for ex in examples if ex is not None]
 
@@ -147,16 +164,18 @@ class SquadAgent(Agent):
         # Either train or predict
         if 'labels' in observations[0]:
             self.n_examples += len(examples)
-            self.model.update(batch)
+            self.pipeline.put(batch)
         else:
-            predictions = self.model.predict(batch)
+            self.pipeline.join()
+            predictions = self._predict(batch)
             for i in range(len(predictions)):
-                batch_reply[valid_inds[i]]['text'] = predictions[i]
+                batch_reply[valid_inds[i]].update(predictions[i])
 
         return batch_reply
 
     def drop_lr(self):
         ''' Reset optimizer and reset learning rate if validation score is not increasing'''
+        self.pipeline.join()
         self.model.model.optimizer.lr = self.model.model.optimizer.lr * self.opt['lr_drop']
 
     def save(self, fname=None):
@@ -164,14 +183,31 @@ class SquadAgent(Agent):
         fname = self.opt.get('model_file', None) if fname is None else fname
         if fname:
             print("[ saving model: " + fname + " ]")
+            self.pipeline.join()
             self.model.save(fname)
+        if self.example_cache is not None:
+            self.example_cache.flush()
 
     def report(self):
+        self.pipeline.join()
 
         output = (
             '[train] updates = %d | exs = %d | loss = %.4f | acc = %.4f' %
             (self.model.updates, self.n_examples,
              self.model.train_loss.avg, self.model.train_acc.avg))
+        stats = self.doc_cache.stats()
+        lookups = stats['cache_hits'] + stats['cache_misses']
+        if lookups:
+            output += ' | doc cache size = %d | hit rate = %.3f' % (
+                stats['cache_size'], stats['cache_hits'] / lookups)
+        if self.example_cache is not None:
+            stats = self.example_cache.stats()
+            output += ' | example cache size = %d | hits = %d | misses = %d' % (
+                stats['example_cache_size'], stats['example_cache_hits'], stats['example_cache_misses'])
+        if self.pipeline.depth:
+            stats = self.pipeline.stats()
+            output += ' | prefetch stall: producer = %.1fs | consumer = %.1fs' % (
+                stats['producer_stall_secs'], stats['consumer_stall_secs'])
 
         self.model.train_loss.reset()
         self.model.train_acc.reset()
@@ -180,51 +216,139 @@ class SquadAgent(Agent):
 
         return output
 
+    def shutdown(self):
+        if not self.is_shared:
+            self.pipeline.close()
+            if self.example_cache is not None:
+                self.example_cache.flush()
+
 
     # --------------------------------------------------------------------------
     # Helper functions.
     # --------------------------------------------------------------------------
 
-    def _build_ex(self, ex):
-        """Find the token span of the answer in the context for this example.
-        If a token span cannot be found, return None. Otherwise, torchify.
+    def _predict(self, batch):
+        """Reply fields with the answers to the questions of a batch."""
+        top_k = self.opt.get('answer_top_k', 1)
+        if top_k <= 1:
+            return [{'text': answer} for answer in self.model.predict(batch)]
+        predictions = []
+        for answers in self.model.predict_top_k(batch, top_k):
+            texts = [text for text, _ in answers]
+            predictions.append({'text': texts[0] if texts else '', 'text_candidates': texts})
+        return predictions
+
+    def _build_examples(self, observations):
+        """Build examples of a batch, tokenizing all their texts in one stream.
+        Examples found in the example cache are not tokenized again.
         """
-        # Check if empty input (end of epoch)
-        if not 'text' in ex:
+        cached = [self._cached_ex(ex) for ex in observations]
+        texts = []
+        for ex, cached_ex in zip(observations, cached):
+            if not 'text' in ex or cached_ex is not None:
+                continue
+            document, question = self._split_fields(ex)
+            if self._doc_key(document) not in self.doc_cache:
+                texts.append(document)
+            texts.append(question)
+            texts.extend(ex.get('labels', ()))
+        texts = list(OrderedDict.fromkeys(texts))
+        tokenized = dict(zip(texts, self.word_dict.tokenize_batch(texts, self.opt.get('tokenizer_jobs', 1))))
+        return [cached_ex if cached_ex is not None else self._build_ex(ex, tokenized)
+                for ex, cached_ex in zip(observations, cached)]
+
+    def _cached_ex(self, ex):
+        """Return the example of an observation from the example cache, None if it is not there."""
+        if self.example_cache is None or not 'text' in ex:
             return
-
-        # Split out document + question
-        inputs = {}
+        cached = self.example_cache.get(example_key(ex))
+        if cached is None:
+            return
+        doc_ids, spans, question_ids, features, targets = cached
+        inputs = (embed_inputs(self.opt, doc_ids, self.embeddings), features,
+                  embed_inputs(self.opt, question_ids, self.embeddings))
+        if targets is not None:
+            inputs += self._choose_target(targets)
+        document, _ = self._split_fields(ex)
+        return inputs + (document, spans)
+
+    def _split_fields(self, ex):
+        """Split out document + question."""
         fields = ex['text'].strip().split('\n')
 
         # Data is expected to be text + '\n' + question
         if len(fields) < 2:
             raise RuntimeError('Invalid input. Is task a QA task?')
 
-        document, question = ' '.join(fields[:-1]), fields[-1]
-        inputs['document'] = self.word_dict.tokenize(document)
-        inputs['question'] = self.word_dict.tokenize(question)
+        return ' '.join(fields[:-1]), fields[-1]
+
+    def _tokenize(self, text, tokenized=None):
+        if tokenized is not None and text in tokenized:
+            return tokenized[text][0]
+        return self.word_dict.tokenize(text)
+
+    def _build_ex(self, ex, tokenized=None):
+        """Find the token span of the answer in the context for this example.
+        If a token span cannot be found, return None. Otherwise, torchify.
+        tokenized maps texts tokenized in advance to their (tokens, spans).
+        """
+        # Check if empty input (end of epoch)
+        if not 'text' in ex:
+            return
+
+        inputs = {}
+        document, question = self._split_fields(ex)
+        vectorized = self._vectorize_document(document, tokenized)
+        inputs['document'] = vectorized.words
+        inputs['question'] = self._tokenize(question, tokenized)
         inputs['target'] = None
+        targets = None
 
         # Find targets (if labels provided).
         # Return if we were unable to find an answer.
         if 'labels' in ex:
-            inputs['target'] = self._find_target(inputs['document'],
-                                                 ex['labels'])
-            if inputs['target'] is None:
+            targets = self._find_targets(inputs['document'], ex['labels'], tokenized)
+            if len(targets) == 0:
                 return
+            inputs['target'] = self._choose_target(targets)
 
         # Vectorize.
-        inputs = vectorize(self.opt, inputs, self.word_dict, self.feature_dict, self.embeddings)
+        vectorized_ex = vectorize(self.opt, inputs, self.word_dict, self.feature_dict, self.embeddings,
+                                  vectorized)
+        if self.example_cache is not None:
+            self.example_cache.add(example_key(ex), self._doc_key(document), vectorized.ids,
+                                   vectorized.spans, input_ids(self.opt, inputs['question'], self.word_dict),
+                                   vectorized_ex[1], targets)
 
         # Return inputs with original text + spans (keep for prediction)
-        return inputs + (document, self.word_dict.span_tokenize(document))
+        return vectorized_ex + (document, vectorized.spans)
 
-    def _find_target(self, document, labels):
-        """Find the start/end token span for all labels in document.
-        Return a random one for training.
-        """
-        seed(1)
+    @staticmethod
+    def _doc_key(document):
+        return hashlib.sha1(document.encode('utf-8')).digest()
+
+    def _vectorize_document(self, document, tokenized=None):
+        """Tokenize and vectorize a document, reusing the result for questions about the same text."""
+        if self.opt.get('doc_cache_size', 0) <= 0:
+            return self._new_document(document, tokenized)
+        key = self._doc_key(document)
+        if self.doc_cache.lookup(key):
+            return self.doc_cache.get(key)
+        vectorized = self._new_document(document, tokenized)
+        self.doc_cache[key] = vectorized
+        self.doc_cache.shrink(protected=(key,))
+        return vectorized
+
+    def _new_document(self, document, tokenized=None):
+        if tokenized is not None and document in tokenized:
+            words, spans = tokenized[document]
+        else:
+            words, spans = self.word_dict.tokenize(document), self.word_dict.span_tokenize(document)
+        return VectorizedDocument(self.opt, words, self.word_dict, self.feature_dict,
+                                  self.embeddings, spans)
+
+    def _find_targets(self, document, labels, tokenized=None):
+        """Find the start/end token spans of all labels in document."""
         def _positions(d, l):
             for i in range(len(d)):
                 for j in range(i, min(len(d) - 1, i + len(l))):
@@ -232,7 +356,12 @@ class SquadAgent(Agent):
                         yield(i, j)
         targets = []
         for label in labels:
-            targets.extend(_positions(document, self.word_dict.tokenize(label)))
-        if len(targets) == 0:
-            return
+            targets.extend(_positions(document, self._tokenize(label, tokenized)))
+        return targets
+
+    def _choose_target(self, targets):
+        """Return a random span of the found ones for training.
+        Cached examples keep all spans and are passed through here as well.
+        """
+        seed(1)
         return targets[np.random.choice(len(targets))]
@@ -12,6 +12,9 @@ import re
 import string
 from collections import Counter
 from keras.optimizers import Adam, Adamax, Adadelta
+from deeppavlov.utils.embeddings_store import binary_exists, convert_text_to_binary, load_binary
+from deeppavlov.utils.quantization import dequantize
+from deeppavlov.utils.dtypes import FLOAT_DTYPE
 
 # ------------------------------------------------------------------------------
 # Optimizer presets.
@@ -42,24 +45,39 @@ def getOptimizer(optim, exp_decay, grad_norm_clip, lr = 0.001):
 def normalize_text(text):
     return unicodedata.normalize('NFD', text)
 
+_embedding_stores = {}
+
+
+def load_embedding_store(opt):
+    """Return (word2ind, matrix) of the binary store of opt['embedding_file'].
+    The text file is converted once into an indexed store with normalized
+    words and a memory-mapped float32 matrix, which is then shared by the
+    dictionary and the embeddings matrix builder.
+    """
+    fname = opt['embedding_file']
+    if fname not in _embedding_stores:
+        if not binary_exists(fname):
+            convert_text_to_binary(fname, opt['word_embedding_dim'], normalize=normalize_text)
+        _embedding_stores[fname] = load_binary(fname)
+    return _embedding_stores[fname]
+
+
 def load_embeddings(opt, word_dict):
     """Initialize embeddings from file of pretrained vectors."""
     seed(1)
-    embeddings = np.random.normal(0.0, 1.0, (len(word_dict), opt['word_embedding_dim']))
+    embeddings = np.random.normal(0.0, 1.0, (len(word_dict), opt['word_embedding_dim'])).astype(FLOAT_DTYPE)
 
     # Fill in embeddings
     if not opt.get('embedding_file'):
         raise RuntimeError('Tried to load embeddings with no embedding file.')
-    with open(opt['embedding_file']) as f:
-        for line in f:
-            parsed = line.rstrip().split(' ')
-            if len(parsed)==2:
-                continue
-            assert(len(parsed) == opt['word_embedding_dim'] + 1)
-            w = normalize_text(parsed[0])
-            if w in word_dict:
-                vec = np.array([float(i) for i in parsed[1:]])
-                embeddings[word_dict[w]] = vec
+    word2ind, matrix = load_embedding_store(opt)
+    assert(matrix.shape[1] == opt['word_embedding_dim'])
+    found = [(word2ind[w], i) for w, i in word_dict.tok2ind.items() if w in word2ind]
+    if found:
+        # read the needed rows of the store in file order
+        found.sort()
+        rows, inds = zip(*found)
+        embeddings[list(inds)] = matrix[list(rows)]
 
     # Zero NULL token
     embeddings[word_dict['__NULL__']] = np.zeros(opt['word_embedding_dim'])
@@ -85,66 +103,127 @@ def build_feature_dict(opt):
 # Torchified input utilities.
 # ------------------------------------------------------------------------------
 
-def embed_word(word, word_dict, embeddings):
-    seed(1)
-    try:
-        return embeddings[word_dict[word]]
-    except:
-        print('Unrecognized word!')
-        return np.random.normal(0, 1, size=(embeddings[0].shape[0]))
+_oov_vectors = {}
 
-def embed_index(word, word_dict):
-    try:
-        return word_dict[word]
-    except:
-        return len(word_dict)
 
+def oov_vector(dim):
+    """Vector of words missing from the embeddings, the same for every word.
+    It equals the normal sample drawn after seed(1), but is computed once
+    and does not reset the global random state.
+    """
+    if dim not in _oov_vectors:
+        _oov_vectors[dim] = np.random.RandomState(1).normal(0, 1, size=dim).astype(FLOAT_DTYPE)
+    return _oov_vectors[dim]
 
-def vectorize(opt, ex, word_dict, feature_dict, embeddings):
-    """Turn tokenized text inputs into feature vectors."""
 
-    # Old way is fo
-    if not opt['inner_embeddings']:
-        # Index words
-        document = np.array([embed_word(w, word_dict, embeddings) for w in ex['document']])
-        question = np.array([embed_word(w, word_dict, embeddings) for w in ex['question']])
-    elif opt['inner_embeddings']:
-        document = np.array([embed_index(w, word_dict) for w in ex['document']])
-        question = np.array([embed_index(w, word_dict) for w in ex['question']])
+def index_words(words, word_dict, default):
+    """Map words to their indices in word_dict, words without an index to default."""
+    ids = (word_dict[w] for w in words)
+    return np.fromiter((default if i is None else i for i in ids), dtype=np.int64, count=len(words))
 
-    # Create extra features vector
-    features = np.zeros((len(ex['document']), len(feature_dict)))
 
-    # f_{exact_match}
-    if opt['use_in_question']:
-        q_words_cased = set([w for w in ex['question']])
-        q_words_uncased = set([w.lower() for w in ex['question']])
-        for i in range(len(ex['document'])):
-            if ex['document'][i] in q_words_cased:
-                features[i][feature_dict['in_question']] = 1.0
-            if ex['document'][i].lower() in q_words_uncased:
-                features[i][feature_dict['in_question_uncased']] = 1.0
-
-    # f_{tf}
-    if opt['use_tf']:
-        counter = Counter([w.lower() for w in ex['document']])
-        l = len(ex['document'])
-        for i, w in enumerate(ex['document']):
-            features[i][feature_dict['tf']] = counter[w.lower()] * 1.0 / l
+def embed_words(ids, embeddings):
+    """Gather embeddings of word indices, indices out of embeddings get oov_vector."""
+    dim = embeddings.shape[1]
+    known = (ids >= 0) & (ids < len(embeddings))
+    vectors = np.empty((len(ids), dim), dtype=FLOAT_DTYPE)
+    vectors[known] = dequantize(embeddings[ids[known]])
+    vectors[~known] = oov_vector(dim)
+    return vectors
+
+
+def input_ids(opt, words, word_dict):
+    """Indices of words as model inputs, with inner embeddings unknown words get len(word_dict)."""
+    return index_words(words, word_dict, len(word_dict) if opt['inner_embeddings'] else -1)
 
-    # f_{time}
-    if opt['use_time'] > 0:
-        # Counting from the end, each (full-stop terminated) sentence gets
-        # its own time identitfier.
-        sent_idx = 0
-        def _full_stop(w):
-            return w in {'.', '?', '!'}
-        for i, w in reversed(list(enumerate(ex['document']))):
-            sent_idx = sent_idx + 1 if _full_stop(w) else max(sent_idx, 1)
-            if sent_idx < opt['use_time']:
-                features[i][feature_dict['time=T%d' % sent_idx]] = 1.0
-            else:
-                features[i][feature_dict['time>=T%d' % opt['use_time']]] = 1.0
+
+def embed_inputs(opt, ids, embeddings):
+    """Model inputs of word indices: the indices with inner embeddings, their embeddings otherwise."""
+    if opt['inner_embeddings']:
+        return ids
+    return embed_words(ids, embeddings)
+
+
+def _word_ids(words, vocab):
+    """Ids of words in vocab, new words are added to vocab."""
+    return np.fromiter((vocab.setdefault(w, len(vocab)) for w in words), dtype=np.int64, count=len(words))
+
+
+def _in_question(vocab, ids, question_words):
+    """Mask of document words (as ids in vocab) that occur in question_words."""
+    marks = np.zeros(len(vocab) + 1, dtype=bool)
+    marks[[vocab.get(w, len(vocab)) for w in question_words]] = True
+    marks[len(vocab)] = False
+    return marks[ids]
+
+
+class VectorizedDocument(object):
+    """Inputs and features of a document that do not depend on the question.
+    All questions about the same document can share one instance.
+    """
+
+    def __init__(self, opt, words, word_dict, feature_dict, embeddings, spans=None):
+        self.words = words
+        self.spans = spans
+        n = len(words)
+
+        # Index words
+        self.ids = input_ids(opt, words, word_dict)
+        self.inputs = embed_inputs(opt, self.ids, embeddings)
+
+        # Words of the document as ids of its own vocabulary
+        self.vocab_cased = {}
+        self.ids_cased = _word_ids(words, self.vocab_cased)
+        self.vocab_uncased = {}
+        self.ids_uncased = _word_ids([w.lower() for w in words], self.vocab_uncased)
+
+        # Create extra features vector
+        self.features = np.zeros((n, len(feature_dict)), dtype=FLOAT_DTYPE)
+
+        # f_{tf}
+        if opt['use_tf']:
+            self.features[:, feature_dict['tf']] = np.bincount(self.ids_uncased)[self.ids_uncased] * 1.0 / max(n, 1)
+
+        # f_{time}
+        if opt['use_time'] > 0:
+            # Counting from the end, each (full-stop terminated) sentence gets
+            # its own time identitfier.
+            full_stops = np.fromiter((w in ('.', '?', '!') for w in words), dtype=bool, count=n)
+            # an unterminated last sentence counts as the first one
+            sent_idx = np.cumsum(full_stops[::-1])[::-1] + (n > 0 and not full_stops[-1])
+            time_features = [feature_dict['time=T%d' % (i + 1)] for i in range(opt['use_time'] - 1)]
+            time_features.append(feature_dict['time>=T%d' % opt['use_time']])
+            columns = np.array(time_features)[np.minimum(sent_idx, opt['use_time']) - 1]
+            self.features[np.arange(n), columns] = 1.0
+
+    @property
+    def nbytes(self):
+        return (self.inputs.nbytes + self.features.nbytes + self.ids.nbytes +
+                self.ids_cased.nbytes + self.ids_uncased.nbytes)
+
+    def question_features(self, opt, question, feature_dict):
+        """Features of the document for a question."""
+        features = self.features.copy()
+
+        # f_{exact_match}
+        if opt['use_in_question']:
+            features[:, feature_dict['in_question']] = _in_question(
+                self.vocab_cased, self.ids_cased, question)
+            features[:, feature_dict['in_question_uncased']] = _in_question(
+                self.vocab_uncased, self.ids_uncased, [w.lower() for w in question])
+        return features
+
+
+def vectorize(opt, ex, word_dict, feature_dict, embeddings, document=None):
+    """Turn tokenized text inputs into feature vectors.
+    document is the VectorizedDocument of ex['document'] if it is already computed.
+    """
+    if document is None:
+        document = VectorizedDocument(opt, ex['document'], word_dict, feature_dict, embeddings)
+
+    question = embed_inputs(opt, input_ids(opt, ex['question'], word_dict), embeddings)
+    features = document.question_features(opt, ex['question'], feature_dict)
+    document = document.inputs
 
     # Maybe return without target
     if ex['target'] is None:
@@ -174,9 +253,9 @@ def batchify(batch, null=0):
     #print(docs[0].shape)
     max_length = max([d.shape[0] for d in docs])
     emb_dim = docs[0].shape[1]
-    x1 = np.zeros((len(docs), max_length, emb_dim))
-    x1_mask = np.zeros((len(docs), max_length))
-    x1_f = np.zeros((len(docs), max_length, features[0].shape[1]))
+    x1 = np.zeros((len(docs), max_length, emb_dim), dtype=FLOAT_DTYPE)
+    x1_mask = np.zeros((len(docs), max_length), dtype=FLOAT_DTYPE)
+    x1_f = np.zeros((len(docs), max_length, features[0].shape[1]), dtype=FLOAT_DTYPE)
     for i, d in enumerate(docs):
         x1[i, :d.shape[0], :] = d
         x1_mask[i, :d.shape[0]] = 1.0
@@ -184,8 +263,8 @@ def batchify(batch, null=0):
 
     # Batch questions
     max_length = max([q.shape[0] for q in questions])
-    x2 = np.zeros((len(questions), max_length, emb_dim))
-    x2_mask = np.zeros((len(questions), max_length))
+    x2 = np.zeros((len(questions), max_length, emb_dim), dtype=FLOAT_DTYPE)
+    x2_mask = np.zeros((len(questions), max_length), dtype=FLOAT_DTYPE)
     for i, q in enumerate(questions):
         x2[i, :q.shape[0], :] = q
         x2_mask[i, :q.shape[0]] = 1.0
@@ -204,6 +283,41 @@ def batchify(batch, null=0):
     raise RuntimeError('Wrong number of inputs per batch')
 
 
+def decode_spans(score_s, score_e, max_len, top_k=1, mask=None):
+    """Best answer spans of a batch given start and end scores of shape [batch, length].
+    Only spans with start <= end < start + max_len are scored, in a
+    [batch, length, max_len] band instead of a [length, length] product per
+    example; mask of shape [batch, length] excludes padding. Return starts,
+    ends and scores of the top_k spans of each example, [batch, top_k] each,
+    best first; missing spans have score -inf.
+    """
+    batch_size, length = score_s.shape
+    width = min(max_len, length)
+    ends = np.arange(length)[:, None] + np.arange(width)[None, :]
+    invalid = ends >= length
+    ends = np.minimum(ends, length - 1)
+    scores = score_s[:, :, None] * score_e[:, ends]
+    invalid = np.broadcast_to(invalid, scores.shape)
+    if mask is not None:
+        invalid = invalid | (mask[:, ends] == 0)
+    scores = np.where(invalid, -np.inf, scores).reshape(batch_size, -1)
+
+    rows = np.arange(batch_size)[:, None]
+    if top_k == 1:
+        best = np.argmax(scores, axis=1)[:, None]
+    else:
+        k = min(top_k, scores.shape[1])
+        best = np.sort(np.argpartition(-scores, k - 1, axis=1)[:, :k], axis=1)
+        # a stable sort keeps earlier spans first among equal scores, as argmax does
+        best = best[rows, np.argsort(-scores[rows, best], axis=1, kind='mergesort')]
+        # the partition picks any of the spans tied with the k-th best one
+        tied = (scores >= scores[rows, best[:, -1:]]).sum(axis=1) > k
+        if tied.any():
+            best[tied] = np.argsort(-scores[tied], axis=1, kind='mergesort')[:, :k]
+    starts, offsets = np.divmod(best, width)
+    return starts, starts + offsets, scores[rows, best]
+
+
 # ------------------------------------------------------------------------------
 # General logging utilities.
 # ------------------------------------------------------------------------------
@@ -6,13 +6,15 @@ import os
 import csv
 import sklearn.metrics
 import random
+from deeppavlov.utils.teacher_data import add_data_args, bucket_teacher_data, compact_shared
+from deeppavlov.utils.streaming import is_streaming, hash_fold, shuffle_buffer
 
 
 def _path(opt):
     # ensure data is built
     build(opt)
     # set up paths to data (specific to each dataset)
-    dt = 'test' if opt['datatype'] == 'test' else 'train'
+    dt = 'test' if opt['datatype'].split(':')[0] == 'test' else 'train'
     datafile = os.path.join(opt['datapath'], 'insults', dt + '.csv')
     return datafile
 
@@ -27,6 +29,9 @@ class DefaultTeacher(DialogTeacher):
         teacher.add_argument('--teacher-random-seed', type=int, default=270)
         teacher.add_argument('--bagging-fold-index', type=int)
         teacher.add_argument('--bagging-folds-number', type=int, default=5)
+        teacher.add_argument('--preprocessing-jobs', type=int, default=1,
+                             help='number of processes to normalize the dataset with')
+        add_data_args(teacher)
 
     def __init__(self, opt, shared=None):
         # store datatype
@@ -43,8 +48,16 @@ class DefaultTeacher(DialogTeacher):
         random.seed(opt.get('teacher_random_seed'))
         self.random_state = random.getstate()
         random.setstate(random_state)
-
-        super().__init__(opt, shared)
+        self.streaming = is_streaming(opt)
+        self.stream_random = random.Random(opt.get('teacher_random_seed'))
+
+        self.compact = bool(opt.get('compact_data')) and not self.streaming
+        if shared is None and self.compact:
+            self.opt = opt
+            # DialogTeacher takes the data from shared, as copies of the teacher do, instead of loading a list
+            super().__init__(opt, compact_shared(self, opt))
+        else:
+            super().__init__(opt, shared)
 
         if shared:
             self.observations = shared['observations']
@@ -59,25 +72,52 @@ class DefaultTeacher(DialogTeacher):
         shared['labels'] = self.labels
         return shared
 
+    def _example_length(self, episode):
+        """Number of tokens of the comment."""
+        return len(episode[0][0].split())
+
     def label_candidates(self):
         return self.answer_candidates
 
+    def _read_rows(self, path):
+        """Yield (comment, labels) of the csv file one by one."""
+        with open(path) as labels_file:
+            context = csv.reader(labels_file)
+            next(context)
+
+            for item in context:
+                label, text = item
+                yield text, [self.answer_candidates[int(label)]]
+
+    def _stream_data(self, path):
+        """Yield the examples of the bagging fold, read lazily and shuffled within a bounded buffer.
+        Folds are assigned by a hash of the comment, so no split of the whole dataset is kept in memory.
+        """
+        examples = self._read_rows(path)
+        if self.datatype_strict != 'test':
+            folds_number = self.opt.get('bagging_folds_number')
+            fold_index = self.opt.get('bagging_fold_index') or 0
+            seed = self.opt.get('teacher_random_seed')
+            in_fold = self.datatype_strict != 'train'
+            examples = (ex for ex in examples
+                        if (hash_fold(ex[0], folds_number, seed) == fold_index) == in_fold)
+        for ex in shuffle_buffer(examples, self.opt.get('shuffle_buffer_size', 10000), self.stream_random):
+            yield ex, True
+
     def setup_data(self, path):
         print('loading: ' + path)
+        if self.streaming:
+            yield from self._stream_data(path)
+            return
 
         questions = []
         y = []
 
         # open data file with labels
         # (path will be provided to setup_data from opt['datafile'] defined above)
-        with open(path) as labels_file:
-            context = csv.reader(labels_file)
-            next(context)
-
-            for item in context:
-                label, text = item
-                questions.append(text)
-                y.append([self.answer_candidates[int(label)]])
+        for text, labels in self._read_rows(path):
+            questions.append(text)
+            y.append(labels)
 
         episode_done = True
 
@@ -142,10 +182,18 @@ class DefaultTeacher(DialogTeacher):
 
     def reset(self):
         super().reset()
+        if self.streaming:
+            # streamed examples are shuffled while they are read
+            return
 
         random_state = random.getstate()
         random.setstate(self.random_state)
-        random.shuffle(self.data.data)
+        if self.compact:
+            self.data.shuffle(random.randrange(2 ** 32))
+        else:
+            random.shuffle(self.data.data)
+        if self.opt.get('length_buckets'):
+            bucket_teacher_data(self)
         self.random_state = random.getstate()
         random.setstate(random_state)
 
@@ -163,20 +211,20 @@ class FullTeacher(DefaultTeacher):
 
     def setup_data(self, path):
         print('loading: ' + path)
+        if self.streaming:
+            for ex in shuffle_buffer(self._read_rows(path), self.opt.get('shuffle_buffer_size', 10000),
+                                     self.stream_random):
+                yield ex, True
+            return
 
         questions = []
         y = []
 
         # open data file with labels
         # (path will be provided to setup_data from opt['datafile'] defined above)
-        with open(path) as labels_file:
-            context = csv.reader(labels_file)
-            next(context)
-
-            for item in context:
-                label, text = item
-                questions.append(text)
-                y.append([self.answer_candidates[int(label)]])
+        for text, labels in self._read_rows(path):
+            questions.append(text)
+            y.append(labels)
 
         episode_done = True
 
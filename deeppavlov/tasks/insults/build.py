@@ -1,105 +1,14 @@
 import parlai.core.build_data as build_data
 import os
-import re
-import string
 import numpy as np
 import pandas as pd
 import urllib
+from .normalizer import normalize_batch
 
 
-def data_preprocessing(f):
-    f = [x.lower() for x in f]
-    f = [x[1:-1] for x in f]
-    f = [x.replace("\\n", " ") for x in f]
-    f = [x.replace("\\t", " ") for x in f]
-    f = [x.replace("\\xa0", " ") for x in f]
-    f = [x.replace("\\xc2", " ") for x in f]
-
-    f = [re.sub('!!+', ' !! ', x) for x in f]
-    f = [re.sub('!', ' ! ', x) for x in f]
-    f = [re.sub('! !', '!!', x) for x in f]
-
-    f = [re.sub('\?\?+', ' ?? ', x) for x in f]
-    f = [re.sub('\?', ' ? ', x) for x in f]
-    f = [re.sub('\? \?', '??', x) for x in f]
-
-    f = [re.sub('\?!+', ' ?! ', x) for x in f]
-
-    f = [re.sub('\.\.+', '..', x) for x in f]
-    f = [re.sub('\.', ' . ', x) for x in f]
-    f = [re.sub('\.  \.', '..', x) for x in f]
-
-    f = [re.sub(',', ' , ', x) for x in f]
-    f = [re.sub(':', ' : ', x) for x in f]
-    f = [re.sub(';', ' ; ', x) for x in f]
-    f = [re.sub('\%', ' % ', x) for x in f]
-
-    f = [x.replace("$", "s") for x in f]
-    f = [x.replace(" u ", " you ") for x in f]
-    f = [x.replace(" em ", " them ") for x in f]
-    f = [x.replace(" da ", " the ") for x in f]
-    f = [x.replace(" yo ", " you ") for x in f]
-    f = [x.replace(" ur ", " your ") for x in f]
-    f = [x.replace("you\'re", "you are") for x in f]
-    f = [x.replace(" u r ", " you are ") for x in f]
-    f = [x.replace("yo\'re", " you are ") for x in f]
-    f = [x.replace("yu\'re", " you are ") for x in f]
-    f = [x.replace("u\'re", " you are ") for x in f]
-    f = [x.replace(" urs ", " yours ") for x in f]
-    f = [x.replace("y'all", "you all") for x in f]
-
-    f = [x.replace(" r u ", " are you ") for x in f]
-    f = [x.replace(" r you", " are you") for x in f]
-    f = [x.replace(" are u ", " are you ") for x in f]
-
-    f = [x.replace(" mom ", " mother ") for x in f]
-    f = [x.replace(" momm ", " mother ") for x in f]
-    f = [x.replace(" mommy ", " mother ") for x in f]
-    f = [x.replace(" momma ", " mother ") for x in f]
-    f = [x.replace(" mama ", " mother ") for x in f]
-    f = [x.replace(" mamma ", " mother ") for x in f]
-    f = [x.replace(" mum ", " mother ") for x in f]
-    f = [x.replace(" mummy ", " mother ") for x in f]
-
-    f = [x.replace("won't", "will not") for x in f]
-    f = [x.replace("can't", "cannot") for x in f]
-    f = [x.replace("i'm", "i am") for x in f]
-    f = [x.replace(" im ", " i am ") for x in f]
-    f = [x.replace("ain't", "is not") for x in f]
-    f = [x.replace("'ll", " will") for x in f]
-    f = [x.replace("'t", " not") for x in f]
-    f = [x.replace("'ve", " have") for x in f]
-    f = [x.replace("'s", " is") for x in f]
-    f = [x.replace("'re", " are") for x in f]
-    f = [x.replace("'d", " would") for x in f]
-
-    # replace multiple letters (3 and more) by 2 letters
-    for letter in string.ascii_lowercase:
-        f = [re.sub(letter * 3 + '+', letter, x).strip() for x in f]
-
-    bad_words_file = open(os.path.join(os.path.dirname(os.path.realpath(__file__)), "badwords.txt"), "r")
-    bwMap = dict()
-    for line in bad_words_file:
-        sp = line.strip().lower().split(",")
-        if len(sp) == 2:
-            bwMap[sp[0].strip()] = sp[1].strip()
-
-    for key, value in bwMap.items():
-        kpad = " " + key + " "
-        vpad = " " + value + " "
-        f = [x.replace(kpad, vpad) for x in f]
-
-    # stemming
-    f = [re.sub("ies( |$)", "y ", x) for x in f]
-    f = [re.sub("s( |$)", " ", x) for x in f]
-    f = [re.sub("ing( |$)", " ", x) for x in f]
-    f = [x.replace("tard ", " ") for x in f]
-
-    f = [re.sub(" [*$%&#@][*$%&#@]+", " xexp ", x) for x in f]
-    f = [re.sub(" [0-9]+ ", " DD ", x) for x in f]
-    f = [re.sub("<\S*>", "", x) for x in f]
-    f = [re.sub('\s+', ' ', x) for x in f]
-    return f
+def data_preprocessing(f, n_jobs=1):
+    """Normalize comments, see normalizer.TextNormalizer for the steps."""
+    return normalize_batch(f, n_jobs)
 
 
 def write_input_fasttext_cls(data, path, data_name):
@@ -199,9 +108,11 @@ def build(opt):
                                                                              train_data['Insult'], ratio=1)
 
         print('Preprocessing train')
-        train_data['Comment'] = data_preprocessing(train_data['Comment'])
+        train_data['Comment'] = data_preprocessing(train_data['Comment'],
+                                                   opt.get('preprocessing_jobs', 1))
         print('Preprocessing test')
-        test_data['Comment'] = data_preprocessing(test_data['Comment'])
+        test_data['Comment'] = data_preprocessing(test_data['Comment'],
+                                                  opt.get('preprocessing_jobs', 1))
 
         print('Writing input files for fasttext')
         write_input_fasttext_cls(train_data, os.path.join(dpath, 'train'), 'train')
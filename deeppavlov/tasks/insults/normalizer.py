@@ -0,0 +1,201 @@
+import os
+import re
+from multiprocessing import Pool
+
+
+BAD_WORDS_FILE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "badwords.txt")
+
+
+def load_bad_words(fname=BAD_WORDS_FILE):
+    bw_map = dict()
+    with open(fname, "r") as bad_words_file:
+        for line in bad_words_file:
+            sp = line.strip().lower().split(",")
+            if len(sp) == 2:
+                bw_map[sp[0].strip()] = sp[1].strip()
+    return bw_map
+
+
+class BadWordsReplacer(object):
+    """Replaces " key " with " value " for every key of the bad words map,
+    giving the same result as calling str.replace for all keys in map order.
+
+    Keys are stored in a trie, and one pass of a regular expression compiled
+    from the trie finds the keys that occur in a string. Only these keys are
+    replaced; after every change the string is scanned again for the keys
+    that follow, since a replacement can create or consume their occurrences.
+    """
+
+    END = ''
+
+    def __init__(self, bw_map):
+        self.replacements = [(' ' + key + ' ', ' ' + value + ' ') for key, value in bw_map.items()]
+        self.key2ind = {key: i for i, key in enumerate(bw_map)}
+        self.trie = {}
+        for key in bw_map:
+            node = self.trie
+            for ch in key:
+                node = node.setdefault(ch, {})
+            node[self.END] = True
+        # Children of a trie node are tried in sorted order and the end of a key
+        # last, so the longest key at a position is matched. Shorter keys found
+        # at the same position are the prefixes of that key followed by a space.
+        self.pattern = re.compile(' (?=(%s) )' % self._trie_pattern(self.trie)) if bw_map else None
+        self.prefix_keys = {}
+        for key, i in self.key2ind.items():
+            self.prefix_keys[key] = [i] + [self.key2ind[key[:pos]] for pos, ch in enumerate(key)
+                                           if ch == ' ' and key[:pos] in self.key2ind]
+
+    def _trie_pattern(self, node):
+        alternatives = [re.escape(ch) + self._trie_pattern(child)
+                        for ch, child in sorted(node.items()) if ch != self.END]
+        if self.END in node:
+            alternatives.append('')
+        if len(alternatives) == 1:
+            return alternatives[0]
+        return '(?:%s)' % '|'.join(alternatives)
+
+    def _find(self, x, after=-1):
+        """Sorted indices greater than after of keys that occur in x padded with spaces."""
+        found = set()
+        for key in self.pattern.findall(x):
+            found.update(self.prefix_keys[key])
+        return sorted(i for i in found if i > after)
+
+    def __call__(self, x):
+        if self.pattern is None:
+            return x
+        keys = self._find(x)
+        while keys:
+            i = keys.pop(0)
+            key, value = self.replacements[i]
+            replaced = x.replace(key, value)
+            if replaced != x:
+                x = replaced
+                keys = self._find(x, i)
+        return x
+
+
+class TextNormalizer(object):
+    """Normalization of insults comments, compiled once and applied in one pass per string.
+
+    Steps that do not affect each other are merged into a single regular
+    expression, order dependent steps are kept in their order, so the result
+    is identical to applying every replacement to the whole corpus in turn.
+    """
+
+    def __init__(self, bw_map=None):
+        self.escapes = re.compile(r'\\(?:n|t|xa0|xc2)')
+
+        self.punctuation = [
+            (re.compile('!!+'), ' !! '),
+            (re.compile('!'), ' ! '),
+            (re.compile('! !'), '!!'),
+
+            (re.compile(r'\?\?+'), ' ?? '),
+            (re.compile(r'\?'), ' ? '),
+            (re.compile(r'\? \?'), '??'),
+
+            (re.compile(r'\?!+'), ' ?! '),
+
+            (re.compile(r'\.\.+'), '..'),
+            (re.compile(r'\.'), ' . '),
+            (re.compile(r'\.  \.'), '..'),
+
+            (re.compile('[,:;%]'), r' \g<0> '),
+        ]
+
+        self.replacements = [
+            ("$", "s"),
+            (" u ", " you "),
+            (" em ", " them "),
+            (" da ", " the "),
+            (" yo ", " you "),
+            (" ur ", " your "),
+            ("you\'re", "you are"),
+            (" u r ", " you are "),
+            ("yo\'re", " you are "),
+            ("yu\'re", " you are "),
+            ("u\'re", " you are "),
+            (" urs ", " yours "),
+            ("y'all", "you all"),
+
+            (" r u ", " are you "),
+            (" r you", " are you"),
+            (" are u ", " are you "),
+
+            (" mom ", " mother "),
+            (" momm ", " mother "),
+            (" mommy ", " mother "),
+            (" momma ", " mother "),
+            (" mama ", " mother "),
+            (" mamma ", " mother "),
+            (" mum ", " mother "),
+            (" mummy ", " mother "),
+
+            ("won't", "will not"),
+            ("can't", "cannot"),
+            ("i'm", "i am"),
+            (" im ", " i am "),
+            ("ain't", "is not"),
+            ("'ll", " will"),
+            ("'t", " not"),
+            ("'ve", " have"),
+            ("'s", " is"),
+            ("'re", " are"),
+            ("'d", " would"),
+        ]
+
+        # replace multiple letters (3 and more) by 1 letter
+        self.repeated_letters = re.compile(r'([a-z])\1\1+')
+
+        self.bad_words = BadWordsReplacer(load_bad_words() if bw_map is None else bw_map)
+
+        self.stemming = [
+            (re.compile("ies( |$)"), "y "),
+            (re.compile("s( |$)"), " "),
+            (re.compile("ing( |$)"), " "),
+        ]
+
+        self.final = [
+            (re.compile(" [*$%&#@][*$%&#@]+"), " xexp "),
+            (re.compile(" [0-9]+ "), " DD "),
+            (re.compile(r"<\S*>"), ""),
+            (re.compile(r'\s+'), ' '),
+        ]
+
+    def __call__(self, x):
+        x = x.lower()[1:-1]
+        x = self.escapes.sub(' ', x)
+        for pattern, repl in self.punctuation:
+            x = pattern.sub(repl, x)
+        for old, new in self.replacements:
+            x = x.replace(old, new)
+        x = self.repeated_letters.sub(r'\1', x).strip()
+        x = self.bad_words(x)
+        for pattern, repl in self.stemming:
+            x = pattern.sub(repl, x)
+        x = x.replace("tard ", " ")
+        for pattern, repl in self.final:
+            x = pattern.sub(repl, x)
+        return x
+
+
+_normalizer = None
+
+
+def normalize(x):
+    """Normalize one comment with the process-wide TextNormalizer."""
+    global _normalizer
+    if _normalizer is None:
+        _normalizer = TextNormalizer()
+    return _normalizer(x)
+
+
+def normalize_batch(texts, n_jobs=1, chunksize=256):
+    """Normalize a list of comments, in n_jobs worker processes if n_jobs > 1."""
+    texts = list(texts)
+    if n_jobs > 1 and len(texts) > chunksize:
+        with Pool(n_jobs) as pool:
+            return pool.map(normalize, texts, chunksize=chunksize)
+    return [normalize(x) for x in texts]
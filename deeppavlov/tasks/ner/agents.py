@@ -19,6 +19,8 @@ from .build import build
 import os
 import xml.etree.ElementTree as ET
 import random
+from deeppavlov.utils.teacher_data import add_data_args, bucket_teacher_data, compact_shared
+from deeppavlov.utils.streaming import is_streaming, record_hash, shuffle_buffer
 from .metric import CoNLLClassificationMetrics
 
 
@@ -46,14 +48,21 @@ class DefaultTeacher(DialogTeacher):
         random.seed(opt.get('teacher_seed'))
         self.random_state = random.getstate()
         random.setstate(random_state)
+        self.streaming = is_streaming(opt)
+        self.stream_random = random.Random(opt.get('teacher_seed'))
 
         if shared and shared.get('metrics'):
             self.metrics = shared['metrics']
         else:
             self.metrics = CoNLLClassificationMetrics(opt['model_file'])
 
+        self.compact = bool(opt.get('compact_data')) and not self.streaming
         # define standard question, since it doesn't change for this task
-        super().__init__(opt, shared)
+        if shared is None and self.compact:
+            # DialogTeacher takes the data from shared, as copies of the teacher do, instead of loading a list
+            super().__init__(opt, compact_shared(self, opt))
+        else:
+            super().__init__(opt, shared)
 
     @staticmethod
     def add_cmdline_args(argparser):
@@ -64,6 +73,11 @@ class DefaultTeacher(DialogTeacher):
         group.add_argument('--train-part', type=int, default=0.8)
         group.add_argument('--valid-part', type=int, default=0.1)
         group.add_argument('--test-part', type=int, default=0.1)
+        add_data_args(group)
+
+    def _example_length(self, episode):
+        """Number of tokens of the sentence."""
+        return len(episode[0][0].split())
 
     @staticmethod
     def split_sentences(x, y):
@@ -85,14 +99,8 @@ class DefaultTeacher(DialogTeacher):
             prev_token = tok
         return sentences, tags
 
-    def setup_data(self, path):
-        print('loading: ' + path)
-
-        questions = []
-        y = []
-        # open data file with labels
-        # (path will be provided to setup_data from opt['datafile'] defined above)
-
+    def _read_docs(self, path):
+        """Yield (tokens, tags) of the documents of the heap file one by one."""
         with open(path) as heap_file:
             tokens_long = []
             tags_long = []
@@ -102,11 +110,44 @@ class DefaultTeacher(DialogTeacher):
                     tokens_long.append(token)
                     tags_long.append(tag)
                 else:
-                    questions.append(' '.join(tokens_long))
-                    y.append([' '.join(tags_long)])
+                    yield ' '.join(tokens_long), [' '.join(tags_long)]
                     tokens_long = []
                     tags_long = []
 
+    def _part(self):
+        """Bounds of the datatype's part of the dataset as fractions."""
+        if self.dt == 'train':
+            return [0, self.parts[0]]
+        elif self.dt == 'test':
+            return [self.parts[0], sum(self.parts[0:2])]
+        elif self.dt == 'valid':
+            return [sum(self.parts[0:2]), 1]
+
+    def _stream_data(self, path):
+        """Yield the documents of the datatype's part, read lazily and shuffled within a bounded buffer.
+        Parts are assigned by a hash of the document, so the dataset is never held in memory.
+        """
+        start, end = self._part()
+        seed = self.opt.get('teacher_seed')
+        docs = (doc for doc in self._read_docs(path) if start <= record_hash(doc[0], seed) < end)
+        for doc in shuffle_buffer(docs, self.opt.get('shuffle_buffer_size', 10000), self.stream_random):
+            yield doc, True
+
+    def setup_data(self, path):
+        print('loading: ' + path)
+        if self.streaming:
+            yield from self._stream_data(path)
+            return
+
+        questions = []
+        y = []
+        # open data file with labels
+        # (path will be provided to setup_data from opt['datafile'] defined above)
+
+        for question, tags in self._read_docs(path):
+            questions.append(question)
+            y.append(tags)
+
         questions_and_ys = list(zip(questions, y))
         random_state = random.getstate()
         random.setstate(self.random_state)
@@ -115,12 +156,7 @@ class DefaultTeacher(DialogTeacher):
         random.setstate(random_state)
         questions, y = list(zip(*questions_and_ys))
 
-        if self.dt == 'train':
-            part = [0, self.parts[0]]
-        elif self.dt == 'test':
-            part = [self.parts[0], sum(self.parts[0:2])]
-        elif self.dt == 'valid':
-            part = [sum(self.parts[0:2]), 1]
+        part = self._part()
         episode_done = True
 
         n_docs = len(questions)
@@ -139,9 +175,19 @@ class DefaultTeacher(DialogTeacher):
             yield (questions[i], y[i]), episode_done
 
     def reset(self):
+        if self.streaming:
+            # streamed documents are shuffled while they are read
+            super().reset()
+            return
+
         random_state = random.getstate()
         random.setstate(self.random_state)
-        random.shuffle(self.data.data)
+        if self.compact:
+            self.data.shuffle(random.randrange(2 ** 32))
+        else:
+            random.shuffle(self.data.data)
+        if self.opt.get('length_buckets'):
+            bucket_teacher_data(self)
         self.random_state = random.getstate()
         random.setstate(random_state)
 
@@ -22,6 +22,8 @@ import os
 import csv
 from sklearn.model_selection import KFold
 import random
+from deeppavlov.utils.teacher_data import add_data_args, bucket_teacher_data, compact_shared
+from deeppavlov.utils.streaming import is_streaming, hash_fold, shuffle_buffer
 
 
 def _path(opt):
@@ -46,6 +48,7 @@ class DefaultTeacher(DialogTeacher):
         teacher.add_argument('--teacher-random-seed', type=int, default=71)
         teacher.add_argument('--bagging-fold-index', type=int)
         teacher.add_argument('--bagging-folds-number', type=int, default=5)
+        add_data_args(teacher)
 
     def __init__(self, opt, shared=None):
         # store datatype
@@ -64,34 +67,70 @@ class DefaultTeacher(DialogTeacher):
         random.seed(opt.get('teacher_random_seed'))
         self.random_state = random.getstate()
         random.setstate(random_state)
+        self.streaming = is_streaming(opt)
+        self.stream_random = random.Random(opt.get('teacher_random_seed'))
 
         if shared and shared.get('metrics'):
             self.metrics = shared['metrics']
         else:
             self.metrics = BinaryClassificationMetrics('Да')
 
-        super().__init__(opt, shared)
+        self.compact = bool(opt.get('compact_data')) and not self.streaming
+        if shared is None and self.compact:
+            self.opt = opt
+            # DialogTeacher takes the data from shared, as copies of the teacher do, instead of loading a list
+            super().__init__(opt, compact_shared(self, opt))
+        else:
+            super().__init__(opt, shared)
+
+    def _example_length(self, episode):
+        """Number of tokens of the longer sentence, each sentence is padded separately."""
+        return max(len(sentence.split()) for sentence in episode[0][0].split('\n')[1:])
 
     def label_candidates(self):
         return self.answer_candidates
 
+    def _read_rows(self, path):
+        """Yield (sentence pair, labels) of the tsv file one by one."""
+        with open(path) as labels_file:
+            tsv_reader = csv.reader(labels_file, delimiter='\t')
+
+            for row in tsv_reader:
+                if len(row) != 3:
+                    print('Warn: expected 3 columns in a tsv row, got ' + str(row))
+                    continue
+                yield row[1] + '\n' + row[2], ['Да' if row[0] == '1' else 'Нет']
+
+    def _stream_data(self, path):
+        """Yield the examples of the bagging fold, read lazily and shuffled within a bounded buffer.
+        Folds are assigned by a hash of the sentence pair, so no split of the whole dataset is kept in memory.
+        """
+        examples = self._read_rows(path)
+        if self.datatype_strict != 'test':
+            folds_number = self.opt.get('bagging_folds_number')
+            fold_index = self.opt.get('bagging_fold_index') or 0
+            seed = self.opt.get('teacher_random_seed')
+            in_fold = self.datatype_strict != 'train'
+            examples = (ex for ex in examples
+                        if (hash_fold(ex[0], folds_number, seed) == fold_index) == in_fold)
+        for question, labels in shuffle_buffer(examples, self.opt.get('shuffle_buffer_size', 10000),
+                                               self.stream_random):
+            yield (self.question + "\n" + question, labels), True
+
     def setup_data(self, path):
         print('loading: ' + path)
+        if self.streaming:
+            yield from self._stream_data(path)
+            return
 
         questions = []
         y = []
 
         # open data file with labels
         # (path will be provided to setup_data from opt['datafile'] defined above)
-        with open(path) as labels_file:
-            tsv_reader = csv.reader(labels_file, delimiter='\t')
-
-            for row in tsv_reader:
-                if len(row) != 3:
-                    print('Warn: expected 3 columns in a tsv row, got ' + str(row))
-                    continue
-                y.append(['Да' if row[0] == '1' else 'Нет'])
-                questions.append(row[1] + '\n' + row[2])
+        for question, labels in self._read_rows(path):
+            questions.append(question)
+            y.append(labels)
 
         episode_done = True
         if not y:
@@ -120,9 +159,17 @@ class DefaultTeacher(DialogTeacher):
 
     def reset(self):
         super().reset()
+        if self.streaming:
+            # streamed examples are shuffled while they are read
+            return
 
         random_state = random.getstate()
         random.setstate(self.random_state)
-        random.shuffle(self.data.data)
+        if self.compact:
+            self.data.shuffle(random.randrange(2 ** 32))
+        else:
+            random.shuffle(self.data.data)
+        if self.opt.get('length_buckets'):
+            bucket_teacher_data(self)
         self.random_state = random.getstate()
         random.setstate(random_state)
@@ -0,0 +1,137 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import time
+import threading
+from queue import Queue
+
+try:
+    import tensorflow as tf
+except ImportError:
+    tf = None
+
+
+_STOP = object()
+
+
+class BatchPipeline(object):
+    """Trains a model on prepared batches in a background thread.
+
+    An agent prepares a batch (tokenization, embedding, padding) and passes
+    it to `put`; `consume(batch)` (the model update) runs in a worker thread,
+    so the agent can prepare the next batches while the model trains on the
+    previous one. Up to `depth` prepared batches wait for the worker; with
+    depth 0 batches are consumed synchronously in `put`.
+
+    The model is used by one thread at a time: consume runs under a lock, and
+    the agent calls the model between updates with `call`.
+
+    Stall metrics: producer stall is the time `put` waited because `depth`
+    batches were already queued (training is the bottleneck), consumer stall
+    is the time the worker waited for a batch (preparation is the bottleneck).
+    """
+
+    def __init__(self, consume, depth=0):
+        self.consume = consume
+        self.depth = depth
+        self.batches = 0
+        self.producer_stall = 0.
+        self.consumer_stall = 0.
+        self.error = None
+        self.idle = True
+        self.queue = None
+        self.thread = None
+        self.lock = threading.Lock()
+        # Keras models have to be used in the graph they were built in
+        self.graph = tf.get_default_graph() if tf is not None else None
+
+    def _start(self):
+        self.queue = Queue(maxsize=self.depth)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        if self.graph is None:
+            return self._loop()
+        with self.graph.as_default():
+            return self._loop()
+
+    def _loop(self):
+        while True:
+            start = time.time()
+            batch = self.queue.get()
+            if not self.idle:
+                self.consumer_stall += time.time() - start
+            self.idle = False
+            try:
+                if batch is _STOP:
+                    return
+                if self.error is None:
+                    with self.lock:
+                        self.consume(batch)
+            except BaseException as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    def put(self, batch):
+        """Queue a prepared batch for the model, blocking while the queue is full."""
+        self._raise()
+        if self.depth <= 0 or self.batches == 0:
+            # the first batch is consumed in the calling thread, so that lazily
+            # built train functions are created before the worker starts
+            self.consume(batch)
+        else:
+            if self.thread is None:
+                self._start()
+            start = time.time()
+            self.queue.put(batch)
+            self.producer_stall += time.time() - start
+        self.batches += 1
+
+    def call(self, fn, *args):
+        """Call fn (e.g. a prediction with the model) while no batch is being consumed."""
+        with self.lock:
+            return fn(*args)
+
+    def join(self):
+        """Wait until the model is trained on all queued batches.
+        Call it before the model is used for prediction, saved or changed.
+        """
+        if self.thread is not None:
+            self.queue.join()
+            # waiting for batches after a join is not a stall
+            self.idle = True
+        self._raise()
+
+    def _raise(self):
+        if self.error is not None:
+            error, self.error = self.error, None
+            raise error
+
+    def stats(self):
+        return {'prefetch_depth': self.depth,
+                'prefetch_batches': self.batches,
+                'producer_stall_secs': self.producer_stall,
+                'consumer_stall_secs': self.consumer_stall}
+
+    def close(self):
+        """Train on the queued batches and stop the worker thread."""
+        if self.thread is not None:
+            self.queue.put(_STOP)
+            self.thread.join()
+            self.thread = None
+        self._raise()
@@ -0,0 +1,51 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+from .dtypes import FLOAT_DTYPE
+
+
+class BufferPool(object):
+    """Arrays reused for batches instead of allocating new ones per batch.
+
+    Every key has `slots` arrays handed out in rotation, so an array is
+    returned again only after `slots - 1` other calls for the same key: up
+    to `slots` batches of a key (e.g. queued for training) can be alive at
+    once. Arrays are contiguous views of the start of a flat slot, so
+    batches of varying shape reuse it; a slot is reallocated only when a
+    larger array is requested. Arrays are not cleared, callers overwrite
+    them completely.
+    """
+
+    def __init__(self, slots=2, dtype=FLOAT_DTYPE):
+        self.slots = slots
+        self.dtype = dtype
+        self.buffers = {}
+        self.allocations = 0
+
+    def get(self, key, shape):
+        size = int(np.prod(shape))
+        buffers, i = self.buffers.get(key, ([], 0))
+        self.buffers[key] = (buffers, (i + 1) % self.slots)
+        if i >= len(buffers) or len(buffers[i]) < size:
+            buffer = np.empty(size, dtype=self.dtype)
+            self.allocations += 1
+            if i < len(buffers):
+                buffers[i] = buffer
+            else:
+                buffers.append(buffer)
+        return buffers[i][:size].reshape(shape)
@@ -0,0 +1,155 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from array import array
+
+import numpy as np
+
+
+class StringArray(object):
+    """Strings kept as one UTF-8 blob with offsets instead of Python objects."""
+
+    def __init__(self, strings=()):
+        blob = bytearray()
+        offsets = array('q', [0])
+        for s in strings:
+            blob += s.encode('utf-8')
+            offsets.append(len(blob))
+        self.blob = bytes(blob)
+        self.offsets = np.frombuffer(offsets, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return self.blob[self.offsets[i]:self.offsets[i + 1]].decode('utf-8')
+
+    @property
+    def nbytes(self):
+        return len(self.blob) + self.offsets.nbytes
+
+
+class CompactDialogData(object):
+    """Episodes of one example each for ParlAI's DialogTeacher, kept in flat arrays.
+
+    Texts are a StringArray, labels are indices of distinct label strings
+    in a NumPy array (-1 for no label). The order of episodes is a
+    permutation array: shuffling and bucketing permute it instead of the
+    examples. Nothing is a per-example Python object, so the store takes a
+    fraction of the memory of a list of tuples and stays shared between
+    processes forked after loading (reference counting does not write to
+    it). Implements the parts of ParlAI's DialogData used by the teachers,
+    with the label candidates of the teacher added to labeled examples.
+    """
+
+    def __init__(self, data_loader=None, cands=None, shared=None):
+        if shared is not None:
+            self.texts = shared['data']['texts']
+            self.label_values = shared['data']['label_values']
+            self.labels = shared['data']['labels']
+            self.order = shared['data']['order']
+            self.cands = shared['cands']
+            return
+
+        chunks = []
+        texts = []
+        label_ids = array('i')
+        label_index = {}
+
+        def add_texts():
+            # texts are encoded in chunks so that no list of all of them is kept
+            if texts:
+                chunks.append(StringArray(texts))
+                del texts[:]
+
+        for entry, new_episode in data_loader:
+            if not new_episode:
+                raise ValueError('CompactDialogData keeps episodes of one example only')
+            if any(field is not None for field in entry[2:]):
+                raise ValueError('CompactDialogData keeps the text and labels of examples only')
+            text, labels = entry[0], entry[1] if len(entry) > 1 else None
+            if labels is not None and len(labels) != 1:
+                raise ValueError('CompactDialogData keeps one label per example, got %s' % str(labels))
+            texts.append(text)
+            label_ids.append(-1 if labels is None else label_index.setdefault(labels[0], len(label_index)))
+            if len(texts) >= 10000:
+                add_texts()
+        add_texts()
+
+        self.texts = self._concatenate(chunks)
+        self.label_values = StringArray(sorted(label_index, key=label_index.get))
+        self.labels = np.frombuffer(label_ids, dtype=np.int32) if label_ids else np.zeros(0, dtype=np.int32)
+        if len(self.label_values) <= 127:
+            self.labels = self.labels.astype(np.int8)
+        self.order = np.arange(len(self.labels), dtype=np.int64)
+        self.cands = None if cands is None else set(cands)
+
+    def share(self):
+        """Arrays and candidates to make a CompactDialogData over the same examples from."""
+        return {'data': {'texts': self.texts, 'label_values': self.label_values,
+                         'labels': self.labels, 'order': self.order},
+                'cands': self.cands}
+
+    @staticmethod
+    def _concatenate(chunks):
+        strings = StringArray()
+        strings.blob = b''.join(chunk.blob for chunk in chunks)
+        offsets = [np.zeros(1, dtype=np.int64)]
+        for chunk in chunks:
+            offsets.append(chunk.offsets[1:] + offsets[-1][-1])
+        strings.offsets = np.concatenate(offsets)
+        return strings
+
+    def __len__(self):
+        return len(self.order)
+
+    def __getitem__(self, episode_idx):
+        """The episode at a position of the current order as DialogData keeps it."""
+        i = self.order[episode_idx]
+        label = self.labels[i]
+        return ((self.texts[i], None if label < 0 else (self.label_values[label],)),)
+
+    def __iter__(self):
+        for episode_idx in range(len(self)):
+            yield self[episode_idx]
+
+    def num_episodes(self):
+        return len(self.order)
+
+    def num_examples(self):
+        return len(self.order)
+
+    def get(self, episode_idx, entry_idx=0):
+        """Return the table of an example and whether it is the last one."""
+        (text, labels), = self[episode_idx]
+        table = {'text': text, 'episode_done': True}
+        if labels is not None:
+            table['labels'] = labels
+            if self.cands is not None:
+                # as DialogData does, the candidates always include the labels
+                table['label_candidates'] = self.cands if labels[0] in self.cands else self.cands | set(labels)
+        return table, episode_idx == len(self.order) - 1
+
+    def shuffle(self, seed):
+        self.permute(np.random.RandomState(seed).permutation(len(self.order)))
+
+    def permute(self, order):
+        """Reorder episodes, the new i-th one is the order[i]-th one of the current order."""
+        self.order = self.order[np.asarray(order, dtype=np.int64)]
+
+    @property
+    def nbytes(self):
+        return self.texts.nbytes + self.label_values.nbytes + self.labels.nbytes + self.order.nbytes
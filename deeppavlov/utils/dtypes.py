@@ -0,0 +1,40 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+
+# Batches are built in the dtypes of the model placeholders, so that
+# TensorFlow does not convert them on every feed.
+FLOAT_DTYPE = np.float32
+INT_DTYPE = np.int32
+
+
+def check_feed(placeholders, values):
+    """Raise TypeError if a value differs in dtype from the placeholder it is fed to."""
+    for placeholder, value in zip(placeholders, values):
+        expected = np.dtype(placeholder.dtype.as_numpy_dtype)
+        actual = getattr(value, 'dtype', None)
+        if actual != expected:
+            raise TypeError('%s is fed with %s, expected %s' % (
+                placeholder.name, type(value).__name__ if actual is None else actual, expected))
+
+
+def check_model_feed(model, x, y=None):
+    """Check dtypes of inputs x and targets y of a compiled Keras model."""
+    check_feed(model.inputs, x if isinstance(x, list) else [x])
+    if y is not None:
+        check_feed(model.targets, y if isinstance(y, list) else [y])
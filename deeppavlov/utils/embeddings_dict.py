@@ -0,0 +1,216 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import copy
+import numpy as np
+import urllib.request
+from .embeddings_store import binary_exists, load_binary, load_text, read_binary, \
+    store_lock, compact_binary, log_path, update_binary
+from .embeddings_registry import load_fasttext
+from .token_cache import TokenCache
+from .quantization import quantize, dequantize
+
+
+class FasttextEmbeddingsDict(object):
+    """Fasttext embeddings of the tokens of sentences, computed once and saved with the model.
+
+    Subclasses define how sentences are split into tokens.
+    """
+
+    def __init__(self, opt, embedding_dim):
+        self.tok2emb = TokenCache(opt.get('fasttext_cache_size', 0),
+                                  opt.get('fasttext_cache_bytes', 0),
+                                  opt.get('fasttext_cache_policy', 'lru'))
+        self.tok2ind = {}
+        # computed embeddings that are not saved yet, kept even if evicted from tok2emb
+        # until flush_every of them are only kept here
+        self.unsaved = {}
+        self.flush_every = opt.get('fasttext_flush_every', 10000)
+        self.store_fname = None
+        # the file, binary or text, the dictionary was loaded from or last saved to
+        self.saved_fname = None
+        self.emb_matrix = np.zeros((0, embedding_dim), dtype='float32')
+        self.embedding_dim = embedding_dim
+        self.opt = copy.deepcopy(opt)
+        self.storage_dtype = self.opt.get('fasttext_dtype', 'float32')
+        self.load_items()
+
+        if not self.opt.get('fasttext_model'):
+            raise RuntimeError('No pretrained fasttext model provided')
+        self.fasttext_model_file = self.opt.get('fasttext_model')
+        if not os.path.isfile(self.fasttext_model_file):
+            emb_path = os.environ.get('EMBEDDINGS_URL')
+            if not emb_path:
+                raise RuntimeError('No pretrained fasttext model provided')
+            fname = os.path.basename(self.fasttext_model_file)
+            try:
+                print('Trying to download a pretrained fasttext model from repository')
+                url = urllib.parse.urljoin(emb_path, fname)
+                urllib.request.urlretrieve(url, self.fasttext_model_file)
+                print('Downloaded a fasttext model')
+            except Exception as e:
+                raise RuntimeError('Looks like the `EMBEDDINGS_URL` variable is set incorrectly', e)
+        self.fasttext_model, self.fasttext_vectors = load_fasttext(self.fasttext_model_file,
+                                                                   self.opt.get('fasttext_mmap', False))
+
+    def add_items(self, sentence_li):
+        new_tokens = []
+        batch_tokens = set()
+        for sen in sentence_li:
+            for tok in self.tokenize(sen):
+                if tok in batch_tokens:
+                    continue
+                batch_tokens.add(tok)
+                # tokens from the pretrained file are pinned and never evicted
+                if tok not in self.tok2ind and not self.tok2emb.lookup(tok):
+                    new_tokens.append(tok)
+        self.add_tokens(new_tokens)
+        self.tok2emb.shrink(protected=batch_tokens)
+        if len(self.unsaved) - len(self.tok2emb) >= self.flush_every:
+            self.flush_unsaved()
+
+    def tokenize(self, sen):
+        """Tokens of a sentence."""
+        raise NotImplementedError
+
+    def add_tokens(self, tokens):
+        """Compute fasttext vectors of new tokens, in one batch if possible."""
+        if not tokens:
+            return
+        if self.fasttext_vectors is not None:
+            vectors = self.fasttext_vectors.get_vectors(tokens)
+        else:
+            vectors = [self.fasttext_model[tok] for tok in tokens]
+        for tok, vec in zip(tokens, vectors):
+            vec = np.array(vec, dtype='float32')
+            self.tok2emb[tok] = quantize(vec, self.storage_dtype)
+            # vectors are saved in float32 whatever dtype they are kept in
+            self.unsaved[tok] = vec
+
+    def flush_unsaved(self):
+        """Append unsaved embeddings to the log of the binary dictionary they were loaded from.
+        Without one, for example in processes that never save, the embeddings
+        evicted from the cache are dropped and computed again when needed.
+        """
+        if self.store_fname is not None and binary_exists(self.store_fname):
+            tokens = list(self.unsaved.keys())
+            matrix = np.zeros((len(tokens), self.embedding_dim), dtype='float32')
+            for i, vec in enumerate(self.unsaved.values()):
+                matrix[i] = vec
+            try:
+                update_binary(self.store_fname, tokens, matrix, self.opt.get('fasttext_compact_ratio', 0.5))
+                self.unsaved = {}
+                return
+            except OSError as e:
+                print('Can not append embeddings to %s: %s' % (self.store_fname, e))
+        self.unsaved = {tok: vec for tok, vec in self.unsaved.items() if tok in self.tok2emb}
+
+    def get(self, tok):
+        """Return the float32 embedding of tok or None if it is not in the dictionary."""
+        ind = self.tok2ind.get(tok)
+        if ind is not None:
+            return dequantize(self.emb_matrix[ind])
+        vec = self.tok2emb.get(tok)
+        return None if vec is None else dequantize(vec)
+
+    def cache_stats(self):
+        """Hit, miss and eviction counters of the cache of computed embeddings."""
+        return self.tok2emb.stats()
+
+    def __contains__(self, tok):
+        return tok in self.tok2ind or tok in self.tok2emb
+
+    def __len__(self):
+        return len(self.tok2ind) + len(self.tok2emb)
+
+    def save_items(self, fname):
+        if self.opt.get('fasttext_embeddings_dict') is not None:
+            fname = self.opt['fasttext_embeddings_dict']
+        else:
+            fname += '.emb'
+        if self.opt.get('fasttext_embeddings_format', 'binary') == 'binary':
+            if fname == self.store_fname and binary_exists(fname):
+                # only tokens computed since the last save are appended
+                tokens = list(self.unsaved.keys())
+                vectors = list(self.unsaved.values())
+            else:
+                tokens, vectors = self._all_items()
+            matrix = np.zeros((len(tokens), self.embedding_dim), dtype='float32')
+            for i, vec in enumerate(vectors):
+                matrix[i] = vec
+            update_binary(fname, tokens, matrix, self.opt.get('fasttext_compact_ratio', 0.5))
+            self.store_fname = fname
+            self.saved_fname = fname
+            self.unsaved = {}
+            return
+        items = zip(*self._all_items())
+        string = '\n'.join([el[0] + ' ' + self.emb2str(el[1]) for el in items])
+        f = open(fname, 'w')
+        f.write(string)
+        f.close()
+        self.saved_fname = fname
+        self.unsaved = {}
+
+    def _all_items(self):
+        """Return tokens and float32 vectors of the whole dictionary.
+        Saved vectors are read back from saved_fname rather than taken from
+        memory, so tokens evicted from the cache after they were saved are
+        kept and quantized copies are never written.
+        """
+        tokens, matrix = [], np.zeros((0, self.embedding_dim), dtype='float32')
+        if self.saved_fname is not None and binary_exists(self.saved_fname):
+            tokens, matrix = read_binary(self.saved_fname, self.embedding_dim)
+        elif self.saved_fname is not None and os.path.isfile(self.saved_fname):
+            tokens, matrix = load_text(self.saved_fname, self.embedding_dim)
+        saved = set(tokens)
+        new_tokens = [tok for tok in self.unsaved if tok not in saved]
+        return tokens + new_tokens, list(matrix) + [self.unsaved[tok] for tok in new_tokens]
+
+    def emb2str(self, vec):
+        string = ' '.join([str(el) for el in vec])
+        return string
+
+    def load_items(self):
+        """Initialize embeddings from file.
+        A binary store (`<fname>.vocab` + `<fname>.npy`) is memory-mapped,
+        a text file is parsed into an in-memory matrix.
+        """
+        fname = None
+        if self.opt.get('fasttext_embeddings_dict') is not None:
+            fname = self.opt['fasttext_embeddings_dict']
+        elif self.opt.get('pretrained_model') is not None:
+            fname = self.opt['pretrained_model']+'.emb'
+        elif self.opt.get('model_file') is not None:
+            fname = self.opt['model_file']+'.emb'
+
+        if fname is not None and binary_exists(fname):
+            print('Loading existing binary dictionary from %s.' % fname)
+            if os.path.isfile(log_path(fname)):
+                with store_lock(fname):
+                    compact_binary(fname, self.embedding_dim)
+            self.tok2ind, self.emb_matrix = load_binary(fname)
+            assert(self.emb_matrix.shape[1] == self.embedding_dim)
+            self.store_fname = fname
+            self.saved_fname = fname
+        elif fname is None or not os.path.isfile(fname):
+            print('There is no %s file provided. Initializing new dictionary.' % fname)
+        else:
+            print('Loading existing dictionary from %s.' % fname)
+            tokens, self.emb_matrix = load_text(fname, self.embedding_dim)
+            self.tok2ind = dict(zip(tokens, range(len(tokens))))
+            self.saved_fname = fname
+        self.emb_matrix = quantize(self.emb_matrix, self.storage_dtype)
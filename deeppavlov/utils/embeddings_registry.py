@@ -0,0 +1,90 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import numpy as np
+import fasttext
+from .fasttext_vectors import FastTextVectors
+
+
+# Process-wide registry of fasttext models and embedding dictionaries.
+# Vectors of a token depend only on the fasttext model, so every model of an
+# ensemble (and every agent created in one process) can use the same
+# dictionary instead of loading its own copy of a multi-GB model.
+_fasttext_models = {}
+_embeddings_dicts = {}
+
+# Options that change what an embeddings dictionary keeps and where it saves
+# to; a dictionary is only shared by agents that agree on all of them. The
+# model file is not one of them: it is passed to save_items on every save.
+DICT_OPTIONS = ('fasttext_embeddings_format', 'fasttext_dtype', 'fasttext_cache_size', 'fasttext_cache_bytes',
+                'fasttext_cache_policy', 'fasttext_flush_every', 'fasttext_compact_ratio',
+                'tokenizer', 'tokenizer_cache_size', 'tokenizer_check')
+
+
+def _key(fname):
+    return os.path.realpath(fname) if fname else fname
+
+
+def load_fasttext(fname, mmap_only=False):
+    """Return (fasttext_model, fasttext_vectors) for fname, loading them once per process.
+    fasttext_vectors computes vectors in bulk from the memory-mapped input
+    matrix and is None if it can not be used or does not match the model.
+    With mmap_only the model is released once the vectors are checked against
+    it, so it is not kept in process memory and forked workers share the
+    mapped pages.
+    """
+    key = _key(fname)
+    if key not in _fasttext_models:
+        try:
+            vectors = FastTextVectors(fname)
+        except Exception as e:
+            print('Batched fasttext vectors are not available:', e)
+            vectors = None
+        model = fasttext.load_model(fname)
+        if vectors is not None and not _check_vectors(model, vectors):
+            print('Batched fasttext vectors do not match the model, using per-token lookups')
+            vectors = None
+        if mmap_only and vectors is not None:
+            model = None
+        elif mmap_only:
+            print('Keeping the fasttext model %s in memory' % fname)
+        _fasttext_models[key] = (model, vectors)
+    return _fasttext_models[key]
+
+
+def _check_vectors(model, vectors):
+    probe = ['the', 'и', 'qwertyuiop', '!']
+    expected = np.asarray([model[tok] for tok in probe], dtype='float32')
+    return np.allclose(vectors.get_vectors(probe), expected, atol=1e-5)
+
+
+def get_embeddings_dict(cls, opt, embedding_dim):
+    """Return the embeddings dictionary of class cls for the fasttext model in opt,
+    creating it on first use. Agents with different DICT_OPTIONS or
+    fasttext_embeddings_dict get different dictionaries.
+    """
+    key = (cls, _key(opt.get('fasttext_model')), embedding_dim, _key(opt.get('fasttext_embeddings_dict'))) + \
+        tuple(opt.get(name) for name in DICT_OPTIONS)
+    if key not in _embeddings_dicts:
+        _embeddings_dicts[key] = cls(opt, embedding_dim)
+    return _embeddings_dicts[key]
+
+
+def clear():
+    """Drop all shared models and dictionaries."""
+    _fasttext_models.clear()
+    _embeddings_dicts.clear()
@@ -0,0 +1,261 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import os
+import fcntl
+import struct
+from contextlib import contextmanager
+import numpy as np
+
+
+# Binary embeddings store: `<fname>.vocab` holds one token per line (utf-8)
+# and `<fname>.npy` holds a contiguous float32 matrix with the same row order.
+# The matrix is opened with np.memmap, so loading does not depend on the
+# number of vectors and processes on one host share the same pages.
+#
+# Tokens added after the store was written are appended to `<fname>.log` as
+# records of (int32 token length, utf-8 token, float32 vector), so saving a
+# checkpoint costs only the new tokens. The log is merged into the store when
+# it grows too large. Writers to one store are serialized with `<fname>.lock`,
+# which readers take shared.
+
+
+def binary_paths(fname):
+    return fname + '.vocab', fname + '.npy'
+
+
+def log_path(fname):
+    return fname + '.log'
+
+
+def binary_exists(fname):
+    vocab_path, matrix_path = binary_paths(fname)
+    return os.path.isfile(vocab_path) and os.path.isfile(matrix_path)
+
+
+def save_binary(fname, tokens, matrix):
+    """Write tokens and their vectors to a binary store. The caller must hold store_lock(fname).
+    Files are written to temporary paths and then renamed, so processes
+    that have the previous version memory-mapped keep a consistent view;
+    load_binary takes the lock shared, so it never sees one file renamed
+    and the other not.
+    """
+    vocab_path, matrix_path = binary_paths(fname)
+    matrix = np.asarray(matrix, dtype='float32')
+    assert(len(tokens) == matrix.shape[0])
+
+    tmp_vocab_path = '%s.tmp%d' % (vocab_path, os.getpid())
+    tmp_matrix_path = '%s.tmp%d' % (matrix_path, os.getpid())
+    with open(tmp_vocab_path, 'w', encoding='utf-8', newline='\n') as f:
+        for tok in tokens:
+            f.write(tok + '\n')
+    with open(tmp_matrix_path, 'wb') as f:
+        np.save(f, matrix)
+    os.replace(tmp_matrix_path, matrix_path)
+    os.replace(tmp_vocab_path, vocab_path)
+
+
+def load_binary(fname, mmap=True):
+    """Return (tok2ind, matrix) of a binary store."""
+    with store_lock(fname, shared=True):
+        return _load_binary(fname, mmap)
+
+
+def _load_binary(fname, mmap=True):
+    vocab_path, matrix_path = binary_paths(fname)
+    with open(vocab_path, 'r', encoding='utf-8', newline='\n') as f:
+        tokens = f.read().split('\n')[:-1]
+    matrix = np.load(matrix_path, mmap_mode='r' if mmap else None)
+    assert(len(tokens) == matrix.shape[0])
+    tok2ind = dict(zip(tokens, range(len(tokens))))
+    return tok2ind, matrix
+
+
+def load_text(fname, embedding_dim):
+    """Parse a text file of space separated embeddings: w e1 ... ed."""
+    tokens = []
+    vectors = []
+    with open(fname, 'r') as f:
+        for line in f:
+            values = line.rsplit(sep=' ', maxsplit=embedding_dim)
+            assert(len(values) == embedding_dim + 1)
+            tokens.append(values[0])
+            vectors.append(np.asarray(values[1:], dtype='float32'))
+    matrix = np.zeros((len(tokens), embedding_dim), dtype='float32')
+    for i, vec in enumerate(vectors):
+        matrix[i] = vec
+    return tokens, matrix
+
+
+def convert_text_to_binary(fname, embedding_dim, binary_fname=None, normalize=None):
+    """Convert a text file of embeddings (`.emb` cache or GloVe) into a binary store.
+    The file is streamed into a memory-mapped matrix, so it is never held in
+    memory as a whole. normalize is applied to every token if provided and a
+    word2vec-style header line is skipped. The store is written next to the
+    text file unless binary_fname is given.
+    """
+    binary_fname = fname if binary_fname is None else binary_fname
+    vocab_path, matrix_path = binary_paths(binary_fname)
+    print('Converting %s to binary format' % fname)
+
+    with open(fname, 'r') as f:
+        first_line = f.readline()
+        n_rows = 1 + sum(1 for _ in f)
+    has_header = len(first_line.rstrip().split(' ')) == 2
+    if has_header:
+        n_rows -= 1
+
+    tmp_vocab_path = '%s.tmp%d' % (vocab_path, os.getpid())
+    tmp_matrix_path = '%s.tmp%d' % (matrix_path, os.getpid())
+    matrix = np.lib.format.open_memmap(tmp_matrix_path, mode='w+', dtype='float32',
+                                       shape=(n_rows, embedding_dim))
+    with open(fname, 'r') as f, open(tmp_vocab_path, 'w', encoding='utf-8', newline='\n') as vocab:
+        if has_header:
+            f.readline()
+        for i, line in enumerate(f):
+            values = line.rstrip().rsplit(sep=' ', maxsplit=embedding_dim)
+            assert(len(values) == embedding_dim + 1)
+            tok = normalize(values[0]) if normalize is not None else values[0]
+            vocab.write(tok + '\n')
+            matrix[i] = np.asarray(values[1:], dtype='float32')
+    matrix.flush()
+    del matrix
+    with store_lock(binary_fname):
+        os.replace(tmp_matrix_path, matrix_path)
+        os.replace(tmp_vocab_path, vocab_path)
+    return binary_fname
+
+
+@contextmanager
+def store_lock(fname, shared=False):
+    """Lock of a binary store shared by several processes,
+    exclusive for writers and shared for readers.
+    """
+    try:
+        f = open(fname + '.lock', 'a')
+    except OSError:
+        if not shared:
+            raise
+        # nothing can write to a store in a directory we can not create the lock file in
+        yield
+        return
+    with f:
+        fcntl.flock(f, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def append_log(fname, tokens, matrix):
+    """Append tokens and their vectors to the log of a binary store."""
+    matrix = np.asarray(matrix, dtype='float32')
+    assert(len(tokens) == matrix.shape[0])
+    records = []
+    for tok, vec in zip(tokens, matrix):
+        encoded = tok.encode('utf-8')
+        records.append(struct.pack('<i', len(encoded)) + encoded + vec.tobytes())
+    data = b''.join(records)
+    fd = os.open(log_path(fname), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        while data:
+            data = data[os.write(fd, data):]
+    finally:
+        os.close(fd)
+
+
+def read_log(fname, embedding_dim):
+    """Return (tokens, matrix) appended to the log of a binary store.
+    A record cut short by an interrupted write is ignored.
+    """
+    tokens = []
+    rows = []
+    path = log_path(fname)
+    if os.path.isfile(path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        row_bytes = 4 * embedding_dim
+        pos = 0
+        while pos + 4 <= len(data):
+            n = struct.unpack_from('<i', data, pos)[0]
+            end = pos + 4 + n + row_bytes
+            if end > len(data):
+                break
+            tokens.append(data[pos + 4:pos + 4 + n].decode('utf-8'))
+            rows.append(data[pos + 4 + n:end])
+            pos = end
+    matrix = np.frombuffer(b''.join(rows), dtype='float32').reshape(len(rows), embedding_dim)
+    return tokens, matrix
+
+
+def log_ratio(fname):
+    """Size of the log relative to the size of the store."""
+    path = log_path(fname)
+    if not os.path.isfile(path):
+        return 0.
+    return os.path.getsize(path) / max(os.path.getsize(binary_paths(fname)[1]), 1)
+
+
+def _merge_log(fname, embedding_dim):
+    """Return (tokens, matrix) of a binary store with its log, and whether the log had records."""
+    log_tokens, log_matrix = read_log(fname, embedding_dim)
+    if binary_exists(fname):
+        tok2ind, matrix = _load_binary(fname)
+    else:
+        tok2ind, matrix = {}, np.zeros((0, embedding_dim), dtype='float32')
+    if not log_tokens:
+        return list(tok2ind.keys()), matrix, False
+    # later records of a token replace earlier ones
+    tok2row = dict(tok2ind)
+    for i, tok in enumerate(log_tokens):
+        tok2row[tok] = len(matrix) + i
+    tokens = list(tok2row.keys())
+    rows = np.fromiter(tok2row.values(), dtype=np.int64, count=len(tok2row))
+    return tokens, np.concatenate([matrix, log_matrix])[rows], True
+
+
+def read_binary(fname, embedding_dim):
+    """Return (tokens, matrix) of a binary store including the records of its log."""
+    with store_lock(fname, shared=True):
+        tokens, matrix, _ = _merge_log(fname, embedding_dim)
+    return tokens, matrix
+
+
+def compact_binary(fname, embedding_dim):
+    """Merge the log into the store. The caller must hold store_lock(fname)."""
+    tokens, matrix, merged = _merge_log(fname, embedding_dim)
+    if merged:
+        save_binary(fname, tokens, matrix)
+    if os.path.isfile(log_path(fname)):
+        os.remove(log_path(fname))
+
+
+def update_binary(fname, tokens, matrix, compact_ratio=0.5):
+    """Persist tokens to a binary store, creating it if it does not exist.
+    Otherwise the tokens are appended to its log, which is merged into the
+    store once it exceeds compact_ratio of the store size.
+    """
+    with store_lock(fname):
+        if not binary_exists(fname):
+            save_binary(fname, tokens, matrix)
+            if os.path.isfile(log_path(fname)):
+                os.remove(log_path(fname))
+            return
+        if len(tokens):
+            append_log(fname, tokens, matrix)
+        if log_ratio(fname) > compact_ratio:
+            print('Compacting embeddings dictionary %s' % fname)
+            compact_binary(fname, np.load(binary_paths(fname)[1], mmap_mode='r').shape[1])
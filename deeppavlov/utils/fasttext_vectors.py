@@ -0,0 +1,156 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import mmap
+import struct
+import numpy as np
+
+
+FASTTEXT_MAGIC = 793712314
+FNV_OFFSET = 2166136261
+FNV_PRIME = 16777619
+
+
+class FastTextVectors(object):
+    """Bulk word vectors computed directly from a fastText `.bin` file.
+
+    The input matrix is memory-mapped from the model file. A vector of a word
+    is the mean of the input rows of the word itself (if it is in the
+    vocabulary) and of its hashed character n-grams, exactly as in
+    `FastText::getVector`, but n-gram hashing and row averaging are done for
+    the whole list of words at once with numpy.
+    """
+
+    def __init__(self, fname):
+        self.fname = fname
+        with open(fname, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                offset = self._read_header(data)
+            finally:
+                data.close()
+        self.input = np.memmap(self.fname, dtype='float32', mode='r', offset=offset,
+                               shape=(self.nwords + self.bucket, self.dim))
+
+    def _read_header(self, data):
+        """Parse args and dictionary, return the offset of the input matrix."""
+        magic, version = struct.unpack_from('<ii', data, 0)
+        pos = 8
+        if magic != FASTTEXT_MAGIC:
+            # models saved before the magic number was introduced
+            version = None
+            pos = 0
+        args = struct.unpack_from('<12id', data, pos)
+        pos += 56
+        (self.dim, _, _, _, _, _, _, model, self.bucket,
+         self.minn, self.maxn, _, _) = args
+        if version == 11 and model == 3:
+            # old supervised models do not use char n-grams
+            self.maxn = 0
+
+        size, self.nwords, _ = struct.unpack_from('<3i', data, pos)
+        pos += 20  # + int64 ntokens
+        if version is not None:
+            pruneidx_size = struct.unpack_from('<q', data, pos)[0]
+            pos += 8
+            if pruneidx_size > 0:
+                raise ValueError('Pruned fasttext models are not supported')
+        self.word2id = {}
+        for i in range(size):
+            end = data.find(b'\0', pos)
+            if end < 0:
+                raise ValueError('Unexpected end of fasttext model file')
+            if i < self.nwords:
+                self.word2id[data[pos:end].decode('utf-8', errors='replace')] = i
+            pos = end + 10  # null byte, int64 count, int8 entry type
+
+        if version is not None:
+            if struct.unpack_from('<?', data, pos)[0]:
+                raise ValueError('Quantized fasttext models are not supported')
+            pos += 1
+        m, n = struct.unpack_from('<qq', data, pos)
+        pos += 16
+        if n != self.dim or m != self.nwords + self.bucket or len(data) < pos + 4 * m * n:
+            raise ValueError('Unexpected input matrix shape in %s' % self.fname)
+        return pos
+
+    def _subwords(self, words):
+        """Return (word index, input row) pairs of all subwords of words."""
+        encoded = [('<' + w + '>').encode('utf-8') for w in words]
+        data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        word_lengths = np.array([len(e) for e in encoded])
+        word_starts = np.cumsum(word_lengths) - word_lengths
+
+        # byte offsets of utf-8 characters and the word each one belongs to
+        char_starts = np.flatnonzero((data & 0xC0) != 0x80)
+        char_word = np.searchsorted(word_starts, char_starts, side='right') - 1
+        word_char_starts = np.searchsorted(char_starts, word_starts)
+        n_chars = np.bincount(char_word, minlength=len(words))
+        char_pos = np.arange(len(char_starts)) - word_char_starts[char_word]
+        bounds = np.append(char_starts, len(data))
+
+        starts, ends, owners = [], [], []
+        for n in range(max(self.minn, 1), self.maxn + 1):
+            last = char_pos + n == n_chars[char_word]
+            ok = char_pos + n <= n_chars[char_word]
+            if n == 1:
+                ok &= (char_pos != 0) & ~last
+            inds = np.flatnonzero(ok)
+            starts.append(bounds[inds])
+            ends.append(bounds[inds + n])
+            owners.append(char_word[inds])
+        starts = np.concatenate(starts) if starts else np.zeros(0, dtype=int)
+        ends = np.concatenate(ends) if ends else np.zeros(0, dtype=int)
+        owners = np.concatenate(owners) if owners else np.zeros(0, dtype=int)
+        rows = self.nwords + self._hash(data, starts, ends) % self.bucket if len(starts) else starts
+
+        ids = [self.word2id.get(w) for w in words]
+        in_vocab = np.array([i for i, wid in enumerate(ids) if wid is not None], dtype=int)
+        vocab_rows = np.array([wid for wid in ids if wid is not None], dtype=int)
+        return np.concatenate([in_vocab, owners]), np.concatenate([vocab_rows, rows])
+
+    @staticmethod
+    def _hash(data, starts, ends):
+        """FNV-1a hash of data[s:e] for all (s, e), with bytes sign-extended as in fastText."""
+        signed = data.view(np.int8).astype(np.int32).view(np.uint32)
+        signed = np.append(signed, np.uint32(0))
+        h = np.full(len(starts), FNV_OFFSET, dtype=np.uint32)
+        lengths = ends - starts
+        for t in range(int(lengths.max())):
+            active = t < lengths
+            pos = np.where(active, starts + t, len(data))
+            h = np.where(active, (h ^ signed[pos]) * np.uint32(FNV_PRIME), h)
+        return h.astype(np.int64)
+
+    def get_vectors(self, words):
+        """Return a float32 matrix with the fastText vector of every word."""
+        vectors = np.zeros((len(words), self.dim), dtype='float32')
+        if not words:
+            return vectors
+        owners, rows = self._subwords(words)
+        if len(rows) == 0:
+            return vectors
+        order = np.argsort(owners, kind='mergesort')
+        owners, rows = owners[order], rows[order]
+        counts = np.bincount(owners, minlength=len(words))
+        present = np.flatnonzero(counts)
+        offsets = np.cumsum(counts)[present] - counts[present]
+        sums = np.add.reduceat(self.input[rows], offsets, axis=0)
+        vectors[present] = sums * (1.0 / counts[present]).astype('float32')[:, None]
+        return vectors
+
+    def __getitem__(self, word):
+        return self.get_vectors([word])[0]
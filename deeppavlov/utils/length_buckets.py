@@ -0,0 +1,57 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import random
+
+
+def padding_ratio(lengths, batch_size):
+    """Fraction of padding when consecutive examples are batched and padded to the longest one."""
+    total = 0
+    padded = 0
+    for start in range(0, len(lengths), batch_size):
+        batch = lengths[start:start + batch_size]
+        total += sum(batch)
+        padded += max(batch) * len(batch)
+    return 1. - total / padded if padded else 0.
+
+
+def bucket_by_length(data, length, batch_size, bucket_width=5, window=100, rng=random):
+    """Reorder shuffled data in place so that every batch_size consecutive examples have similar lengths.
+
+    Inside windows of `window` batches examples are grouped by
+    length(example) // bucket_width, keeping their shuffled order within a
+    group, and cut into batches. Then the full batches of all windows are
+    shuffled; an incomplete last batch stays last so that batches remain
+    aligned to batch_size. data is a list of examples or a store that is
+    reordered with its permute(order) method. Return the padding ratio
+    before and after.
+    """
+    lengths = [length(ex) for ex in data]
+    before = padding_ratio(lengths, batch_size)
+    window_size = batch_size * max(window, 1)
+    batches = []
+    for start in range(0, len(data), window_size):
+        inds = sorted(range(start, min(start + window_size, len(data))),
+                      key=lambda i: lengths[i] // bucket_width)
+        batches.extend(inds[i:i + batch_size] for i in range(0, len(inds), batch_size))
+    last = [batches.pop()] if batches and len(batches[-1]) < batch_size else []
+    rng.shuffle(batches)
+    order = [i for batch in batches + last for i in batch]
+    if hasattr(data, 'permute'):
+        data.permute(order)
+    else:
+        data[:] = [data[i] for i in order]
+    return before, padding_ratio([lengths[i] for i in order], batch_size)
@@ -0,0 +1,84 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import numpy as np
+
+
+STORAGE_DTYPES = ('float32', 'float16', 'int8')
+BLOCK_ROWS = 65536
+
+
+class Int8Matrix(object):
+    """Embeddings stored as int8 values with a float32 scale per row.
+
+    Rows are dequantized to float32 only when they are indexed, so the whole
+    matrix never exists in float32. A 1-d vector is stored as a single row.
+    """
+
+    def __init__(self, matrix):
+        self.shape = matrix.shape
+        rows = matrix.reshape(-1, matrix.shape[-1])
+        self.data = np.zeros(rows.shape, dtype=np.int8)
+        self.scales = np.zeros((rows.shape[0], 1), dtype='float32')
+        # memory-mapped matrices are quantized block by block
+        for start in range(0, rows.shape[0], BLOCK_ROWS):
+            block = np.asarray(rows[start:start + BLOCK_ROWS], dtype='float32')
+            scales = np.abs(block).max(axis=1, keepdims=True) / 127.
+            scales[scales == 0] = 1.
+            self.data[start:start + BLOCK_ROWS] = np.round(block / scales)
+            self.scales[start:start + BLOCK_ROWS] = scales
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.scales.nbytes
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, ind):
+        if len(self.shape) == 1:
+            return self.__array__()[ind]
+        return self.data[ind] * self.scales[ind]
+
+    def __iter__(self):
+        if len(self.shape) == 1:
+            # a vector is dequantized once, not once per element
+            yield from self.__array__()
+            return
+        for i in range(len(self)):
+            yield self[i]
+
+    def __array__(self, dtype=None):
+        matrix = (self.data * self.scales).reshape(self.shape)
+        return matrix if dtype is None else matrix.astype(dtype, copy=False)
+
+
+def quantize(matrix, dtype='float32'):
+    """Return matrix stored with dtype, one of STORAGE_DTYPES.
+    float32 matrices (memory-mapped ones included) are returned as is.
+    """
+    if dtype not in STORAGE_DTYPES:
+        raise ValueError('Unknown embeddings storage dtype: %s' % dtype)
+    if dtype == 'int8':
+        return Int8Matrix(np.asanyarray(matrix))
+    if getattr(matrix, 'dtype', None) == np.dtype(dtype):
+        return matrix
+    return np.asarray(matrix, dtype=dtype)
+
+
+def dequantize(matrix):
+    """Return a float32 array of a matrix or vector stored by quantize."""
+    return np.asarray(matrix, dtype='float32')
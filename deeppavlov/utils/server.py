@@ -0,0 +1,272 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+"""
+Serves any agent over HTTP, coalescing concurrent requests into batch_act calls.
+
+    python -m deeppavlov.utils.server -m deeppavlov.agents.ner.ner:NERAgent \
+        --pretrained-model ./build/ner/ner --port 5000 --max-batch-size 64 --max-wait-ms 5
+
+    curl -d '{"text": "..."}' http://localhost:5000/act
+
+POST /act takes an observation as a JSON object and returns the reply of the
+agent, GET /stats returns the numbers of requests and batches served.
+"""
+
+import sys
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import tensorflow as tf
+except ImportError:
+    tf = None
+
+
+class MicroBatcher(object):
+    """Runs observations submitted one by one through batch_act in batches.
+
+    A batch is run when `max_batch_size` observations are waiting or
+    `max_wait` seconds after the first of them arrived. batch_act runs in a
+    worker thread so that the event loop keeps accepting requests while the
+    model computes; agents are not thread-safe, so batches run one at a
+    time and the requests arriving meanwhile form the next batch.
+    """
+
+    def __init__(self, batch_act, max_batch_size=32, max_wait=0.005):
+        self.batch_act = batch_act
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        # Keras models have to be used in the graph they were built in
+        self.graph = tf.get_default_graph() if tf is not None else None
+        self.pending = []
+        self.arrived = None
+        self.task = None
+        self.requests = 0
+        self.batches = 0
+        self.busy_secs = 0.
+
+    def start(self):
+        """Start batching in the running event loop."""
+        self.arrived = asyncio.Event()
+        self.task = asyncio.ensure_future(self._run())
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        self.executor.shutdown()
+
+    async def act(self, observation):
+        """Return the reply of the agent to the observation."""
+        future = asyncio.get_event_loop().create_future()
+        self.pending.append((observation, future, time.time()))
+        self.arrived.set()
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_event_loop()
+        while True:
+            while not self.pending:
+                self.arrived.clear()
+                await self.arrived.wait()
+            while len(self.pending) < self.max_batch_size:
+                timeout = self.pending[0][2] + self.max_wait - time.time()
+                if timeout <= 0:
+                    break
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            batch = self.pending[:self.max_batch_size]
+            del self.pending[:self.max_batch_size]
+            # requests whose client went away are not computed
+            batch = [request for request in batch if not request[1].done()]
+            if not batch:
+                continue
+
+            start = time.time()
+            try:
+                replies = await loop.run_in_executor(self.executor, self._batch_act,
+                                                     [observation for observation, _, _ in batch])
+            except Exception as e:
+                replies = [e] * len(batch)
+            self.busy_secs += time.time() - start
+            self.requests += len(batch)
+            self.batches += 1
+            for (_, future, _), reply in zip(batch, replies):
+                if future.done():
+                    continue
+                if isinstance(reply, Exception):
+                    future.set_exception(reply)
+                else:
+                    future.set_result(reply)
+
+    def _batch_act(self, observations):
+        if self.graph is None:
+            return self.batch_act(observations)
+        with self.graph.as_default():
+            return self.batch_act(observations)
+
+    def stats(self):
+        return {'requests': self.requests,
+                'batches': self.batches,
+                'mean_batch_size': self.requests / self.batches if self.batches else 0.,
+                'busy_secs': self.busy_secs,
+                'pending': len(self.pending)}
+
+
+def _to_json(obj):
+    # numpy scalars and arrays in replies
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    raise TypeError('%r is not JSON serializable' % obj)
+
+
+class InferenceServer(object):
+    """Minimal HTTP/1.1 server passing requests to a MicroBatcher."""
+
+    def __init__(self, batcher, host='0.0.0.0', port=5000):
+        self.batcher = batcher
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self):
+        self.batcher.start()
+        self.server = await asyncio.start_server(self._handle, self.host, self.port)
+        # the port chosen by the system if 0 was asked for
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+        self.batcher.stop()
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                try:
+                    method, path, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    await self._respond(writer, 400, {'error': 'bad request line'}, False)
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' if version == 'HTTP/1.0' else connection != 'close'
+
+                status, payload = await self._dispatch(method, path, body)
+                await self._respond(writer, status, payload, keep_alive)
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method, path, body):
+        if path == '/act' and method == 'POST':
+            try:
+                observation = json.loads(body.decode('utf-8'))
+            except ValueError as e:
+                return 400, {'error': 'invalid JSON: %s' % e}
+            if not isinstance(observation, dict):
+                return 400, {'error': 'an observation must be a JSON object'}
+            # served agents predict, labels would make them train
+            observation.pop('labels', None)
+            observation.setdefault('episode_done', True)
+            try:
+                return 200, await self.batcher.act(observation)
+            except Exception as e:
+                return 500, {'error': '%s: %s' % (type(e).__name__, e)}
+        if path == '/stats' and method == 'GET':
+            return 200, self.batcher.stats()
+        return 404, {'error': 'unknown endpoint %s %s' % (method, path)}
+
+    async def _respond(self, writer, status, payload, keep_alive):
+        body = json.dumps(payload, default=_to_json, ensure_ascii=False).encode('utf-8')
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 500: 'Internal Server Error'}
+        head = ('HTTP/1.1 %d %s\r\n'
+                'Content-Type: application/json; charset=utf-8\r\n'
+                'Content-Length: %d\r\n'
+                'Connection: %s\r\n\r\n' % (status, reasons[status], len(body),
+                                            'keep-alive' if keep_alive else 'close'))
+        writer.write(head.encode('latin-1') + body)
+        await writer.drain()
+
+
+def agent_batch_act(agent):
+    """batch_act of the agent, or observe and act per observation for agents without it."""
+    if hasattr(agent, 'batch_act'):
+        return agent.batch_act
+
+    def batch_act(observations):
+        replies = []
+        for observation in observations:
+            agent.observe(observation)
+            replies.append(agent.act())
+        return replies
+    return batch_act
+
+
+def main(args=None):
+    from parlai.core.agents import create_agent
+    from parlai.core.params import ParlaiParser
+
+    parser = ParlaiParser(True, True, model_argv=args)
+    server = parser.add_argument_group('Server Arguments')
+    server.add_argument('--host', type=str, default='0.0.0.0')
+    server.add_argument('--port', type=int, default=5000)
+    server.add_argument('--max-batch-size', type=int, default=32,
+                        help='max number of requests passed to batch_act at once')
+    server.add_argument('--max-wait-ms', type=float, default=5,
+                        help='max time a request waits for others to fill a batch')
+    opt = parser.parse_args(args=args)
+    opt['datatype'] = 'test'
+
+    agent = create_agent(opt)
+    batcher = MicroBatcher(agent_batch_act(agent), opt['max_batch_size'], opt['max_wait_ms'] / 1000.)
+    server = InferenceServer(batcher, opt['host'], opt['port'])
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(server.start())
+    print('[ serving %s on %s:%d ]' % (opt['model'], opt['host'], server.port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        loop.run_until_complete(server.stop())
+        agent.shutdown()
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -0,0 +1,57 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+import hashlib
+import random
+
+
+def is_streaming(opt):
+    """Whether the datatype asks to stream the dataset from disk, e.g. train:stream."""
+    return 'stream' in opt['datatype'].split(':')
+
+
+def record_hash(text, seed=0):
+    """Hash of a record in [0, 1), unlike hash() the same in every process and run."""
+    digest = hashlib.md5(('%s\n%s' % (seed, text)).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'little') / 2. ** 64
+
+
+def hash_fold(text, folds_number, seed=0):
+    """Bagging fold of a record: equal records always fall into the same fold."""
+    return int(record_hash(text, seed) * folds_number)
+
+
+def shuffle_buffer(records, buffer_size, rng=random):
+    """Yield records in random order keeping at most buffer_size of them in memory.
+
+    The buffer is filled first, then every new record replaces a random one
+    which is yielded. A record can move ahead by at most buffer_size
+    positions, so buffer_size should be well above the length of runs of
+    similar records in the source (e.g. a file sorted by label).
+    """
+    if buffer_size <= 1:
+        yield from records
+        return
+    buffer = []
+    for record in records:
+        if len(buffer) < buffer_size:
+            buffer.append(record)
+            continue
+        i = rng.randrange(buffer_size)
+        yield buffer[i]
+        buffer[i] = record
+    rng.shuffle(buffer)
+    yield from buffer
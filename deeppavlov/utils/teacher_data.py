@@ -0,0 +1,57 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from .compact_data import CompactDialogData
+from .length_buckets import bucket_by_length
+
+
+# Options and helpers of the dataset storage and ordering shared by the
+# insults, paraphrases and NER teachers. A teacher using them sets
+# self.compact and defines _example_length(episode).
+
+
+def add_data_args(group):
+    """Add length bucketing, streaming and compact storage options to an argument group."""
+    group.add_argument('--length-buckets', type='bool', default=False,
+                       help='batch examples of similar length together')
+    group.add_argument('--bucket-width', type=int, default=5,
+                       help='max difference in tokens between lengths of examples in a bucket')
+    group.add_argument('--bucket-window', type=int, default=100,
+                       help='number of batches to group examples by length within')
+    group.add_argument('--shuffle-buffer-size', type=int, default=10000,
+                       help='number of examples shuffled together when streaming the dataset (datatype with :stream)')
+    group.add_argument('--compact-data', type='bool', default=False,
+                       help='keep the dataset in flat arrays shuffled by permutation instead of a list of examples')
+
+
+def compact_shared(teacher, opt):
+    """Shared state to start a teacher from with its dataset loaded into a CompactDialogData.
+
+    It has the 'data' entry DialogTeacher.share() gives the copies of a
+    teacher, so DialogTeacher uses the data instead of loading a DialogData.
+    """
+    return {'data': CompactDialogData(teacher.setup_data(opt['datafile']), cands=teacher.label_candidates())}
+
+
+def bucket_teacher_data(teacher):
+    """Reorder the shuffled data of a teacher into batches of examples of similar length."""
+    data = teacher.data if teacher.compact else teacher.data.data
+    before, after = bucket_by_length(data, teacher._example_length,
+                                     teacher.opt.get('batchsize', 1),
+                                     teacher.opt.get('bucket_width', 5),
+                                     teacher.opt.get('bucket_window', 100))
+    if teacher.data_offset == 0:
+        print('[ %s: padding ratio %.3f -> %.3f with length buckets ]' % (teacher.id, before, after))
@@ -0,0 +1,120 @@
+"""
+Copyright 2017 Neural Networks and Deep Learning lab, MIPT
+
+Licensed under the Apache License, Version 2.0 (the "License");
+you may not use this file except in compliance with the License.
+You may obtain a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS,
+WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+See the License for the specific language governing permissions and
+limitations under the License.
+"""
+
+from collections import OrderedDict
+
+
+class TokenCache(object):
+    """Token -> embedding mapping bounded by a number of entries and/or bytes.
+
+    When a limit is exceeded, `shrink` evicts the least recently used ('lru')
+    or the least frequently used ('lfu') tokens. A limit of 0 means no limit.
+    """
+
+    def __init__(self, max_entries=0, max_bytes=0, policy='lru'):
+        if policy not in ('lru', 'lfu'):
+            raise ValueError('Unknown cache eviction policy: %s' % policy)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self.data = OrderedDict()
+        self.counts = {}
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def lookup(self, tok):
+        """Check if tok is cached, counting a hit or a miss."""
+        if tok in self.data:
+            self.hits += 1
+            self._touch(tok)
+            return True
+        self.misses += 1
+        return False
+
+    def _touch(self, tok):
+        if self.policy == 'lru':
+            self.data.move_to_end(tok)
+        else:
+            self.counts[tok] += 1
+
+    def get(self, tok, default=None):
+        vec = self.data.get(tok)
+        if vec is None:
+            return default
+        self._touch(tok)
+        return vec
+
+    def __setitem__(self, tok, vec):
+        if tok in self.data:
+            self._remove(tok)
+        self.data[tok] = vec
+        self.counts[tok] = 1
+        self.nbytes += vec.nbytes
+
+    def _remove(self, tok):
+        self.nbytes -= self.data.pop(tok).nbytes
+        del self.counts[tok]
+
+    def _over_limit(self):
+        return (0 < self.max_entries < len(self.data)) or (0 < self.max_bytes < self.nbytes)
+
+    def shrink(self, protected=()):
+        """Evict tokens until the cache fits its limits. Tokens in protected are kept."""
+        if not self._over_limit():
+            return
+        if self.policy == 'lru':
+            # protected tokens were used last, so they are at the end of the order
+            while self._over_limit():
+                tok = next(iter(self.data))
+                if tok in protected:
+                    break
+                self._remove(tok)
+                self.evictions += 1
+            return
+        for tok in sorted(self.counts, key=self.counts.get):
+            if not self._over_limit():
+                break
+            if tok in protected:
+                continue
+            self._remove(tok)
+            self.evictions += 1
+
+    def stats(self):
+        return {'cache_size': len(self.data),
+                'cache_bytes': self.nbytes,
+                'cache_hits': self.hits,
+                'cache_misses': self.misses,
+                'cache_evictions': self.evictions}
+
+    def __contains__(self, tok):
+        return tok in self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def keys(self):
+        return self.data.keys()
+
+    def values(self):
+        return self.data.values()
+
+    def items(self):
+        return self.data.items()
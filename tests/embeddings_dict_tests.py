@@ -0,0 +1,87 @@
+import os
+import unittest
+import numpy as np
+
+from deeppavlov.utils import embeddings_registry
+from deeppavlov.agents.insults.embeddings_dict import EmbeddingsDict
+from fasttext_stub import HashModel, FasttextStubTestCase
+
+
+class TestEmbeddingsDict(FasttextStubTestCase):
+    """Memory of computed embeddings in processes that never save them"""
+
+    def opt(self, **kwargs):
+        opt = {'fasttext_model': self.model_file, 'fasttext_cache_size': 100, 'fasttext_flush_every': 50}
+        opt.update(kwargs)
+        return opt
+
+    def add_batches(self, embdict, n_batches=200, batch_size=50):
+        for i in range(n_batches):
+            embdict.add_items([' '.join('tok%d_%d' % (i, j) for j in range(batch_size))])
+            self.assertLessEqual(len(embdict.tok2emb), 100 + batch_size)
+            self.assertLessEqual(len(embdict.unsaved), len(embdict.tok2emb) + 50)
+
+    def test_never_saved(self):
+        embdict = EmbeddingsDict(self.opt(), self.dim)
+        self.add_batches(embdict)
+        self.assertIsNone(embdict.store_fname)
+
+    def test_flushed_to_store(self):
+        fname = os.path.join(self.dir, 'dict.emb')
+        EmbeddingsDict(self.opt(fasttext_embeddings_dict=fname), self.dim).save_items(None)
+
+        embdict = EmbeddingsDict(self.opt(fasttext_embeddings_dict=fname), self.dim)
+        self.add_batches(embdict)
+        embdict.save_items(None)
+        self.register_model()
+        loaded = EmbeddingsDict(self.opt(fasttext_embeddings_dict=fname), self.dim)
+        self.assertEqual(len(loaded.tok2ind), 200 * 50)
+        np.testing.assert_allclose(loaded.get('tok7_3'), HashModel(self.dim)['tok7_3'])
+
+    def test_int8_saved_in_float32(self):
+        fname = os.path.join(self.dir, 'dict.emb')
+        embdict = EmbeddingsDict(self.opt(fasttext_embeddings_dict=fname, fasttext_dtype='int8'), self.dim)
+        embdict.add_items(['tok1 tok2 tok3'])
+        self.assertFalse(np.array_equal(embdict.get('tok2'), HashModel(self.dim)['tok2']))
+        embdict.save_items(None)
+        loaded = EmbeddingsDict(self.opt(fasttext_embeddings_dict=fname), self.dim)
+        np.testing.assert_array_equal(loaded.get('tok2'), HashModel(self.dim)['tok2'])
+
+    def test_int8_text_format(self):
+        fname = os.path.join(self.dir, 'dict.emb')
+        embdict = EmbeddingsDict(self.opt(fasttext_embeddings_dict=fname, fasttext_dtype='int8',
+                                          fasttext_embeddings_format='text'), self.dim)
+        embdict.add_items(['tok1 tok2'])
+        embdict.save_items(None)
+        with open(fname) as f:
+            lines = f.read().split('\n')
+        self.assertEqual(len(lines), 2)
+        self.assertEqual(len(lines[0].split(' ')), self.dim + 1)
+
+    def test_text_saved_after_eviction(self):
+        fname = os.path.join(self.dir, 'dict.emb')
+        embdict = EmbeddingsDict(self.opt(fasttext_embeddings_dict=fname, fasttext_dtype='int8',
+                                          fasttext_embeddings_format='text', fasttext_flush_every=1000), self.dim)
+        for i in range(4):
+            embdict.add_items([' '.join('tok%d_%d' % (i, j) for j in range(50))])
+        embdict.save_items(None)
+        embdict.add_items([' '.join('new%d' % j for j in range(150))])
+        self.assertNotIn('tok0_0', embdict.tok2emb)
+        embdict.save_items(None)
+        loaded = EmbeddingsDict(self.opt(fasttext_embeddings_dict=fname, fasttext_cache_size=0), self.dim)
+        self.assertEqual(len(loaded.tok2ind), 4 * 50 + 150)
+        np.testing.assert_allclose(loaded.get('tok0_0'), HashModel(self.dim)['tok0_0'], rtol=1e-6)
+
+    def test_shared_with_same_options(self):
+        embdict = embeddings_registry.get_embeddings_dict(EmbeddingsDict, self.opt(model_file='fold_0'), self.dim)
+        self.assertIs(embeddings_registry.get_embeddings_dict(EmbeddingsDict, self.opt(model_file='fold_1'),
+                                                              self.dim), embdict)
+        for name, value in [('fasttext_dtype', 'int8'), ('fasttext_cache_size', 10),
+                            ('fasttext_embeddings_dict', os.path.join(self.dir, 'dict.emb'))]:
+            other = embeddings_registry.get_embeddings_dict(EmbeddingsDict, self.opt(**{name: value}), self.dim)
+            self.assertIsNot(other, embdict)
+            self.assertEqual(other.opt[name], value)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,38 @@
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+from deeppavlov.utils import embeddings_registry
+
+
+class HashModel(object):
+    """Stands in for a fasttext model: a deterministic vector per token"""
+
+    def __init__(self, dim):
+        self.dim = dim
+
+    def __getitem__(self, tok):
+        return np.random.RandomState(abs(hash(tok)) % 2 ** 32).rand(self.dim).astype('float32')
+
+
+class FasttextStubTestCase(unittest.TestCase):
+    """Test case with a HashModel of dim dimensions registered as the fasttext model self.model_file"""
+
+    dim = 8
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.model_file = os.path.join(self.dir, 'fasttext.bin')
+        open(self.model_file, 'w').close()
+        self.register_model()
+
+    def tearDown(self):
+        embeddings_registry.clear()
+        shutil.rmtree(self.dir)
+
+    def register_model(self):
+        """Start from an empty registry with only the stub model, as a new process would"""
+        embeddings_registry.clear()
+        embeddings_registry._fasttext_models[embeddings_registry._key(self.model_file)] = (HashModel(self.dim), None)
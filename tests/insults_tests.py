@@ -0,0 +1,54 @@
+import unittest
+import numpy as np
+
+from fasttext_stub import FasttextStubTestCase
+
+
+class TestDynamicSequenceLength(FasttextStubTestCase):
+    """Batches padded only to their longest comment"""
+
+    dim = 10
+
+    def opt(self, *args):
+        from parlai.core.params import ParlaiParser
+        from deeppavlov.agents.insults.insults_agents import InsultsAgent
+
+        parser = ParlaiParser()
+        InsultsAgent.add_cmdline_args(parser)
+        return parser.parse_args(args=['--model_name', 'cnn_word', '--fasttext_model', self.model_file,
+                                       '--embedding_dim', str(self.dim), '--filters_cnn', '4', '--dense_dim', '4',
+                                       '--kernel_sizes_cnn', '1 2 3', '--max_sequence_length', '30'] + list(args))
+
+    def sentences(self, rng, n):
+        return [' '.join('w%d' % w for w in rng.randint(0, 50, rng.randint(1, 13))) for _ in range(n)]
+
+    def test_cnn_word_predictions(self):
+        from deeppavlov.agents.insults.model import InsultsModel
+
+        rng = np.random.RandomState(0)
+        fixed = InsultsModel('cnn_word', None, None, self.opt())
+        # a few updates move the BatchNorm statistics away from their initial values
+        for _ in range(3):
+            sentences = self.sentences(rng, 8)
+            fixed.update((fixed.featurize(sentences), [int(rng.rand() > 0.5) for _ in sentences]))
+        dynamic = InsultsModel('cnn_word', None, None, self.opt('--dynamic_sequence_length', 'True'))
+        dynamic.model.set_weights(fixed.model.get_weights())
+
+        sentences = self.sentences(rng, 16)
+        x = fixed.featurize(sentences)
+        self.assertEqual(x.shape[1], 30)
+        expected = fixed.predict_features(x)
+        x = dynamic.featurize(sentences)
+        self.assertLess(x.shape[1], 30)
+        np.testing.assert_allclose(dynamic.predict_features(x), expected, rtol=1e-5, atol=1e-6)
+
+    def test_lstm_word_rejected(self):
+        from deeppavlov.agents.insults.model import InsultsModel
+
+        with self.assertRaises(RuntimeError):
+            InsultsModel('lstm_word', None, None, self.opt('--model_name', 'lstm_word',
+                                                           '--dynamic_sequence_length', 'True'))
+
+
+if __name__ == '__main__':
+    unittest.main()
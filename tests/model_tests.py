@@ -108,6 +108,105 @@ class TestKPIs(unittest.TestCase):
                         'KPI for SQuAD is not satisfied. \
                         Got {}, expected more than {}'.format(metrics['f1'], expected_KPI))
 
+    def _run_paraphraser(self, extra_args):
+        """test_paraphraser with extra_args added to its arguments"""
+        expected_KPI = 0.8
+        metrics = bu.model(['-t', 'deeppavlov.tasks.paraphrases.agents',
+                            '-m', 'deeppavlov.agents.paraphraser.paraphraser:EnsembleParaphraserAgent',
+                            '-mf', './build/paraphraser/paraphraser',
+                            '--model_files', './build/paraphraser/paraphraser',
+                            '--datatype', 'test',
+                            '--batchsize', '256',
+                            '--display-examples', 'False',
+                            '--fasttext_embeddings_dict', './build/paraphraser/paraphraser.emb',
+                            '--fasttext_model', './build/paraphraser/ft_0.8.3_nltk_yalen_sg_300.bin',
+                            '--bagging-folds-number', '5',
+                            '--chosen-metrics', 'f1'
+                            ] + list(extra_args))
+        self.assertTrue(metrics['f1'] > expected_KPI,
+                        'KPI for paraphraser is not satisfied. \
+                        Got {}, expected more than {}'.format(metrics['f1'], expected_KPI))
+
+    def _run_insults(self, extra_args):
+        """test_insults with extra_args added to its arguments"""
+        expected_KPI = 0.85
+        metrics = bu.model(['-t', 'deeppavlov.tasks.insults.agents:FullTeacher',
+                            '-m', 'deeppavlov.agents.insults.insults_agents:EnsembleInsultsAgent',
+                            '--model_file', './build/insults/insults_ensemble',
+                            '--model_files', './build/insults/cnn_word_0',
+                            './build/insults/cnn_word_1',
+                            './build/insults/cnn_word_2',
+                            '--model_names', 'cnn_word',
+                            'cnn_word', 'cnn_word',
+                            '--model_coefs', '0.3333333',
+                            '0.3333333', '0.3333334',
+                            '--datatype', 'test',
+                            '--batchsize', '64',
+                            '--display-examples', 'False',
+                            '--raw-dataset-path', './build/insults/',
+                            '--max_sequence_length', '100',
+                            '--filters_cnn', '256',
+                            '--kernel_sizes_cnn', '1 2 3',
+                            '--embedding_dim', '100',
+                            '--dense_dim', '100',
+                            '--fasttext_model', './build/insults/reddit_fasttext_model.bin'
+                            ] + list(extra_args))
+        self.assertTrue(metrics['auc'] > expected_KPI,
+                        'KPI for insults is not satisfied. \
+                        Got {}, expected more than {}'.format(metrics['auc'], expected_KPI))
+
+    def _run_squad(self, extra_args):
+        """test_squad with extra_args added to its arguments"""
+        expected_KPI = 0.7
+        metrics = bu.model(['-t', 'squad',
+                            '-m', 'deeppavlov.agents.squad.squad:SquadAgent',
+                            '--batchsize', '64',
+                            '--display-examples', 'False',
+                            '--num-epochs', '-1',
+                            '--log-every-n-secs', '60',
+                            '--log-every-n-epochs', '-1',
+                            '--validation-every-n-secs', '1800',
+                            '--validation-every-n-epochs', '-1',
+                            '--chosen-metrics', 'f1',
+                            '--validation-patience', '5',
+                            '--type', 'fastqa_default',
+                            '--linear_dropout', '0.0',
+                            '--embedding_dropout', '0.5',
+                            '--rnn_dropout', '0.0',
+                            '--recurrent_dropout', '0.0',
+                            '--input_dropout', '0.0',
+                            '--output_dropout', '0.0',
+                            '--context_enc_layers', '1',
+                            '--question_enc_layers', '1',
+                            '--encoder_hidden_dim', '300',
+                            '--projection_dim', '300',
+                            '--pointer_dim', '300',
+                            '--model-file', './build/squad/squad1',
+                            '--embedding_file', './build/squad/glove.840B.300d.txt',
+                            '--pretrained_model', './build/squad/squad1',
+                            '--datatype', 'test'
+                            ] + list(extra_args))
+        self.assertTrue(metrics['f1'] > expected_KPI,
+                        'KPI for SQuAD is not satisfied. \
+                        Got {}, expected more than {}'.format(metrics['f1'], expected_KPI))
+
+    # embeddings kept in reduced precision must not break the KPIs
+    def test_paraphraser_int8(self):
+        self._run_paraphraser(['--fasttext_dtype', 'int8'])
+
+    def test_insults_int8(self):
+        self._run_insults(['--fasttext_dtype', 'int8'])
+
+    def test_insults_serial(self):
+        self._run_insults(['--ensemble_threads', '1'])
+
+    def test_squad_float16(self):
+        self._run_squad(['--embedding_dtype', 'float16'])
+
+    def test_squad_int8(self):
+        self._run_squad(['--embedding_dtype', 'int8'])
+
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,141 @@
+import re
+import string
+import random
+import unittest
+
+from deeppavlov.tasks.insults.normalizer import BAD_WORDS_FILE, load_bad_words, normalize_batch
+
+
+def baseline_preprocessing(f):
+    """data_preprocessing of build.py before it was replaced by TextNormalizer"""
+    f = [x.lower() for x in f]
+    f = [x[1:-1] for x in f]
+    f = [x.replace("\\n", " ") for x in f]
+    f = [x.replace("\\t", " ") for x in f]
+    f = [x.replace("\\xa0", " ") for x in f]
+    f = [x.replace("\\xc2", " ") for x in f]
+
+    f = [re.sub('!!+', ' !! ', x) for x in f]
+    f = [re.sub('!', ' ! ', x) for x in f]
+    f = [re.sub('! !', '!!', x) for x in f]
+
+    f = [re.sub('\?\?+', ' ?? ', x) for x in f]
+    f = [re.sub('\?', ' ? ', x) for x in f]
+    f = [re.sub('\? \?', '??', x) for x in f]
+
+    f = [re.sub('\?!+', ' ?! ', x) for x in f]
+
+    f = [re.sub('\.\.+', '..', x) for x in f]
+    f = [re.sub('\.', ' . ', x) for x in f]
+    f = [re.sub('\.  \.', '..', x) for x in f]
+
+    f = [re.sub(',', ' , ', x) for x in f]
+    f = [re.sub(':', ' : ', x) for x in f]
+    f = [re.sub(';', ' ; ', x) for x in f]
+    f = [re.sub('\%', ' % ', x) for x in f]
+
+    f = [x.replace("$", "s") for x in f]
+    f = [x.replace(" u ", " you ") for x in f]
+    f = [x.replace(" em ", " them ") for x in f]
+    f = [x.replace(" da ", " the ") for x in f]
+    f = [x.replace(" yo ", " you ") for x in f]
+    f = [x.replace(" ur ", " your ") for x in f]
+    f = [x.replace("you\'re", "you are") for x in f]
+    f = [x.replace(" u r ", " you are ") for x in f]
+    f = [x.replace("yo\'re", " you are ") for x in f]
+    f = [x.replace("yu\'re", " you are ") for x in f]
+    f = [x.replace("u\'re", " you are ") for x in f]
+    f = [x.replace(" urs ", " yours ") for x in f]
+    f = [x.replace("y'all", "you all") for x in f]
+
+    f = [x.replace(" r u ", " are you ") for x in f]
+    f = [x.replace(" r you", " are you") for x in f]
+    f = [x.replace(" are u ", " are you ") for x in f]
+
+    f = [x.replace(" mom ", " mother ") for x in f]
+    f = [x.replace(" momm ", " mother ") for x in f]
+    f = [x.replace(" mommy ", " mother ") for x in f]
+    f = [x.replace(" momma ", " mother ") for x in f]
+    f = [x.replace(" mama ", " mother ") for x in f]
+    f = [x.replace(" mamma ", " mother ") for x in f]
+    f = [x.replace(" mum ", " mother ") for x in f]
+    f = [x.replace(" mummy ", " mother ") for x in f]
+
+    f = [x.replace("won't", "will not") for x in f]
+    f = [x.replace("can't", "cannot") for x in f]
+    f = [x.replace("i'm", "i am") for x in f]
+    f = [x.replace(" im ", " i am ") for x in f]
+    f = [x.replace("ain't", "is not") for x in f]
+    f = [x.replace("'ll", " will") for x in f]
+    f = [x.replace("'t", " not") for x in f]
+    f = [x.replace("'ve", " have") for x in f]
+    f = [x.replace("'s", " is") for x in f]
+    f = [x.replace("'re", " are") for x in f]
+    f = [x.replace("'d", " would") for x in f]
+
+    # replace multiple letters (3 and more) by 2 letters
+    for letter in string.ascii_lowercase:
+        f = [re.sub(letter * 3 + '+', letter, x).strip() for x in f]
+
+    bad_words_file = open(BAD_WORDS_FILE, "r")
+    bwMap = dict()
+    for line in bad_words_file:
+        sp = line.strip().lower().split(",")
+        if len(sp) == 2:
+            bwMap[sp[0].strip()] = sp[1].strip()
+
+    for key, value in bwMap.items():
+        kpad = " " + key + " "
+        vpad = " " + value + " "
+        f = [x.replace(kpad, vpad) for x in f]
+
+    # stemming
+    f = [re.sub("ies( |$)", "y ", x) for x in f]
+    f = [re.sub("s( |$)", " ", x) for x in f]
+    f = [re.sub("ing( |$)", " ", x) for x in f]
+    f = [x.replace("tard ", " ") for x in f]
+
+    f = [re.sub(" [*$%&#@][*$%&#@]+", " xexp ", x) for x in f]
+    f = [re.sub(" [0-9]+ ", " DD ", x) for x in f]
+    f = [re.sub("<\S*>", "", x) for x in f]
+    f = [re.sub('\s+', ' ', x) for x in f]
+    return f
+
+
+class TestTextNormalizer(unittest.TestCase):
+    """Normalized comments are identical to those of the original preprocessing"""
+
+    samples = [
+        '"You are such an IDIOT!!! u r sooo dumb..."',
+        '"Go back to ur mommy,you loser?!?? lol"',
+        "\"\\xa0\\xc2I'm not saying it's true; ur mom is 100% a f*@#ing moron!!!!\"",
+        "\"What???  Y'all won't believe it . . . she's sooooo stupidddd\"",
+        '"<b>shut up</b> you retarded idiots,i hate liars and cheaters :: 42 times"',
+        '"r u kidding me? are u ok?\\nyo\\tda best"',
+        '""',
+        '"!"',
+    ]
+
+    def random_samples(self, n=300, seed=0):
+        """Comments mixing bad words, the replaced words and punctuation"""
+        rng = random.Random(seed)
+        bad_words = sorted(load_bad_words())
+        words = bad_words + ['u', 'r', 'ur', 'mom', 'im', 'da', 'you', 'are', 'stupid', 'idiots', 'playing',
+                             'ladies', 'tard', 'xxx', '$$', '**', '123', 'aaaargh', "can't", "you're", "it's"]
+        puncts = ['', '', '', '!', '!!!', '?', '???', '?!', '.', '...', ',', ':', ';', '%', '\\n']
+        samples = []
+        for _ in range(n):
+            tokens = [rng.choice(words) + rng.choice(puncts) for _ in range(rng.randint(1, 15))]
+            samples.append('"%s"' % ' '.join(tokens))
+        return samples
+
+    def test_samples(self):
+        self.assertEqual(normalize_batch(self.samples), baseline_preprocessing(self.samples))
+
+    def test_random_samples(self):
+        samples = self.random_samples()
+        self.assertEqual(normalize_batch(samples), baseline_preprocessing(samples))
+
+
+if __name__ == '__main__':
+    unittest.main()
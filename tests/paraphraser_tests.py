@@ -0,0 +1,60 @@
+import unittest
+import numpy as np
+
+
+class FoldModel(object):
+    """Stands in for a ParaphraserModel: a small Keras model on two embedded sentences"""
+
+    def __init__(self, seed, embedding_dim=8, max_sequence_length=6):
+        from keras.layers import Input, Dense, GlobalAveragePooling1D, concatenate
+        from keras.models import Model
+        from keras.initializers import glorot_uniform
+
+        self.embedding_dim = embedding_dim
+        self.max_sequence_length = max_sequence_length
+        input_a = Input(shape=(None, embedding_dim,))
+        input_b = Input(shape=(None, embedding_dim,))
+        merged = concatenate([GlobalAveragePooling1D()(input_a), GlobalAveragePooling1D()(input_b)])
+        dense = Dense(4, activation='relu', kernel_initializer=glorot_uniform(seed=seed))(merged)
+        dense = Dense(1, activation='sigmoid', kernel_initializer=glorot_uniform(seed=seed + 1))(dense)
+        self.model = Model([input_a, input_b], dense)
+
+    def predict(self, batch):
+        return self.model.predict_on_batch(batch)
+
+
+class TestFusedEnsemble(unittest.TestCase):
+    """The fused ensemble predicts the mean of the predictions of the folds"""
+
+    def setUp(self):
+        self.models = [FoldModel(seed) for seed in range(0, 10, 2)]
+        rng = np.random.RandomState(0)
+        self.batch = [rng.uniform(-1, 1, (16, 6, 8)).astype('float32') for _ in range(2)]
+
+    def test_mean_of_folds(self):
+        from deeppavlov.agents.paraphraser.model import can_fuse, fuse_models
+
+        self.assertTrue(can_fuse(self.models))
+        fused = fuse_models(self.models)
+        expected = np.mean([model.predict(self.batch) for model in self.models], axis=0)
+        predictions = fused.predict_on_batch(self.batch)
+        self.assertEqual(predictions.shape, expected.shape)
+        np.testing.assert_allclose(predictions, expected, rtol=1e-5, atol=1e-6)
+        # the folds do not predict alike, so the mean is not one of them
+        self.assertGreater(np.max(np.abs(self.models[0].predict(self.batch) - expected)), 1e-3)
+
+    def test_benchmark_difference(self):
+        from deeppavlov.agents.paraphraser.benchmark import benchmark
+
+        results = benchmark(self.models, batch_sizes=(1, 4), repeats=1)
+        self.assertEqual([result[0] for result in results], [1, 4])
+        self.assertTrue(all(result[3] < 1e-5 for result in results))
+
+    def test_different_inputs_not_fused(self):
+        from deeppavlov.agents.paraphraser.model import can_fuse
+
+        self.assertFalse(can_fuse(self.models + [FoldModel(10, max_sequence_length=7)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import time
+import threading
+import unittest
+import numpy as np
+
+from deeppavlov.utils.batch_pipeline import BatchPipeline
+from fasttext_stub import FasttextStubTestCase
+
+
+class TestBatchPipeline(unittest.TestCase):
+    """The model is not used by the agent while the worker trains it"""
+
+    def test_call_waits_for_update(self):
+        busy = threading.Event()
+        consumed = []
+        overlaps = []
+
+        def consume(batch):
+            busy.set()
+            time.sleep(0.01)
+            consumed.append(batch)
+            busy.clear()
+
+        def predict(batch):
+            overlaps.append(busy.is_set())
+            return batch
+
+        pipeline = BatchPipeline(consume, depth=2)
+        for i in range(10):
+            self.assertEqual(pipeline.call(predict, i), i)
+            pipeline.put(i)
+        pipeline.join()
+        pipeline.close()
+        self.assertEqual(consumed, list(range(10)))
+        self.assertFalse(any(overlaps))
+
+
+class TestInsultsPipeline(FasttextStubTestCase):
+    """Insults training with batches prepared while the model trains"""
+
+    dim = 10
+
+    def test_train_with_prefetch(self):
+        from parlai.core.params import ParlaiParser
+        from deeppavlov.agents.insults.insults_agents import InsultsAgent
+
+        parser = ParlaiParser()
+        InsultsAgent.add_cmdline_args(parser)
+        opt = parser.parse_args(args=['--model_name', 'cnn_word', '--fasttext_model', self.model_file,
+                                      '--embedding_dim', '10', '--filters_cnn', '4', '--dense_dim', '4',
+                                      '--kernel_sizes_cnn', '1 2', '--max_sequence_length', '10',
+                                      '--prefetch_depth', '2'])
+        agent = InsultsAgent(opt)
+        rng = np.random.RandomState(0)
+        for _ in range(5):
+            observations = [{'text': ' '.join('w%d' % w for w in rng.randint(0, 50, 6)),
+                             'labels': ['Insult' if rng.rand() > 0.5 else 'Non-insult'],
+                             'episode_done': True} for _ in range(8)]
+            replies = agent.batch_act(observations)
+            self.assertEqual(len(replies), 8)
+            self.assertTrue(all(reply['text'] in ('Insult', 'Non-insult') for reply in replies))
+        report = agent.report()
+        self.assertEqual(report['updates'], 5)
+        self.assertEqual(report['n_examples'], 40)
+        agent.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
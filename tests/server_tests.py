@@ -0,0 +1,86 @@
+import json
+import asyncio
+import unittest
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+from deeppavlov.utils.server import MicroBatcher, InferenceServer
+
+
+class TestInferenceServer(unittest.TestCase):
+    """Tests of the micro-batching inference server with a stub agent"""
+
+    max_batch_size = 8
+
+    def batch_act(self, observations):
+        self.batch_sizes.append(len(observations))
+        for obs in observations:
+            if obs['text'] == 'fail':
+                raise ValueError('cannot act')
+        return [{'id': 'echo', 'text': obs['text'].upper(), 'labels_seen': 'labels' in obs}
+                for obs in observations]
+
+    def setUp(self):
+        self.batch_sizes = []
+        self.loop = asyncio.new_event_loop()
+        batcher = MicroBatcher(self.batch_act, self.max_batch_size, max_wait=0.05)
+        self.server = InferenceServer(batcher, '127.0.0.1', 0)
+        self.loop.run_until_complete(self.server.start())
+        self.thread = threading.Thread(target=self.loop.run_forever)
+        self.thread.start()
+
+    def tearDown(self):
+        asyncio.run_coroutine_threadsafe(self.server.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
+
+    def request(self, method, path, body=None):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.port, timeout=10)
+        try:
+            connection.request(method, path, body=json.dumps(body) if body is not None else None)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read().decode('utf-8'))
+        finally:
+            connection.close()
+
+    def test_concurrent_requests_are_batched(self):
+        texts = ['text %d' % i for i in range(40)]
+        with ThreadPoolExecutor(len(texts)) as executor:
+            responses = list(executor.map(
+                lambda text: self.request('POST', '/act', {'text': text, 'labels': ['x']}), texts))
+
+        for text, (status, reply) in zip(texts, responses):
+            self.assertEqual(status, 200)
+            self.assertEqual(reply['text'], text.upper())
+            self.assertFalse(reply['labels_seen'])
+        self.assertEqual(sum(self.batch_sizes), len(texts))
+        self.assertLess(len(self.batch_sizes), len(texts))
+        self.assertLessEqual(max(self.batch_sizes), self.max_batch_size)
+
+        status, stats = self.request('GET', '/stats')
+        self.assertEqual(status, 200)
+        self.assertEqual(stats['requests'], len(texts))
+        self.assertEqual(stats['batches'], len(self.batch_sizes))
+
+    def test_keep_alive(self):
+        connection = http.client.HTTPConnection('127.0.0.1', self.server.port, timeout=10)
+        try:
+            for text in ('a', 'b'):
+                connection.request('POST', '/act', body=json.dumps({'text': text}))
+                response = connection.getresponse()
+                self.assertEqual(json.loads(response.read().decode('utf-8'))['text'], text.upper())
+        finally:
+            connection.close()
+
+    def test_errors(self):
+        status, reply = self.request('POST', '/act', {'text': 'fail'})
+        self.assertEqual(status, 500)
+        self.assertIn('cannot act', reply['error'])
+        self.assertEqual(self.request('POST', '/act', 'not an observation')[0], 400)
+        self.assertEqual(self.request('GET', '/unknown')[0], 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import os
+import csv
+import shutil
+import tempfile
+import unittest
+
+from deeppavlov.utils.compact_data import CompactDialogData
+
+
+def _table(table):
+    """Action table with the label candidates as a sorted list, to compare sets with"""
+    table = dict(table)
+    for key in ('labels', 'label_candidates'):
+        if key in table:
+            table[key] = sorted(table[key])
+    return table
+
+
+class TestCompactDialogData(unittest.TestCase):
+    """CompactDialogData gives the examples ParlAI's DialogData does"""
+
+    def setUp(self):
+        self.examples = [('comment %d' % i, ['Insult' if i % 3 == 0 else 'Non-insult']) for i in range(20)]
+        self.examples.append(('unlabeled comment', None))
+
+    def loader(self):
+        for text, labels in self.examples:
+            yield (text, labels), True
+
+    def test_get(self):
+        from parlai.core.dialog_teacher import DialogData
+
+        cands = ['Non-insult', 'Insult']
+        data = DialogData({}, self.loader(), cands=cands)
+        compact = CompactDialogData(self.loader(), cands=cands)
+        self.assertEqual(compact.num_episodes(), data.num_episodes())
+        self.assertEqual(compact.num_examples(), data.num_examples())
+        for i in range(data.num_episodes()):
+            table, end = data.get(i)
+            compact_table, compact_end = compact.get(i)
+            self.assertEqual(_table(compact_table), _table(table))
+            self.assertEqual(compact_end, end)
+
+    def test_label_outside_candidates(self):
+        compact = CompactDialogData(self.loader(), cands=['Non-insult'])
+        table, _ = compact.get(0)
+        self.assertEqual(table['label_candidates'], {'Non-insult', 'Insult'})
+        self.assertEqual(compact.cands, {'Non-insult'})
+
+    def test_share(self):
+        compact = CompactDialogData(self.loader(), cands=['Non-insult', 'Insult'])
+        compact.shuffle(0)
+        copy = CompactDialogData(shared=compact.share())
+        self.assertEqual([copy.get(i) for i in range(len(copy))],
+                         [compact.get(i) for i in range(len(compact))])
+
+
+class TestCompactTeacher(unittest.TestCase):
+    """An epoch of the insults teacher is the same with and without --compact-data"""
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        dpath = os.path.join(self.dir, 'insults')
+        os.makedirs(dpath)
+        with open(os.path.join(dpath, 'train.csv'), 'w') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Insult', 'Comment'])
+            for i in range(50):
+                writer.writerow([int(i % 4 == 0), 'comment number %d' % i])
+        from parlai.core.build_data import mark_done
+        mark_done(dpath, version_string='1.0')
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def epoch(self, compact):
+        from parlai.core.params import ParlaiParser
+        from deeppavlov.tasks.insults.agents import DefaultTeacher
+
+        parser = ParlaiParser()
+        DefaultTeacher.add_cmdline_args(parser)
+        opt = parser.parse_args(args=['--datapath', self.dir, '--datatype', 'valid',
+                                      '--bagging-fold-index', '0', '--compact-data', str(compact)])
+        teacher = DefaultTeacher(opt)
+        self.assertEqual(isinstance(teacher.data, CompactDialogData), compact)
+        return [_table(teacher.act()) for _ in range(teacher.data.num_examples())]
+
+    def test_epoch(self):
+        stock = self.epoch(False)
+        compact = self.epoch(True)
+        self.assertEqual(len(compact), len(stock))
+        # the datasets are shuffled differently, so the examples are compared in the same order
+        key = lambda table: table['text']
+        self.assertEqual(sorted(compact, key=key), sorted(stock, key=key))
+
+
+if __name__ == '__main__':
+    unittest.main()
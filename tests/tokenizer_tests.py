@@ -0,0 +1,50 @@
+import csv
+import unittest
+
+
+class TestRegexTokenizer(unittest.TestCase):
+    """The regex tokenizer gives the tokens of NLTK punkt and treebank tokenization"""
+
+    def setUp(self):
+        import nltk
+        nltk.download('punkt')
+
+    def corpus(self):
+        """Sentences of the train and test parts of the paraphrase corpus"""
+        from parlai.core.params import ParlaiParser
+        from deeppavlov.tasks.paraphrases.agents import _path
+
+        sentences = []
+        for datatype in ('train', 'test'):
+            opt = ParlaiParser().parse_args(args=['--datatype', datatype])
+            with open(_path(opt)) as f:
+                for row in csv.reader(f, delimiter='\t'):
+                    if len(row) == 3:
+                        sentences.extend(row[1:])
+        return sentences
+
+    def test_paraphrase_corpus(self):
+        from deeppavlov.agents.paraphraser.tokenizer import compare_tokenizers
+
+        sentences = self.corpus()
+        self.assertGreater(len(sentences), 0)
+        diffs = compare_tokenizers(sentences)
+        self.assertEqual(diffs[:10], [], '%d of %d sentences are tokenized differently' %
+                         (len(diffs), len(sentences)))
+
+    def test_memo(self):
+        from deeppavlov.agents.paraphraser.tokenizer import Tokenizer
+
+        tokenizer = Tokenizer('regex', cache_size=2)
+        for sen in ['Мама мыла раму.', 'Он сказал: "Да."', 'Мама мыла раму.', 'Т. е. нет', 'Ок!']:
+            tokenizer.tokenize(sen)
+        self.assertEqual(tokenizer.stats(), {'tokenizer_cache_size': 2, 'tokenizer_cache_hits': 1,
+                                             'tokenizer_cache_misses': 4})
+        tokenizer = Tokenizer('regex', cache_size=0)
+        tokenizer.tokenize('Мама мыла раму.')
+        tokenizer.tokenize('Мама мыла раму.')
+        self.assertEqual(tokenizer.stats()['tokenizer_cache_misses'], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()